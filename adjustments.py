@@ -0,0 +1,412 @@
+"""
+Corporate-action adjustment factors and adjusted price series.
+
+Raw bhavcopy closes halve on a 1:2 split or a 1:1 bonus, which breaks
+anything computed over a window of them (SMAs, 52-week highs). NSE already
+adjusts PrvsClsgPric on the ex-date, so a session whose PrvsClsgPric differs
+from the instrument's last ClsPric marks an action, and the ratio is its
+factor:
+
+    factor = PrvsClsgPric on the ex-date / ClsPric of the previous session
+
+Prices before an ex-date are multiplied by the product of every later
+factor, volumes divided by it. Detection only accepts ratios at least 3%
+away from 1 that snap to a simple fraction (p/q, q <= 20), so rights issues
+and bad prints are left alone; corporate_actions.csv adds or overrides
+actions by hand, and a factor of 1 cancels a detection:
+
+    isin,ex_date,factor,note
+    INE002A01018,20241028,0.5,1:1 bonus
+
+Factors are kept per ISIN in store/adjustments.json, with every
+instrument's last close in store/adjustments.npy so update() only scans new
+days. Each ISIN records the version at which its actions last changed:
+adjusted series are built lazily and cached per ISIN, and apply_to() reseeds
+only the IndicatorEngine symbols whose factors changed since it last synced.
+
+    python adjustments.py                       # scan new days, list actions
+    python adjustments.py RELIANCE --last 10    # adjusted next to raw closes
+"""
+
+import csv
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from bhavcopy_store import STORE_DIR, History
+
+ACTIONS_CSV = Path(__file__).resolve().parent / "corporate_actions.csv"
+STATE_FILE = "adjustments.json"
+CLOSES_FILE = "adjustments.npy"
+
+# Equity series an ISIN moves between; T0 and block-deal rows would repeat a session
+DETECT_SERIES = ("EQ", "BE", "BZ", "SM", "ST")
+MIN_MOVE = 0.03
+# A reissued ISIN starts trading within this many sessions of the old one's last
+LINK_SESSIONS = 10
+MAX_DENOMINATOR = 20
+TICK = 0.05
+
+ADJUSTED_PRICES = ("OpnPric", "HghPric", "LwPric", "ClsPric", "LastPric", "PrvsClsgPric", "SttlmPric")
+ADJUSTED_VOLUMES = ("TtlTradgVol",)
+
+
+def snap_factor(prev_close, last_close):
+    """The simple fraction PrvsClsgPric / last ClsPric rounds to, or None."""
+    from fractions import Fraction
+
+    ratio = prev_close / last_close
+    if abs(ratio - 1) < MIN_MOVE:
+        return None
+    snapped = float(Fraction(ratio).limit_denominator(MAX_DENOMINATOR))
+    # Both prices are rounded to the tick, so allow a tick of slack on cheap stocks
+    if snapped <= 0 or abs(snapped * last_close - prev_close) > max(prev_close * 0.005, TICK):
+        return None
+    return snapped
+
+
+def load_actions(path=ACTIONS_CSV):
+    """{isin: {ex_date: factor}} from the hand-kept actions file; empty when there is none."""
+    path = Path(path)
+    actions = {}
+    if not path.exists():
+        return actions
+    with open(path, newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                isin, ex_date, factor = row["isin"].strip(), int(row["ex_date"]), float(row["factor"])
+            except (AttributeError, KeyError, TypeError, ValueError):
+                raise ValueError(f"{path}:{line}: expected isin,ex_date,factor")
+            if factor <= 0:
+                raise ValueError(f"{path}:{line}: factor must be positive")
+            actions.setdefault(isin, {})[ex_date] = factor
+    return actions
+
+
+def _decode(actions):
+    return {isin: {int(day): factor for day, factor in items} for isin, items in actions.items()}
+
+
+def _encode(actions):
+    return {isin: sorted(items.items()) for isin, items in actions.items() if items}
+
+
+class Adjustments:
+    def __init__(self, store_dir=STORE_DIR, actions_csv=ACTIONS_CSV, index=None, load=True):
+        self.store_dir = Path(store_dir)
+        self.actions_csv = Path(actions_csv)
+        self.index = index
+        self.dates = []
+        self.version = 0
+        self.versions = {}
+        self.detected = {}
+        self.manual = {}
+        self.predecessor = {}
+        self.tails = {}
+        self.last_close = np.empty(0)
+        self._factors = {}
+        self._series = {}
+
+        state_path = self.store_dir / STATE_FILE
+        closes_path = self.store_dir / CLOSES_FILE
+        if load and state_path.exists() and closes_path.exists():
+            with open(state_path) as f:
+                state = json.load(f)
+            self.dates = state["dates"]
+            self.version = state["version"]
+            self.versions = state["versions"]
+            self.detected = _decode(state["detected"])
+            self.manual = _decode(state["manual"])
+            self.predecessor = state.get("predecessor", {})
+            self.tails = state.get("tails", {})
+            self.last_close = np.load(closes_path)
+
+    def isins(self):
+        """ISINs with at least one action, detected or manual."""
+        return {isin for isin in self._tracked() if self.actions(isin)}
+
+    def chain(self, isin):
+        """[isin, the ISIN it replaced, ...], newest first."""
+        chain = [isin]
+        while self.predecessor.get(chain[-1]) not in (None, *chain):
+            chain.append(self.predecessor[chain[-1]])
+        return chain
+
+    def actions(self, isin):
+        """[(ex_date, factor), ...] for an ISIN and those it replaced, oldest first; manual entries win."""
+        chain = self.chain(isin)[::-1]
+        merged = {}
+        for actions in (self.detected, self.manual):
+            for member in chain:
+                merged.update(actions.get(member, {}))
+        return sorted((day, factor) for day, factor in merged.items() if factor != 1.0)
+
+    def _tracked(self):
+        return {*self.detected, *self.manual, *self.predecessor}
+
+    def _state(self, isin):
+        return self.chain(isin), self.actions(isin)
+
+    def update(self, history=None):
+        """Scan days added since the last update and re-read the actions file.
+
+        Returns the ISINs whose actions changed; only their cached factors and
+        series are dropped.
+        """
+        history = history if history is not None else History(self.store_dir)
+        before = {isin: self._state(isin) for isin in self._tracked()}
+        dates = history.dates.tolist()
+        if dates[:len(self.dates)] != self.dates:
+            # History was rebuilt and row numbers moved; scan it all again
+            self.dates, self.detected, self.predecessor, self.tails = [], {}, {}, {}
+            self.last_close = np.empty(0)
+        scanned = len(dates) > len(self.dates)
+        if scanned:
+            self._detect(history, int(history.offsets[len(self.dates)]))
+            self.dates = dates
+        self.manual = load_actions(self.actions_csv)
+
+        changed = sorted(isin for isin in self._tracked() | set(before)
+                         if self._state(isin) != before.get(isin, ([isin], [])))
+        if changed:
+            self.version += 1
+            for isin in changed:
+                self.versions[isin] = self.version
+                self._factors.pop(isin, None)
+            stale = set(changed)
+            self._series = {key: value for key, value in self._series.items() if key[0] not in stale}
+        if scanned or changed:
+            self.save()
+        return changed
+
+    def _detect(self, history, start):
+        n_isin = len(history.dicts["ISIN"])
+        if len(self.last_close) < n_isin:
+            self.last_close = np.concatenate([self.last_close,
+                                              np.full(n_isin - len(self.last_close), np.nan)])
+        series = [history.code("SctySrs", s) for s in DETECT_SERIES]
+        close = np.asarray(history.column("ClsPric")[start:])
+        keep = np.isin(history.column("SctySrs")[start:], series) & ~np.isnan(close)
+        rows = np.flatnonzero(keep)
+        isin = np.asarray(history.column("ISIN")[start:])[keep]
+        close = close[keep]
+        prev = np.asarray(history.column("PrvsClsgPric")[start:])[keep]
+
+        # Rows are in date order, so a stable sort by ISIN lines up each
+        # instrument's sessions and the row before is its previous session
+        order = np.argsort(isin, kind="stable")
+        rows, isin, close, prev = rows[order], isin[order], close[order], prev[order]
+        first = np.ones(len(isin), dtype=bool)
+        first[1:] = isin[1:] != isin[:-1]
+        last_close = np.empty(len(isin))
+        last_close[1:] = close[:-1]
+        last_close[first] = self.last_close[isin[first]]
+        self._link(history, start, keep, order, rows, isin, close, first, last_close)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            move = np.abs(prev / last_close - 1)
+        candidates = np.flatnonzero((move >= MIN_MOVE) & (last_close > 0) & (prev > 0))
+        names, trade_dates = history.dicts["ISIN"], history.column("TradDt")
+        for i in candidates.tolist():
+            factor = snap_factor(float(prev[i]), float(last_close[i]))
+            if factor is not None:
+                day = int(trade_dates[start + rows[i]])
+                self.detected.setdefault(names[isin[i]], {})[day] = factor
+
+        last = np.ones(len(isin), dtype=bool)
+        last[:-1] = first[1:]
+        self.last_close[isin[last]] = close[last]
+
+    def _link(self, history, start, keep, order, rows, isin, close, first, last_close):
+        """Chain ISINs seen for the first time to the one their ticker and series last traded under.
+
+        Fills last_close for the new ISIN's first session with the old ISIN's
+        close so the split shows up as an ordinary PrvsClsgPric move.
+        """
+        ticker = np.asarray(history.column("TckrSymb")[start:])[keep][order]
+        series = np.asarray(history.column("SctySrs")[start:])[keep][order]
+        trade_dates = np.asarray(history.column("TradDt")[start:])[rows]
+        key = ticker.astype(np.int64) << 32 | series.astype(np.int64)
+        # Sessions of each (ticker, series) in date order; `before` is the previous one
+        by_key = np.lexsort((rows, key))
+        same = key[by_key[1:]] == key[by_key[:-1]]
+        before = np.full(len(key), -1)
+        before[by_key[1:][same]] = by_key[:-1][same]
+
+        names, tickers, serieses = history.dicts["ISIN"], history.dicts["TckrSymb"], history.dicts["SctySrs"]
+        session = {day: i for i, day in enumerate(history.dates.tolist())}
+        for i in np.flatnonzero(first & np.isnan(last_close)).tolist():
+            j = int(before[i])
+            if j >= 0:
+                old, old_close, old_day = int(isin[j]), float(close[j]), int(trade_dates[j])
+            else:
+                tail = self.tails.get(serieses[series[i]], {}).get(tickers[ticker[i]])
+                if tail is None:
+                    continue
+                old, old_day = history.code("ISIN", tail[0]), tail[1]
+                old_close = float(self.last_close[old]) if old >= 0 else np.nan
+            day = int(trade_dates[i])
+            if (old == isin[i] or np.isnan(old_close) or old_day not in session
+                    or not 0 < session[day] - session[old_day] <= LINK_SESSIONS):
+                continue
+            self.predecessor[names[isin[i]]] = names[old]
+            last_close[i] = old_close
+
+        tail = np.ones(len(key), dtype=bool)
+        tail[by_key[:-1]] = ~same
+        for i in np.flatnonzero(tail).tolist():
+            self.tails.setdefault(serieses[series[i]], {})[tickers[ticker[i]]] = [names[isin[i]], int(trade_dates[i])]
+
+    def save(self):
+        state_path = self.store_dir / STATE_FILE
+        tmp = state_path.with_name(STATE_FILE + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, self.last_close)
+        os.replace(tmp, self.store_dir / CLOSES_FILE)
+        with open(tmp, "w") as f:
+            json.dump({"dates": self.dates, "version": self.version, "versions": self.versions,
+                       "detected": _encode(self.detected), "manual": _encode(self.manual),
+                       "predecessor": self.predecessor, "tails": self.tails}, f)
+        os.replace(tmp, state_path)
+
+    def factors(self, isin):
+        """(ex_dates, cumulative): rows dated before ex_dates[k] scale by cumulative[k]."""
+        if isin not in self._factors:
+            actions = self.actions(isin)
+            ex_dates = np.array([day for day, _ in actions], dtype=np.int64)
+            factors = np.array([factor for _, factor in actions])
+            self._factors[isin] = ex_dates, np.cumprod(factors[::-1])[::-1]
+        return self._factors[isin]
+
+    def multipliers(self, isin, dates):
+        """Price multiplier for each of `dates`; 1 from the last ex-date on."""
+        ex_dates, cumulative = self.factors(isin)
+        return np.append(cumulative, 1.0)[np.searchsorted(ex_dates, dates, side="right")]
+
+    def adjust(self, isin, column, dates, values):
+        """`values` of `column` on `dates` restated on the ISIN's current share basis."""
+        if column in ADJUSTED_PRICES:
+            return values * self.multipliers(isin, dates)
+        if column in ADJUSTED_VOLUMES:
+            return values / self.multipliers(isin, dates)
+        return values
+
+    def _index(self):
+        if self.index is None:
+            from symbol_index import load_index
+            self.index = load_index(self.store_dir)
+        elif self.index.dates[-1:] != self.dates[-1:]:
+            self.index.update()
+        return self.index
+
+    def _rows(self, isin, series, end=None):
+        """History rows of an ISIN and the ISINs it replaced, in date order."""
+        index = self._index()
+        trade_dates = index.history.column("TradDt")
+        parts, until = [], None
+        for member in self.chain(isin):
+            try:
+                rows = index.symbol_rows(member, series=series, end=end)
+            except KeyError:
+                continue
+            if until is not None:
+                rows = rows[trade_dates[rows] < until]
+            if len(rows):
+                parts.append(rows)
+                until = trade_dates[rows[0]]
+        return np.concatenate(parts[::-1]) if parts else np.empty(0, dtype=np.int64)
+
+    def adjusted(self, symbol, column="ClsPric", series="EQ", last=None):
+        """(dates, values) of one instrument's column, adjusted for its actions.
+
+        Sessions of the ISINs it replaced come first. Cached per (ISIN, column, series); while the ISIN's actions are
+        unchanged a newer history only appends its new sessions.
+        """
+        index = self._index()
+        code = index.isin(symbol, series)
+        if code < 0:
+            raise KeyError(symbol)
+        isin = index.history.dicts["ISIN"][code]
+        key = (isin, column, series if isinstance(series, str) or series is None else tuple(series))
+        version = self.versions.get(isin, 0)
+        covered = len(index.dates)
+        cached = self._series.get(key)
+        if (cached is None or cached[0] != version or cached[1] > covered
+                or (cached[1] and index.dates[cached[1] - 1] != cached[2])):
+            rows = self._rows(isin, series)
+            dates = np.asarray(index.history.column("TradDt")[rows])
+            values = self.adjust(isin, column, dates, np.asarray(index.history.column(column)[rows]))
+        elif cached[1] < covered:
+            dates, values = index.series(isin, column, series=series, start=cached[2] + 1)
+            dates = np.concatenate([cached[3], dates])
+            values = np.concatenate([cached[4], self.adjust(isin, column, dates[len(cached[3]):], values)])
+        else:
+            dates, values = cached[3], cached[4]
+        self._series[key] = (version, covered, index.dates[-1] if covered else 0, dates, values)
+        if last is not None:
+            dates, values = (dates[-last:], values[-last:]) if last else (dates[:0], values[:0])
+        return dates, values
+
+    def apply_to(self, engine, series="EQ"):
+        """Reseed the engine symbols whose actions changed since it last synced.
+
+        The engine must already have applied the history. Each affected
+        instrument is replayed from its adjusted closes under the ticker it
+        trades as now; returns how many symbols were reseeded.
+        """
+        # A replaced ISIN's sessions are replayed with its successor's
+        replaced = set(self.predecessor.values())
+        changed = [isin for isin, version in self.versions.items()
+                   if version > engine.adjusted_version and isin not in replaced]
+        reseed = {}
+        if changed and engine.dates:
+            index = self._index()
+            history = index.history
+            engine_dates = np.asarray(engine.dates, dtype=np.int64)
+            for isin in changed:
+                rows = self._rows(isin, series, end=engine.dates[-1])
+                if not len(rows):
+                    continue
+                tickers = np.asarray(history.column("TckrSymb")[rows])
+                rows = rows[tickers == tickers[-1]]
+                days = np.asarray(history.column("TradDt")[rows])
+                closes = self.adjust(isin, "ClsPric", days, np.asarray(history.column("ClsPric")[rows]))
+                column = np.full(len(engine_dates), np.nan)
+                column[np.searchsorted(engine_dates, days)] = closes
+                reseed[int(tickers[-1])] = column
+        if reseed:
+            engine.reseed(list(reseed), np.column_stack(list(reseed.values())))
+        engine.adjusted_version = self.version
+        return len(reseed)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Corporate-action factors and adjusted series")
+    parser.add_argument("symbol", nargs="?", help="ticker or ISIN to print adjusted closes for")
+    parser.add_argument("--column", default="ClsPric")
+    parser.add_argument("--last", type=int, default=20)
+    parser.add_argument("--store", default=STORE_DIR, type=Path)
+    parser.add_argument("--actions", default=ACTIONS_CSV, type=Path)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    adjustments = Adjustments(args.store, args.actions)
+    changed = adjustments.update()
+    print(f"✅ {len(adjustments.isins())} instruments with actions, {len(changed)} changed "
+          f"({(time.perf_counter() - start) * 1000:.1f}ms)")
+    if args.symbol:
+        index = adjustments._index()
+        raw = index.series(args.symbol, args.column, last=args.last)[1]
+        dates, values = adjustments.adjusted(args.symbol, args.column, last=args.last)
+        isin = index.history.dicts["ISIN"][index.isin(args.symbol)]
+        print(f"📅 {args.symbol} ({isin}): {adjustments.actions(isin)}")
+        for day, value, original in zip(dates.tolist(), values.tolist(), raw.tolist()):
+            print(f"{day}  {value:>12.2f}  {original:>12.2f}")
+    else:
+        for isin in sorted(adjustments.isins()):
+            print(f"{isin}  {adjustments.actions(isin)}")
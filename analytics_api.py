@@ -0,0 +1,438 @@
+"""
+Flask blueprint serving analytics from the columnar store.
+
+Register `bp` on the main service app, or run this module for a standalone
+server:
+
+    python analytics_api.py --port 5000
+"""
+
+import threading
+from datetime import datetime
+
+from flask import Blueprint, Flask, Response, jsonify, request, stream_with_context
+
+from adjustments import Adjustments
+from bhavcopy import BHAVCOPY_DIR
+from bhavcopy_store import DTYPES, STORE_DIR, History, history_stamp, ingest_all
+from db import get_database, unavailable_errors
+from fno import OptionChains
+from indicators import IndicatorEngine
+from instrumentation import render_prometheus
+from jobs import default_scheduler, sse_format
+from response_cache import ResponseCache
+from screener import Screener, validate
+from snapshot import LatestPrices, load_snapshot
+from symbol_index import SymbolIndex
+
+bp = Blueprint("analytics", __name__)
+
+cache = ResponseCache()
+scheduler = default_scheduler()
+
+
+class AnalyticsState:
+    """In-memory history view and indicator engine, refreshed per store version.
+
+    The first refresh starts from store/snapshot.bin when there is one, so
+    only days newer than the snapshot are replayed. Corporate actions found
+    since then reseed just the affected symbols. A history rewritten without
+    new days (a republished bhavcopy) drops the derived state and rebuilds it.
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.lock = threading.Lock()
+        self.engine = IndicatorEngine()
+        self.index = SymbolIndex(store_dir, load=False)
+        self.adjustments = Adjustments(store_dir)
+        self.latest = None
+        self.screener = None
+        self.history = None
+        self.version = None
+        self.history_stamp = None
+        self.warm_started = False
+
+    def _warm_start(self):
+        snapshot = load_snapshot(self.store_dir)
+        try:
+            if snapshot is not None:
+                self.engine, self.index = snapshot.engine(), snapshot.index(self.store_dir)
+                self.latest = snapshot.latest()
+                self.warm_started = True
+                return
+        except (KeyError, ValueError):
+            # Written by an incompatible version; fall back to a full replay
+            self.engine = IndicatorEngine()
+        self.index = SymbolIndex(self.store_dir)
+
+    def _reset(self):
+        self.engine = IndicatorEngine()
+        self.index = SymbolIndex(self.store_dir, load=False)
+        self.adjustments = Adjustments(self.store_dir, load=False)
+        self.latest = None
+
+    def current(self, version):
+        with self.lock:
+            if self.history is None or version != self.version:
+                stamp = history_stamp(self.store_dir)
+                if self.history is None:
+                    self._warm_start()
+                elif stamp != self.history_stamp:
+                    history = History(self.store_dir)
+                    if history.dates.tolist() == self.history.dates.tolist():
+                        # Same days, new content: row numbers and closes may all have moved
+                        self._reset()
+                self.history = History(self.store_dir)
+                self.history_stamp = stamp
+                self.engine.apply_history(self.history)
+                self.index.update()
+                self.adjustments.index = self.index
+                self.adjustments.update(self.history)
+                self.adjustments.apply_to(self.engine)
+                trade_date = int(self.history.dates[-1]) if len(self.history.dates) else None
+                if self.latest is None or self.latest.trade_date != trade_date:
+                    self.latest = LatestPrices.from_history(self.history)
+                self.screener = Screener(self.history, adjustments=self.adjustments)
+                self.version = version
+            return self.history, self.engine
+
+
+state = AnalyticsState()
+
+_option_chains = None
+_option_chains_lock = threading.Lock()
+
+
+def _error(message, code=400):
+    return jsonify({"status": "error", "error": message}), code
+
+
+def _json_params():
+    if not request.is_json:
+        return None
+    return request.get_json(silent=True) or {}
+
+
+def _number(params, name, default, cast, low, high):
+    value = params.get(name, default)
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a number")
+    try:
+        value = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+@bp.route("/v1/analytics/sma-nearby", methods=["POST"])
+def sma_nearby():
+    params = _json_params()
+    if params is None:
+        return _error("Content-Type must be application/json")
+    try:
+        sma_period = _number(params, "sma_period", 50, int, 1, state.engine.window)
+        threshold_pct = _number(params, "threshold_pct", 2.0, float, 0, 100)
+    except ValueError as e:
+        return _error(str(e))
+
+    def compute():
+        history, engine = state.current(cache.version())
+        codes, closes, sma, distance = engine.sma_nearby(sma_period, threshold_pct)
+        return [
+            {"symbol": symbol, "close": float(c), "sma": round(float(s), 2),
+             "distance_pct": round(float(d), 2)}
+            for symbol, c, s, d in zip(history.symbols(codes), closes, sma, distance)
+        ]
+
+    data = cache.get_or_compute("sma-nearby", {"sma_period": sma_period,
+                                               "threshold_pct": threshold_pct}, compute)
+    return jsonify({"status": "success", "trade_date": cache.trade_date(),
+                    "count": len(data), "data": data})
+
+
+@bp.route("/v1/analytics/screen", methods=["POST"])
+def screen():
+    """Run a declarative screen; see screener.py for the filter specs."""
+    params = _json_params()
+    if params is None:
+        return _error("Content-Type must be application/json")
+    try:
+        filters = validate(params.get("filters"))
+        start = params.get("start")
+        end = params.get("end")
+        for name, value in (("start", start), ("end", end)):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int)):
+                raise ValueError(f"{name} must be a YYYYMMDD integer")
+        limit = _number(params, "limit", 500, int, 1, 100000)
+        series = params.get("series", "EQ")
+    except ValueError as e:
+        return _error(str(e))
+
+    def compute():
+        state.current(cache.version())
+        return state.screener.run(filters, start, end, series, limit)
+
+    try:
+        data = cache.get_or_compute("screen", {"filters": filters, "start": start, "end": end,
+                                               "series": series, "limit": limit}, compute)
+    except (ValueError, TypeError) as e:
+        return _error(str(e))
+    return jsonify({"status": "success", "trade_date": cache.trade_date(),
+                    "count": len(data), "data": data})
+
+
+@bp.route("/v1/symbols/<symbol>/latest", methods=["GET"])
+def symbol_latest(symbol):
+    """Latest day's OHLC, previous close and volume for one symbol."""
+    state.current(cache.version())
+    row = state.latest.get(symbol.upper(), request.args.get("series", "EQ"))
+    if row is None:
+        return _error(f"{symbol} did not trade on {state.latest.trade_date}", 404)
+    return jsonify({"status": "success", "data": row})
+
+
+@bp.route("/v1/symbols/<symbol>/history", methods=["GET"])
+def symbol_history(symbol):
+    """One instrument's history by ticker or ISIN, continuous across renames.
+
+    ?adjusted=1 restates prices and volumes for splits and bonuses.
+    """
+    symbol = symbol.upper()
+    column = request.args.get("column", "ClsPric")
+    if column not in DTYPES or column in ("TckrSymb", "SctySrs", "ISIN"):
+        return _error(f"Unknown numeric column: {column}")
+    try:
+        last = _number(request.args, "last", 200, int, 1, 100000)
+    except ValueError as e:
+        return _error(str(e))
+    series = request.args.get("series", "EQ")
+    adjusted = request.args.get("adjusted", "0").lower() in ("1", "true")
+
+    def compute():
+        state.current(cache.version())
+        source = state.adjustments.adjusted if adjusted else state.index.series
+        try:
+            dates, values = source(symbol, column, series=series, last=last)
+        except KeyError:
+            return None
+        return {"aliases": [list(a) for a in state.index.aliases(symbol, series)],
+                "dates": dates.tolist(), "values": values.tolist()}
+
+    data = cache.get_or_compute("symbol-history", {"symbol": symbol, "column": column,
+                                                   "series": series, "last": last,
+                                                   "adjusted": adjusted}, compute)
+    if data is None:
+        return _error(f"Unknown symbol: {symbol}", 404)
+    return jsonify({"status": "success", "symbol": symbol, "column": column,
+                    "adjusted": adjusted, "trade_date": cache.trade_date(), **data})
+
+
+def _date_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    if not (len(value) == 8 and value.isdigit()):
+        raise ValueError(f"{name} must be YYYYMMDD")
+    return int(value)
+
+
+def _fo_query(method, *args):
+    """Run an OptionChains query; the SQLite connection is shared, so one at a time."""
+    global _option_chains
+    with _option_chains_lock:
+        if _option_chains is None:
+            _option_chains = OptionChains()
+        return getattr(_option_chains, method)(*args)
+
+
+@bp.route("/v1/fo/<symbol>/chain", methods=["GET"])
+def option_chain(symbol):
+    """OI by strike for one expiry of an underlying (nearest expiry, latest day by default)."""
+    try:
+        expiry, trade_date = _date_arg("expiry"), _date_arg("date")
+    except ValueError as e:
+        return _error(str(e))
+    trade_date, expiry, rows = _fo_query("chain", symbol.upper(), expiry, trade_date)
+    if not rows:
+        return _error(f"No option chain for {symbol}", 404)
+    return jsonify({"status": "success", "symbol": symbol.upper(), "trade_date": trade_date,
+                    "expiry": expiry, "count": len(rows), "data": rows})
+
+
+@bp.route("/v1/fo/<symbol>/summary", methods=["GET"])
+def option_summary(symbol):
+    """PCR, max pain and OI totals for every listed expiry of an underlying."""
+    try:
+        trade_date = _date_arg("date")
+    except ValueError as e:
+        return _error(str(e))
+    rows = _fo_query("summary", symbol.upper(), trade_date)
+    if not rows:
+        return _error(f"No options data for {symbol}", 404)
+    return jsonify({"status": "success", "symbol": symbol.upper(),
+                    "trade_date": rows[0]["trade_date"], "data": rows})
+
+
+@bp.route("/v1/fo/buildup", methods=["GET"])
+def futures_buildup():
+    """Futures by price/OI buildup for a day (latest by default), largest OI change first."""
+    try:
+        trade_date = _date_arg("date")
+    except ValueError as e:
+        return _error(str(e))
+    rows = _fo_query("buildup", trade_date, request.args.get("kind"))
+    return jsonify({"status": "success", "trade_date": rows[0]["trade_date"] if rows else trade_date,
+                    "count": len(rows), "data": rows})
+
+
+@bp.route("/v1/prices/latest", methods=["GET"])
+def latest_prices():
+    """Latest stored close for ?symbols=A,B,... from Postgres."""
+    symbols = [s.strip().upper() for s in request.args.get("symbols", "").split(",") if s.strip()]
+    if not symbols or len(symbols) > 500:
+        return _error("symbols must list 1 to 500 comma-separated symbols")
+    try:
+        closes = get_database("api").latest_close(symbols, request.args.get("series", "EQ"))
+    except unavailable_errors() as e:
+        return _error(f"Database unavailable: {e}", 503)
+    data = {symbol: {"trade_date": day.isoformat(), "close": close}
+            for symbol, (day, close) in closes.items()}
+    return jsonify({"status": "success", "count": len(data), "data": data})
+
+
+@bp.route("/v1/prices/<symbol>", methods=["GET"])
+def price_window(symbol):
+    """Last ?days=N sessions of OHLCV for one symbol from Postgres."""
+    try:
+        days = _number(request.args, "days", 30, int, 1, 5000)
+    except ValueError as e:
+        return _error(str(e))
+    try:
+        rows = get_database("api").price_window(symbol.upper(), days, request.args.get("series", "EQ"))
+    except unavailable_errors() as e:
+        return _error(f"Database unavailable: {e}", 503)
+    fields = ("trade_date", "open", "high", "low", "close", "volume")
+    data = [dict(zip(fields, (row[0].isoformat(), *row[1:]))) for row in rows]
+    return jsonify({"status": "success", "symbol": symbol.upper(), "count": len(data), "data": data})
+
+
+@bp.route("/v1/bhavcopy", methods=["POST"])
+def bhavcopy():
+    """Ingest any mirrored zips not yet in the store and invalidate cached results."""
+    try:
+        ingested = ingest_all(BHAVCOPY_DIR, state.store_dir)
+    except Exception as e:
+        return _error(f"Ingest failed: {e}", 500)
+    if ingested:
+        cache.invalidate()
+    return jsonify({"status": "success", "ingested": ingested,
+                    "trade_date": cache.trade_date()})
+
+
+@bp.route("/v1/jobs", methods=["POST"])
+def submit_job():
+    """Queue a background job: {"type": ..., "params": {...}, "priority": 10}."""
+    params = _json_params()
+    if params is None:
+        return _error("Content-Type must be application/json")
+    job_type = params.get("type")
+    if job_type not in scheduler.types:
+        return _error(f"type must be one of {sorted(scheduler.types)}")
+    if not isinstance(params.get("params", {}), dict):
+        return _error("params must be an object")
+    try:
+        priority = _number(params, "priority", 10, int, 0, 100)
+    except ValueError as e:
+        return _error(str(e))
+    try:
+        job = scheduler.submit(job_type, params.get("params"), priority)
+    except ValueError as e:
+        return _error(str(e))
+    return jsonify({"status": "success", "job": job.to_dict(),
+                    "events": f"/v1/jobs/{job.id}/events"}), 202
+
+
+@bp.route("/v1/jobs", methods=["GET"])
+def list_jobs():
+    return jsonify({"status": "success", "jobs": [j.to_dict() for j in scheduler.list()]})
+
+
+@bp.route("/v1/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return _error("Job not found", 404)
+    return jsonify({"status": "success", "job": job.to_dict()})
+
+
+@bp.route("/v1/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Server-Sent Events stream of a job's progress; resumes from Last-Event-ID."""
+    if scheduler.get(job_id) is None:
+        return _error("Job not found", 404)
+    last = request.headers.get("Last-Event-ID", "")
+    since = int(last) + 1 if last.isdigit() else 0
+    events = (sse_format(e) for e in scheduler.stream(job_id, since))
+    return Response(stream_with_context(events), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def health_details():
+    """Store and cache details for /v1/health/detailed."""
+    history = History(state.store_dir)
+    return {
+        "store": {
+            "days": len(history.dates),
+            "rows": len(history),
+            "latest_trade_date": int(history.dates[-1]) if len(history.dates) else None,
+        },
+        "response_cache": cache.stats(),
+        "warm_start": state.warm_started,
+        "jobs": {status: sum(j.status == status for j in scheduler.list())
+                 for status in ("queued", "running", "done", "failed")},
+    }
+
+
+@bp.route("/v1/health", methods=["GET"])
+def health():
+    return jsonify({"status": "healthy", "timestamp": datetime.utcnow().isoformat()})
+
+
+@bp.route("/v1/health/detailed", methods=["GET"])
+def health_detailed():
+    return jsonify({"status": "healthy", "timestamp": datetime.utcnow().isoformat(),
+                    **health_details()})
+
+
+@bp.route("/v1/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Counters and stage timings in the Prometheus text format."""
+    details = health_details()
+    gauges = {
+        "store_days": details["store"]["days"],
+        "store_rows": details["store"]["rows"],
+        "latest_trade_date": details["store"]["latest_trade_date"],
+        "response_cache_size": details["response_cache"]["size"],
+        "response_cache_hit_rate": details["response_cache"]["hit_rate"],
+    }
+    gauges.update({f"jobs_{status}": count for status, count in details["jobs"].items()})
+    return Response(render_prometheus(gauges), mimetype="text/plain; version=0.0.4")
+
+
+def create_app():
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    return app
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve analytics from the columnar store")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    create_app().run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,367 @@
+"""
+Compact, lossless archive format for the BhavCopy mirror.
+
+    public/archive/instruments.json.xz   static instrument columns, stored once
+    public/archive/YYYYMMDD.bca          one day, LZMA-compressed
+
+Static columns (ISIN, TckrSymb, SctySrs, FinInstrmNm, ...) live in
+instruments.json.xz; a day stores only the instrument id of each row. Columns
+that are identical on every row of a day (TradDt, SsnId, the empty
+Rsvd*/Rmks, ...) go into the day header once. Prices are stored as integer
+paise: ClsPric as a delta from PrvsClsgPric and open/high/low/last/settle as
+deltas from ClsPric, zigzag-varint packed before compression. Decoding
+reproduces the original CSV byte for byte; a day that does not survive the
+round trip is kept as plain compressed CSV instead.
+
+Once public/archive exists it is the published copy: the daily update and
+backfill archive each new day and drop its zip, and ingest reads a day from
+its .bca when there is no zip (bhavcopy.day_files). --remove-zips drops the
+zips of days already archived, after checking each round-trips.
+
+    python archive.py convert [--verify] [--remove-zips]
+    python archive.py extract 20250703 [--out 20250703.zip]
+"""
+
+import json
+import lzma
+import os
+import re
+import struct
+import zipfile
+from pathlib import Path
+
+from bhavcopy import BHAVCOPY_DIR
+
+ARCHIVE_DIR = BHAVCOPY_DIR.parent / "archive"
+MAGIC = b"BCA1"
+
+STATIC_COLUMNS = (
+    "Sgmt", "Src", "FinInstrmTp", "FinInstrmId", "ISIN", "TckrSymb", "SctySrs",
+    "XpryDt", "FininstrmActlXpryDt", "OptnTp", "FinInstrmNm",
+)
+
+# Column -> column it is delta-encoded against (when both share a codec)
+DELTA_BASE = {
+    "ClsPric": "PrvsClsgPric",
+    "OpnPric": "ClsPric", "HghPric": "ClsPric", "LwPric": "ClsPric",
+    "LastPric": "ClsPric", "SttlmPric": "ClsPric",
+}
+
+INT_RE = re.compile(r"-?(?:0|[1-9]\d*)\Z")
+FIXED_RE = re.compile(r"-?(?:0|[1-9]\d*)\.(\d+)\Z")
+
+
+# -- varints -----------------------------------------------------------------
+
+def _pack(values):
+    out = bytearray()
+    for v in values:
+        v = (v << 1) ^ (v >> 63)  # zigzag
+        while v > 0x7F:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+    return bytes(out)
+
+
+def _unpack(data, pos, count):
+    values = []
+    for _ in range(count):
+        shift = result = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            result |= (b & 0x7F) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        values.append((result >> 1) ^ -(result & 1))
+    return values, pos
+
+
+# -- column codecs -------------------------------------------------------------
+
+def _codec(values):
+    """'int', 'fixed:N' or 'raw' for a column of strings."""
+    if all(INT_RE.match(v) for v in values):
+        return "int"
+    match = FIXED_RE.match(values[0])
+    if match:
+        decimals = len(match.group(1))
+        if all((m := FIXED_RE.match(v)) and len(m.group(1)) == decimals for v in values):
+            return f"fixed:{decimals}"
+    return "raw"
+
+
+def _encode_values(values, codec):
+    if codec == "int":
+        return [int(v) for v in values]
+    return [int(v.replace(".", "")) for v in values]
+
+
+def _decode_values(ints, codec):
+    if codec == "int":
+        return [str(v) for v in ints]
+    decimals = int(codec.split(":")[1])
+    scale = 10 ** decimals
+    out = []
+    for v in ints:
+        sign = "-" if v < 0 else ""
+        whole, frac = divmod(abs(v), scale)
+        out.append(f"{sign}{whole}.{frac:0{decimals}d}")
+    return out
+
+
+# -- instrument registry -------------------------------------------------------
+
+class Instruments:
+    def __init__(self, archive_dir=ARCHIVE_DIR):
+        self.path = Path(archive_dir) / "instruments.json.xz"
+        self.records = []
+        if self.path.exists():
+            with lzma.open(self.path, "rt") as f:
+                self.records = [tuple(r) for r in json.load(f)["instruments"]]
+        self._ids = {r: i for i, r in enumerate(self.records)}
+        self.dirty = False
+
+    def id_for(self, record):
+        if record not in self._ids:
+            self._ids[record] = len(self.records)
+            self.records.append(record)
+            self.dirty = True
+        return self._ids[record]
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with lzma.open(tmp, "wt") as f:
+            json.dump({"columns": STATIC_COLUMNS, "instruments": self.records}, f,
+                      separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+# -- day encode / decode -------------------------------------------------------
+
+def encode_day(csv_bytes, instruments, member=None, date_time=None):
+    """Encode one BhavCopy CSV into the .bca payload (before compression)."""
+    text = csv_bytes.decode("utf-8")
+    newline = "\r\n" if "\r\n" in text else "\n"
+    lines = text.split(newline)
+    trailing = lines[-1] == ""
+    if trailing:
+        lines.pop()
+    header_line, body = lines[0], lines[1:]
+    header = header_line.split(",")
+    meta = {
+        "member": member, "date_time": date_time, "newline": newline,
+        "trailing_newline": trailing, "rows": len(body),
+    }
+    if '"' in text or not body or any(line.count(",") != len(header) - 1 for line in body):
+        meta["mode"] = "csv"
+        return _frame(meta, csv_bytes)
+
+    columns = list(zip(*(line.split(",") for line in body)))
+    by_name = dict(zip(header, columns))
+
+    static = [c for c in STATIC_COLUMNS if c in by_name]
+    constants, codecs, raw = {}, {}, {}
+    for name, values in by_name.items():
+        if name in static:
+            continue
+        if len(set(values)) == 1:
+            constants[name] = values[0]
+        else:
+            codec = _codec(values)
+            if codec == "raw":
+                raw[name] = list(values)
+            else:
+                codecs[name] = codec
+
+    ids = [instruments.id_for(r) for r in zip(*(by_name[c] for c in static))]
+    ints = {name: _encode_values(by_name[name], codec) for name, codec in codecs.items()}
+    deltas = {}
+    for name, base in DELTA_BASE.items():
+        if name in ints and base in ints and codecs[name] == codecs[base]:
+            deltas[name] = base
+
+    payload = bytearray(_pack([b - a for a, b in zip([0] + ids, ids)]))
+    for name in codecs:
+        values = ints[name]
+        if name in deltas:
+            values = [v - b for v, b in zip(values, ints[deltas[name]])]
+        payload += _pack(values)
+
+    meta.update({
+        "mode": "columns", "header": header, "static": static,
+        "constants": constants, "codecs": codecs, "deltas": deltas, "raw": raw,
+    })
+    return _frame(meta, bytes(payload))
+
+
+def _frame(meta, payload):
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode()
+    return MAGIC + struct.pack("<I", len(meta_bytes)) + meta_bytes + payload
+
+
+def decode_day(data, instruments):
+    """Decode a .bca payload back into (meta, csv_bytes)."""
+    if data[:4] != MAGIC:
+        raise ValueError("Not a BhavCopy archive day")
+    (meta_len,) = struct.unpack("<I", data[4:8])
+    meta = json.loads(data[8:8 + meta_len])
+    payload = data[8 + meta_len:]
+    if meta["mode"] == "csv":
+        return meta, payload
+
+    n = meta["rows"]
+    id_deltas, pos = _unpack(payload, 0, n)
+    ids, acc = [], 0
+    for d in id_deltas:
+        acc += d
+        ids.append(acc)
+
+    ints = {}
+    for name in meta["codecs"]:
+        ints[name], pos = _unpack(payload, pos, n)
+    # Bases are decoded before the columns that depend on them
+    resolved = {}
+
+    def resolve(name):
+        if name not in resolved:
+            values = ints[name]
+            base = meta["deltas"].get(name)
+            if base is not None:
+                values = [v + b for v, b in zip(values, resolve(base))]
+            resolved[name] = values
+        return resolved[name]
+
+    columns = {}
+    static_index = {c: i for i, c in enumerate(STATIC_COLUMNS)}
+    records = [instruments.records[i] for i in ids]
+    for name in meta["static"]:
+        i = static_index[name]
+        columns[name] = [r[i] for r in records]
+    for name, value in meta["constants"].items():
+        columns[name] = [value] * n
+    for name, codec in meta["codecs"].items():
+        columns[name] = _decode_values(resolve(name), codec)
+    columns.update(meta["raw"])
+
+    newline = meta["newline"]
+    lines = [",".join(meta["header"])]
+    lines += [",".join(row) for row in zip(*(columns[c] for c in meta["header"]))]
+    text = newline.join(lines) + (newline if meta["trailing_newline"] else "")
+    return meta, text.encode("utf-8")
+
+
+# -- files ---------------------------------------------------------------------
+
+def day_path(yyyymmdd, archive_dir=ARCHIVE_DIR):
+    return Path(archive_dir) / f"{yyyymmdd}.bca"
+
+
+def archive_zip(zip_path, archive_dir=ARCHIVE_DIR, instruments=None, verify=True):
+    """Add one mirrored zip to the archive. Returns the .bca path."""
+    own = instruments is None
+    instruments = instruments or Instruments(archive_dir)
+    with zipfile.ZipFile(zip_path) as zf:
+        info = next(i for i in zf.infolist() if i.filename.lower().endswith(".csv"))
+        csv_bytes = zf.read(info)
+    data = encode_day(csv_bytes, instruments, info.filename, list(info.date_time))
+    if verify and decode_day(data, instruments)[1] != csv_bytes:
+        meta = {"member": info.filename, "date_time": list(info.date_time), "mode": "csv"}
+        data = _frame(meta, csv_bytes)
+
+    path = day_path(Path(zip_path).stem, archive_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(lzma.compress(data, preset=9 | lzma.PRESET_EXTREME))
+    if own:
+        instruments.save()
+    os.replace(tmp, path)
+    return path
+
+
+def read_day(yyyymmdd, archive_dir=ARCHIVE_DIR, instruments=None):
+    """(meta, csv_bytes) for one archived day."""
+    instruments = instruments or Instruments(archive_dir)
+    with open(day_path(yyyymmdd, archive_dir), "rb") as f:
+        return decode_day(lzma.decompress(f.read()), instruments)
+
+
+def extract_zip(yyyymmdd, out_path, archive_dir=ARCHIVE_DIR):
+    """Rebuild the original mirror zip (same member name and timestamp)."""
+    meta, csv_bytes = read_day(yyyymmdd, archive_dir)
+    member = meta.get("member") or f"BhavCopy_NSE_CM_0_0_0_{yyyymmdd}_F_0000.csv"
+    info = zipfile.ZipInfo(member, tuple(meta.get("date_time") or (1980, 1, 1, 0, 0, 0)))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(out_path, "w") as zf:
+        zf.writestr(info, csv_bytes)
+    return out_path
+
+
+def convert(bhavcopy_dir=BHAVCOPY_DIR, archive_dir=ARCHIVE_DIR, verify=False, remove_zips=False):
+    """Archive every mirrored zip that is not archived yet.
+
+    With remove_zips every zip whose archived day reproduces it is deleted.
+    """
+    instruments = Instruments(archive_dir)
+    converted = []
+    for zip_path in sorted(Path(bhavcopy_dir).glob("*.zip")):
+        if day_path(zip_path.stem, archive_dir).exists():
+            continue
+        archive_zip(zip_path, archive_dir, instruments)
+        converted.append(zip_path)
+    instruments.save()
+
+    checked = converted if verify else []
+    if remove_zips:
+        checked = sorted(Path(bhavcopy_dir).glob("*.zip"))
+    for zip_path in checked:
+        with zipfile.ZipFile(zip_path) as zf:
+            original = zf.read(next(n for n in zf.namelist() if n.lower().endswith(".csv")))
+        if read_day(zip_path.stem, archive_dir, instruments)[1] != original:
+            raise ValueError(f"Round trip mismatch for {zip_path}")
+    for zip_path in checked if remove_zips else ():
+        zip_path.unlink()
+    return converted
+
+
+def archive_size(archive_dir=ARCHIVE_DIR):
+    return sum(p.stat().st_size for p in Path(archive_dir).glob("*") if p.is_file())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compact BhavCopy archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    conv = sub.add_parser("convert", help="archive the zips in public/bhavcopy")
+    conv.add_argument("--src", default=str(BHAVCOPY_DIR))
+    conv.add_argument("--dest", default=str(ARCHIVE_DIR))
+    conv.add_argument("--verify", action="store_true", help="check every day round-trips")
+    conv.add_argument("--remove-zips", action="store_true",
+                      help="delete the zips once their archived days round-trip")
+    ext = sub.add_parser("extract", help="rebuild a day's zip or CSV")
+    ext.add_argument("date", help="YYYYMMDD")
+    ext.add_argument("--archive", default=str(ARCHIVE_DIR))
+    ext.add_argument("--out", help="output .zip or .csv (default: YYYYMMDD.zip)")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        before = sum(p.stat().st_size for p in Path(args.src).glob("*.zip"))
+        converted = convert(args.src, args.dest, args.verify, args.remove_zips)
+        print(f"✅ Archived {len(converted)} days: {before / 1e6:.2f} MB of zips -> "
+              f"{archive_size(args.dest) / 1e6:.2f} MB archive")
+    else:
+        out = args.out or f"{args.date}.zip"
+        if out.endswith(".csv"):
+            with open(out, "wb") as f:
+                f.write(read_day(args.date, args.archive)[1])
+        else:
+            extract_zip(args.date, out, args.archive)
+        print(f"✅ Wrote {out}")
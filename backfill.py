@@ -0,0 +1,201 @@
+"""
+Backfill public/bhavcopy over a date range.
+
+    python backfill.py 2025-01-01 2025-06-30 --workers 4 --rate 2
+
+Weekends, NSE trading holidays and days already mirrored are skipped.
+Downloads go through a bounded thread pool sharing one pooled
+requests.Session, a per-host token bucket and jittered retries. Every
+finished day is written to a checkpoint file, so rerunning the same command
+after an interruption only fetches what is left. A 404 is only remembered
+for days older than RECHECK_DAYS, since NSE publishes each file some time
+after the close; --retry-missing forgets the remembered ones. Point --base-url at a local
+server to run against a stand-in for nsearchives.
+"""
+
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from archive import ARCHIVE_DIR
+from bhavcopy import BHAVCOPY_DIR, day_files
+from bhavcopy_store import STORE_DIR, ingest_all
+from netutil import RateLimiter, get_with_retries
+from update import HEADERS, NSE_ARCHIVES, bhavcopy_url, git_commit_and_push, save_bhavcopy
+
+CHECKPOINT_PATH = Path(__file__).resolve().parent / ".backfill.json"
+
+# Days this recent may still be published, so a 404 is not checkpointed
+RECHECK_DAYS = 7
+
+# NSE capital market trading holidays (weekday closures only)
+NSE_HOLIDAYS = {
+    date(2025, 2, 26), date(2025, 3, 14), date(2025, 3, 31), date(2025, 4, 10),
+    date(2025, 4, 14), date(2025, 4, 18), date(2025, 5, 1), date(2025, 8, 15),
+    date(2025, 8, 27), date(2025, 10, 2), date(2025, 10, 21), date(2025, 10, 22),
+    date(2025, 11, 5), date(2025, 12, 25),
+}
+
+
+def load_holidays(path):
+    """Read extra holidays from a file with one YYYY-MM-DD per line."""
+    with open(path) as f:
+        return {date.fromisoformat(line.strip()) for line in f if line.strip()}
+
+
+def trading_days(start, end, holidays=NSE_HOLIDAYS):
+    day = start
+    while day <= end:
+        if day.weekday() < 5 and day not in holidays:
+            yield day
+        day += timedelta(days=1)
+
+
+class Checkpoint:
+    """JSON record of days that were saved or that NSE has no file for."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.done, self.missing = set(), set()
+        if self.path.exists():
+            with open(self.path) as f:
+                state = json.load(f)
+            self.done = set(state.get("done", []))
+            self.missing = set(state.get("missing", []))
+
+    def __contains__(self, yyyymmdd):
+        return yyyymmdd in self.done or yyyymmdd in self.missing
+
+    def mark(self, yyyymmdd, found):
+        with self._lock:
+            (self.done if found else self.missing).add(yyyymmdd)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump({"done": sorted(self.done), "missing": sorted(self.missing)}, f, indent=2)
+            os.replace(tmp, self.path)
+
+
+def make_session(workers):
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_day(session, limiter, yyyymmdd, dest_dir, base_url):
+    """Download one day. Returns True when saved, False when NSE has no file.
+
+    The payload is validated and written atomically by save_bhavcopy, so an
+    error page or truncated zip raises ValueError instead of being mirrored.
+    """
+    url = bhavcopy_url(yyyymmdd, base_url)
+    response = get_with_retries(session, url, limiter)
+    if response.status_code == 404:
+        return False
+    response.raise_for_status()
+    save_bhavcopy(response.content, yyyymmdd, dest_dir)
+    return True
+
+
+def backfill(start, end, dest_dir=BHAVCOPY_DIR, base_url=NSE_ARCHIVES, workers=4,
+             rate=2.0, checkpoint_path=CHECKPOINT_PATH, holidays=NSE_HOLIDAYS,
+             retry_missing=False):
+    """Fetch every pending trading day in [start, end].
+
+    Returns (saved, missing, failed) lists of YYYYMMDD strings.
+    """
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint = Checkpoint(checkpoint_path)
+    if retry_missing:
+        checkpoint.missing.clear()
+    recheck_from = (date.today() - timedelta(days=RECHECK_DAYS)).strftime("%Y%m%d")
+    mirrored = {path.stem for path in day_files(dest_dir)}
+
+    pending = []
+    for day in trading_days(start, end, holidays):
+        yyyymmdd = day.strftime("%Y%m%d")
+        if yyyymmdd in checkpoint or yyyymmdd in mirrored:
+            continue
+        pending.append(yyyymmdd)
+    print(f"📅 {len(pending)} trading days to fetch")
+
+    saved, missing, failed = [], [], []
+    limiter = RateLimiter(rate, burst=workers)
+    with make_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(fetch_day, session, limiter, d, dest_dir, base_url): d
+            for d in pending
+        }
+        for future in as_completed(futures):
+            yyyymmdd = futures[future]
+            try:
+                found = future.result()
+            except Exception as e:
+                print(f"❌ {yyyymmdd}: {e}")
+                failed.append(yyyymmdd)
+                continue
+            if found or yyyymmdd < recheck_from:
+                checkpoint.mark(yyyymmdd, found)
+            if found:
+                print(f"✅ Saved {yyyymmdd}")
+                saved.append(yyyymmdd)
+            else:
+                print(f"⏭️  No BhavCopy for {yyyymmdd}")
+                missing.append(yyyymmdd)
+    return sorted(saved), sorted(missing), sorted(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill NSE BhavCopy zips over a date range")
+    parser.add_argument("start", type=date.fromisoformat)
+    parser.add_argument("end", type=date.fromisoformat, nargs="?", default=date.today())
+    parser.add_argument("--dest", default=str(BHAVCOPY_DIR))
+    parser.add_argument("--base-url", default=NSE_ARCHIVES)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2.0, help="requests per second per host")
+    parser.add_argument("--checkpoint", default=str(CHECKPOINT_PATH))
+    parser.add_argument("--holidays", help="extra holidays file, one YYYY-MM-DD per line")
+    parser.add_argument("--retry-missing", action="store_true",
+                        help="fetch days the checkpoint records as not published")
+    parser.add_argument("--store", default=str(STORE_DIR))
+    parser.add_argument("--no-ingest", action="store_true", help="skip the columnar store")
+    parser.add_argument("--commit", action="store_true", help="git commit and push the new days")
+    args = parser.parse_args()
+
+    holidays = set(NSE_HOLIDAYS)
+    if args.holidays:
+        holidays |= load_holidays(args.holidays)
+
+    saved, missing, failed = backfill(
+        args.start, args.end, args.dest, args.base_url, args.workers, args.rate,
+        args.checkpoint, holidays, args.retry_missing,
+    )
+    print(f"✅ {len(saved)} saved, {len(missing)} not published, {len(failed)} failed")
+
+    if saved and not args.no_ingest:
+        ingested = ingest_all(args.dest, args.store)
+        print(f"✅ Added {len(ingested)} days to the columnar store")
+    if saved and args.commit:
+        # Saved days are zips, or .bca files plus instruments.json.xz once there is an archive
+        dest = Path(args.dest)
+        archive_dir = dest.parent / ARCHIVE_DIR.name
+        paths = [dest / f"{d}.zip" for d in saved] + ([archive_dir] if archive_dir.exists() else [])
+        if git_commit_and_push(dest.parent.parent, f"Backfill BhavCopy {saved[0]}..{saved[-1]}", paths):
+            print("✅ Git pushed to Vercel!")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
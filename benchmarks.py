@@ -0,0 +1,340 @@
+"""
+Benchmarks for the ingest and analytics hot paths.
+
+Uses the zips in public/bhavcopy as fixtures and writes one JSON document
+per run, so results from two commits can be diffed:
+
+    python benchmarks.py --out bench_results.json
+    python benchmarks.py --out new.json --compare bench_results.json
+    python benchmarks.py --api-url http://127.0.0.1:5000 --concurrency 16
+    python benchmarks.py --cold-start-store store   # cold start over a real history
+
+Every timing is the median of --repeat runs (min is reported too).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from bhavcopy import BHAVCOPY_DIR, COLUMNS, day_files, read_columns
+from bhavcopy_store import History, ingest_all, parse_day, rebuild_from_zips
+from bulk_loader import StubConnection, load_bhavcopy
+from indicators import IndicatorEngine, sma_backfill
+from k import required_symbols
+from records import compare_models
+from snapshot import build as build_snapshot
+
+
+def measure(fn, repeat):
+    """Run fn `repeat` times; returns (median_s, min_s, last_result)."""
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), min(times), result
+
+
+def _timing(median, best, **extra):
+    out = {"median_ms": round(median * 1000, 3), "min_ms": round(best * 1000, 3)}
+    out.update(extra)
+    return out
+
+
+def bench_parse(zips, repeat):
+    csv_bytes = sum(_csv_size(z) for z in zips)
+    median, best, rows = measure(lambda: sum(1 for z in zips for _ in read_columns(z, COLUMNS)), repeat)
+    results = {"full_parse": _timing(median, best, rows=rows,
+                                     rows_per_sec=round(rows / median),
+                                     mb_per_sec=round(csv_bytes / 1e6 / median, 2))}
+    median, best, _ = measure(lambda: [parse_day(z) for z in zips], repeat)
+    results["typed_columns"] = _timing(median, best, rows_per_sec=round(rows / median))
+    return results
+
+
+def _csv_size(zip_path):
+    with zipfile.ZipFile(zip_path) as zf:
+        return sum(i.file_size for i in zf.infolist())
+
+
+def bench_filter(zips, repeat):
+    columns = ("TckrSymb", "ClsPric", "TtlTradgVol")
+    where = {"SctySrs": "EQ", "TckrSymb": required_symbols}
+    median, best, rows = measure(
+        lambda: sum(1 for z in zips for _ in read_columns(z, columns, where)), repeat)
+    return {"required_symbols": _timing(median, best, rows=rows, days=len(zips),
+                                        us_per_day=round(median / len(zips) * 1e6, 1))}
+
+
+def bench_store(zips, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "bhavcopy"
+        src.mkdir()
+        for z in zips:
+            (src / z.name).symlink_to(z.resolve())
+        start = time.perf_counter()
+        ingest_all(src, Path(tmp) / "store")
+        ingest_s = time.perf_counter() - start
+
+        workers = os.cpu_count() or 1
+        start = time.perf_counter()
+        rebuild_from_zips(src, Path(tmp) / "rebuilt", workers=workers)
+        rebuild_s = time.perf_counter() - start
+
+        history = History(Path(tmp) / "store")
+        median, best, (_, symbols, _) = measure(lambda: history.pivot("ClsPric"), repeat)
+        return {
+            "ingest": _timing(ingest_s, ingest_s, days=len(zips)),
+            "parallel_rebuild": _timing(rebuild_s, rebuild_s, days=len(zips), workers=workers),
+            "pivot_closes": _timing(median, best, days=len(history.dates), symbols=len(symbols)),
+        }
+
+
+def bench_sma(days, symbols, repeat, periods=(20, 50, 200)):
+    """SMA engine and backfill over a synthetic days x symbols random walk."""
+    rng = np.random.default_rng(0)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (days, symbols)), axis=0))
+    codes = np.arange(symbols)
+
+    def replay():
+        engine = IndicatorEngine(periods)
+        for t in range(days):
+            engine.update(t, codes, closes[t])
+        return engine
+
+    median, best, engine = measure(replay, repeat)
+    results = {"engine_replay": _timing(median, best, days=days, symbols=symbols,
+                                        us_per_day=round(median / days * 1e6, 1))}
+
+    start = time.perf_counter()
+    engine.update(days, codes, closes[-1])
+    results["engine_update_one_day"] = _timing(*(time.perf_counter() - start,) * 2)
+
+    median, best, _ = measure(lambda: engine.sma_nearby(50, 2.0), repeat)
+    results["sma_nearby_screen"] = _timing(median, best)
+
+    class _Matrix:
+        def __init__(self):
+            self.dates = np.arange(days)
+
+        def pivot(self, name, start=None, series=None):
+            return self.dates, codes, closes
+
+    median, best, _ = measure(lambda: sma_backfill(_Matrix(), periods, 2.0), repeat)
+    results["vectorized_backfill"] = _timing(median, best, days=days, symbols=symbols,
+                                             periods=list(periods))
+    return results
+
+
+# Run in a fresh interpreter: import the service, answer one request
+COLD_START = """
+import json, time
+start = time.perf_counter()
+import analytics_api
+imported = time.perf_counter()
+client = analytics_api.create_app().test_client()
+response = client.post("/v1/analytics/sma-nearby", json={"sma_period": 50, "threshold_pct": 2.0})
+assert response.status_code == 200, response.status_code
+done = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "first_response_s": done - imported}))
+"""
+
+
+def _link_history(store_dir, dest):
+    """Hard-link (or copy) store_dir/history into dest/history, leaving the original untouched."""
+    (dest / "history").mkdir(parents=True)
+    for path in (Path(store_dir) / "history").iterdir():
+        try:
+            os.link(path, dest / "history" / path.name)
+        except OSError:
+            shutil.copy2(path, dest / "history" / path.name)
+
+
+def bench_cold_start(zips, repeat, store_dir=None):
+    """Process start to first sma-nearby response, replaying history vs loading the snapshot.
+
+    Runs on a store ingested from the fixtures, or on a copy of `store_dir`'s
+    history when given (a dozen fixture days leave little to replay).
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Path(tmp) / "store"
+        if store_dir:
+            _link_history(store_dir, store)
+        else:
+            src = Path(tmp) / "bhavcopy"
+            src.mkdir()
+            for z in zips:
+                (src / z.name).symlink_to(z.resolve())
+            with contextlib.redirect_stdout(io.StringIO()):
+                ingest_all(src, store)
+        env = {k: v for k, v in os.environ.items() if k != "BHAVCOPY_RESPONSE_CACHE_DIR"}
+        env["BHAVCOPY_STORE_DIR"] = str(store)
+        for mode in ("replay", "snapshot"):
+            if mode == "snapshot":
+                build_snapshot(store)
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                out = subprocess.run([sys.executable, "-c", COLD_START], env=env, check=True,
+                                     capture_output=True, text=True, cwd=Path(__file__).parent)
+                runs.append((time.perf_counter() - start, json.loads(out.stdout)))
+            walls = [wall for wall, _ in runs]
+            results[mode] = _timing(
+                statistics.median(walls), min(walls),
+                days=len(History(store).dates),
+                import_ms=round(statistics.median(r["import_s"] for _, r in runs) * 1000, 3),
+                first_response_ms=round(statistics.median(r["first_response_s"] for _, r in runs) * 1000, 3),
+            )
+    return results
+
+
+def bench_db(zips, repeat):
+    def load():
+        conn = StubConnection()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for z in zips:
+                load_bhavcopy(conn, z)
+        return conn.copied_rows
+
+    median, best, rows = measure(load, repeat)
+    return {"copy_stub": _timing(median, best, rows=rows, rows_per_sec=round(rows / median))}
+
+
+API_ENDPOINTS = [
+    ("GET", "/v1/health", None),
+    ("GET", "/v1/health/detailed", None),
+    ("POST", "/v1/analytics/sma-nearby", {"sma_period": 50, "threshold_pct": 2.0}),
+]
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {}
+    ms = np.array(latencies) * 1000
+    return {f"p{p}": round(float(np.percentile(ms, p)), 2) for p in (50, 95, 99)}
+
+
+def bench_api(base_url, requests_per_endpoint, concurrency):
+    import requests
+
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    results = {}
+    for method, path, body in API_ENDPOINTS:
+        url = base_url.rstrip("/") + path
+
+        def call(_):
+            start = time.perf_counter()
+            try:
+                response = session().request(method, url, json=body, timeout=30)
+                ok = response.status_code < 500
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - start, ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(call, range(requests_per_endpoint)))
+        wall = time.perf_counter() - start
+        latencies = [t for t, ok in outcomes if ok]
+        results[f"{method} {path}"] = {
+            **percentiles(latencies),
+            "requests": len(outcomes),
+            "errors": len(outcomes) - len(latencies),
+            "rps": round(len(outcomes) / wall, 1),
+        }
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline, path=()):
+    """Print median_ms changes between two result documents."""
+    for key, value in current.items():
+        if not isinstance(value, dict):
+            continue
+        base = baseline.get(key) if isinstance(baseline, dict) else None
+        if base is None:
+            continue
+        if "median_ms" in value and "median_ms" in base and base["median_ms"]:
+            change = (value["median_ms"] - base["median_ms"]) / base["median_ms"] * 100
+            marker = "🔺" if change > 10 else "🔻" if change < -10 else "  "
+            print(f"{marker} {'.'.join(path + (key,)):<45} {base['median_ms']:>10.3f} -> "
+                  f"{value['median_ms']:>10.3f} ms ({change:+.1f}%)")
+        else:
+            compare(value, base, path + (key,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest and analytics hot paths")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sma-days", type=int, default=500)
+    parser.add_argument("--sma-symbols", type=int, default=3000)
+    parser.add_argument("--api-url", help="also benchmark a running API")
+    parser.add_argument("--api-requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--cold-start-store", help="store whose history the cold-start bench copies")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    zips = day_files(BHAVCOPY_DIR)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "fixtures": len(zips),
+        },
+        "parse": bench_parse(zips, args.repeat),
+        "filter": bench_filter(zips, args.repeat),
+        "store": bench_store(zips, args.repeat),
+        "sma": bench_sma(args.sma_days, args.sma_symbols, args.repeat),
+        "db": bench_db(zips, args.repeat),
+        "cold_start": bench_cold_start(zips, args.repeat, args.cold_start_store),
+        "records": compare_models(zips),
+    }
+    if args.api_url:
+        results["api"] = bench_api(args.api_url, args.api_requests, args.concurrency)
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"\nResults saved to: {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import csv
+import io
+import sys
+import zipfile
+import zlib
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+
+from instrumentation import inc
+
+# Layout of the NSE CM BhavCopy (UDiFF) CSV, in file order
+COLUMNS = (
+    "TradDt", "BizDt", "Sgmt", "Src", "FinInstrmTp", "FinInstrmId", "ISIN",
+    "TckrSymb", "SctySrs", "XpryDt", "FininstrmActlXpryDt", "StrkPric",
+    "OptnTp", "FinInstrmNm", "OpnPric", "HghPric", "LwPric", "ClsPric",
+    "LastPric", "PrvsClsgPric", "UndrlygPric", "SttlmPric", "OpnIntrst",
+    "ChngInOpnIntrst", "TtlTradgVol", "TtlTrfVal", "TtlNbOfTxsExctd", "SsnId",
+    "NewBrdLotQty", "Rmks", "Rsvd1", "Rsvd2", "Rsvd3", "Rsvd4",
+)
+
+# Typed columns kept by the columnar store
+DICT_COLUMNS = ("TckrSymb", "SctySrs", "ISIN")
+PRICE_COLUMNS = (
+    "OpnPric", "HghPric", "LwPric", "ClsPric", "LastPric", "PrvsClsgPric",
+    "SttlmPric", "TtlTrfVal",
+)
+VOLUME_COLUMNS = ("FinInstrmId", "TtlTradgVol", "TtlNbOfTxsExctd")
+
+FLOAT_COLUMNS = PRICE_COLUMNS + ("StrkPric", "UndrlygPric")
+INT_COLUMNS = VOLUME_COLUMNS + ("OpnIntrst", "ChngInOpnIntrst", "NewBrdLotQty")
+
+BHAVCOPY_DIR = Path(__file__).resolve().parent / "public" / "bhavcopy"
+
+
+def zip_path_for(day, bhavcopy_dir=BHAVCOPY_DIR):
+    """Path of the mirrored zip for a date (or YYYYMMDD string)."""
+    if isinstance(day, (date, datetime)):
+        day = day.strftime("%Y%m%d")
+    return Path(bhavcopy_dir) / f"{day}.zip"
+
+
+def day_files(bhavcopy_dir=BHAVCOPY_DIR):
+    """One file per mirrored day, oldest first.
+
+    A day is read from its zip while the mirror still has it, else from the
+    .bca in the archive next to the mirror (public/archive).
+    """
+    bhavcopy_dir = Path(bhavcopy_dir)
+    days = {p.stem: p for p in (bhavcopy_dir.parent / "archive").glob("*.bca")}
+    days.update((p.stem, p) for p in bhavcopy_dir.glob("*.zip"))
+    return [days[day] for day in sorted(days)]
+
+
+def date_from_path(path):
+    """YYYYMMDD int taken from a mirrored zip's (or .bca's) file name."""
+    return int(Path(path).stem)
+
+
+def _open_member(zip_path):
+    if Path(zip_path).suffix == ".bca":
+        from archive import read_day
+        path = Path(zip_path)
+        return io.BytesIO(read_day(path.stem, path.parent)[1])
+    zf = zipfile.ZipFile(zip_path)
+    members = [n for n in zf.namelist() if n.lower().endswith(".csv")]
+    if not members:
+        zf.close()
+        raise ValueError(f"No CSV member in {zip_path}")
+    raw = zf.open(members[0])
+    zf.close()  # the member keeps the underlying file open until it is closed
+    return raw
+
+
+def open_csv(zip_path):
+    """Open the BhavCopy CSV inside a mirrored zip (or .bca archive day) as a text stream."""
+    return io.TextIOWrapper(_open_member(zip_path), encoding="utf-8", newline="")
+
+
+def _to_float(raw):
+    return float(raw) if raw else float("nan")
+
+
+def _to_int(raw):
+    return int(raw) if raw else 0
+
+
+def _to_str(raw):
+    return raw.decode()
+
+
+def _converter(name):
+    if name in FLOAT_COLUMNS:
+        return _to_float
+    if name in INT_COLUMNS:
+        return _to_int
+    return _to_str
+
+
+def _predicate(test):
+    if callable(test):
+        return lambda raw: test(raw.decode())
+    if isinstance(test, str):
+        return test.encode().__eq__
+    return frozenset(v.encode() for v in test).__contains__
+
+
+def _split(line, maxsplit):
+    line = line.rstrip(b"\r\n")
+    if b'"' in line:
+        return [f.encode() for f in next(csv.reader([line.decode()]))]
+    return line.split(b",", maxsplit)
+
+
+def read_columns(zip_path, columns, where=None):
+    """Stream tuples of the requested columns straight out of a mirrored zip.
+
+    Lines are split as bytes only up to the right-most column that is
+    projected or filtered, `where` tests run on the raw field before anything
+    is decoded, and only the projected fields are converted: floats for
+    prices (NaN when empty), ints for volumes/OI (0 when empty), str otherwise.
+
+    `where` maps a column to a value (equality), a collection of values
+    (membership, e.g. a symbol set) or a callable taking the decoded field:
+
+        read_columns(path, ("TckrSymb", "ClsPric", "TtlTradgVol"),
+                     where={"SctySrs": "EQ", "TckrSymb": required_symbols})
+    """
+    where = where or {}
+    with _open_member(zip_path) as raw:
+        header = raw.readline().rstrip(b"\r\n").decode().split(",")
+        index = {name: i for i, name in enumerate(header)}
+        missing = [c for c in (*columns, *where) if c not in index]
+        if missing:
+            raise KeyError(f"Unknown BhavCopy columns: {missing}")
+
+        projection = [(index[c], _converter(c)) for c in columns]
+        filters = [(index[c], _predicate(t)) for c, t in where.items()]
+        maxsplit = max(i for i, _ in projection + filters) + 1
+
+        rows = 0
+        try:
+            for line in raw:
+                rows += 1
+                fields = _split(line, maxsplit)
+                for i, test in filters:
+                    if not test(fields[i]):
+                        break
+                else:
+                    yield tuple(convert(fields[i]) for i, convert in projection)
+        finally:
+            inc("rows_parsed", rows)
+
+
+def _block_fields(data, width, maxsplit):
+    """Split a block of whole CSV lines into per-column lists of bytes."""
+    data = data.replace(b"\r\n", b"\n").strip(b"\n")
+    if not data:
+        return None
+    if b'"' not in data:
+        # One split for the whole block; valid when every line has `width` fields
+        flat = data.replace(b"\n", b",").split(b",")
+        if len(flat) == (data.count(b"\n") + 1) * width:
+            return [flat[i::width] for i in range(width)]
+    rows = [_split(line, maxsplit) for line in data.split(b"\n") if line]
+    return list(zip(*rows))
+
+
+def read_column_chunks(zip_path, columns, chunk_bytes=1 << 23):
+    """Stream the CSV as {column: array} chunks of about `chunk_bytes` of text.
+
+    For files too large to convert row by row (the F&O bhavcopy): each block
+    of lines is split in one pass and its columns converted in bulk with
+    NumPy - float64 (NaN when empty) and int64 (0 when empty) for numeric
+    columns, fixed-width bytes for everything else.
+    """
+    with _open_member(zip_path) as raw:
+        header = raw.readline().rstrip(b"\r\n").decode().split(",")
+        index = {name: i for i, name in enumerate(header)}
+        missing = [c for c in columns if c not in index]
+        if missing:
+            raise KeyError(f"Unknown BhavCopy columns: {missing}")
+        positions = [index[c] for c in columns]
+        maxsplit = max(positions) + 1
+
+        tail = b""
+        while True:
+            block = raw.read(chunk_bytes)
+            data = tail + block
+            if block:
+                cut = data.rfind(b"\n") + 1
+                data, tail = data[:cut], data[cut:]
+            fields = _block_fields(data, len(header), maxsplit)
+            if fields:
+                chunk = {}
+                for name, i in zip(columns, positions):
+                    values = np.array(fields[i])
+                    if name in FLOAT_COLUMNS:
+                        values = np.where(values == b"", b"nan", values).astype(np.float64)
+                    elif name in INT_COLUMNS:
+                        values = np.where(values == b"", b"0", values).astype(np.int64)
+                    chunk[name] = values
+                inc("rows_parsed", len(fields[positions[0]]))
+                yield chunk
+            if not block:
+                return
+
+
+def check_payload(payload, yyyymmdd):
+    """Validate a downloaded BhavCopy zip before it is written anywhere.
+
+    Checks the zip's CRC, a single CSV member with the 34-column UDiFF
+    header, and that every row's TradDt is the requested day. The member is
+    streamed line by line, so an F&O file is never held decompressed.
+    Returns the data row count; raises ValueError describing the first
+    problem found.
+    """
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(payload))
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Not a zip file ({len(payload)} bytes): {e}")
+    expected = f"{yyyymmdd[:4]}-{yyyymmdd[4:6]}-{yyyymmdd[6:8]}".encode()
+    rows = blank = 0
+    with zf:
+        members = [n for n in zf.namelist() if n.lower().endswith(".csv")]
+        if len(members) != 1:
+            raise ValueError(f"Expected one CSV member, found {members}")
+        try:
+            with zf.open(members[0]) as raw:
+                header = tuple(raw.readline().rstrip(b"\r\n").decode().split(","))
+                if header != COLUMNS:
+                    raise ValueError(f"Unexpected header with {len(header)} columns: {header[:5]}...")
+                prefix, tail, number = expected + b",", b"", 1
+                while True:
+                    block = raw.read(1 << 23)
+                    data, tail = tail + block, b""
+                    if block:
+                        cut = data.rfind(b"\n") + 1
+                        data, tail = data[:cut], data[cut:]
+                    lines = data.split(b"\n")
+                    if lines[-1] == b"":
+                        lines.pop()
+                    # Fast path: every line of the block is a row of the day
+                    if not blank and (b"\n" + data).count(b"\n" + prefix) == len(lines):
+                        rows += len(lines)
+                        number += len(lines)
+                        lines = []
+                    for line in lines:
+                        number += 1
+                        if not line.strip():
+                            # Trailing blank lines are fine, blank rows between data are not
+                            blank = blank or number
+                            continue
+                        at, trade_date = (blank, b"") if blank else (number, line.split(b",", 1)[0])
+                        if trade_date != expected:
+                            raise ValueError(f"Line {at}: TradDt {trade_date.decode()!r} != {expected.decode()}")
+                        rows += 1
+                    if not block:
+                        break
+        except (zipfile.BadZipFile, EOFError, zlib.error) as e:
+            raise ValueError(f"Corrupt zip member {members[0]}: {e}")
+    if not rows:
+        raise ValueError("BhavCopy has no rows")
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print selected BhavCopy columns")
+    parser.add_argument("zip_path")
+    parser.add_argument("columns", nargs="+")
+    parser.add_argument("--where", action="append", default=[],
+                        help="COLUMN=VALUE[,VALUE...] filter, may be repeated")
+    args = parser.parse_args()
+
+    where = {}
+    for clause in args.where:
+        name, _, values = clause.partition("=")
+        values = values.split(",")
+        where[name] = values[0] if len(values) == 1 else set(values)
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(args.columns)
+    writer.writerows(read_columns(args.zip_path, args.columns, where))
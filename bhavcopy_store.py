@@ -0,0 +1,330 @@
+"""
+Columnar store for the public/bhavcopy archive.
+
+Every ingested day is written twice:
+
+  store/days/YYYYMMDD.npz   self-contained typed columns for that day
+  store/history/<col>.bin   append-only raw arrays holding every day back to
+                            back, read through np.memmap
+
+store/history/meta.json records the ingested dates, the row offset of each
+day and the global dictionaries for TckrSymb/SctySrs/ISIN. It is rewritten
+last on every append, so columns longer than meta says are an interrupted
+append and get truncated on the next one.
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from bhavcopy import (
+    BHAVCOPY_DIR, DICT_COLUMNS, PRICE_COLUMNS, VOLUME_COLUMNS,
+    date_from_path, day_files, read_columns,
+)
+from instrumentation import stage
+
+# BHAVCOPY_STORE_DIR points a deployment at a store shipped elsewhere
+STORE_DIR = Path(os.environ.get("BHAVCOPY_STORE_DIR") or Path(__file__).resolve().parent / "store")
+
+DTYPES = {"TradDt": np.int32}
+DTYPES.update({name: np.int32 for name in DICT_COLUMNS})
+DTYPES.update({name: np.float64 for name in PRICE_COLUMNS})
+DTYPES.update({name: np.int64 for name in VOLUME_COLUMNS})
+
+
+def parse_day(zip_path):
+    """Parse one mirrored zip into typed columns.
+
+    Returns (trade_date, columns, dictionaries) where dictionary columns hold
+    int32 codes into the day-local value lists in `dictionaries`.
+    """
+    names = ("TradDt",) + DICT_COLUMNS + PRICE_COLUMNS + VOLUME_COLUMNS
+    with stage("parse"):
+        rows = list(read_columns(zip_path, names))
+    fields = dict(zip(names, zip(*rows))) if rows else {name: () for name in names}
+
+    trade_date = date_from_path(zip_path)
+    if rows:
+        trade_date = int(rows[0][0].replace("-", ""))
+
+    columns = {"TradDt": np.full(len(rows), trade_date, dtype=np.int32)}
+    dictionaries = {}
+    for name in DICT_COLUMNS:
+        values, codes = np.unique(np.array(fields[name], dtype=str), return_inverse=True)
+        dictionaries[name] = values.tolist()
+        columns[name] = codes.astype(np.int32)
+    for name in PRICE_COLUMNS:
+        columns[name] = np.array(fields[name], dtype=np.float64)
+    for name in VOLUME_COLUMNS:
+        columns[name] = np.array(fields[name], dtype=np.int64)
+    return trade_date, columns, dictionaries
+
+
+def parse_many(zip_paths, workers=None):
+    """Parse many zips across a process pool, yielding parse_day() results in date order.
+
+    Workers send back typed NumPy columns and the three small dictionaries,
+    which pickle as flat buffers, so results stream back as they finish.
+    workers=1 parses in this process.
+    """
+    zip_paths = sorted(zip_paths, key=date_from_path)
+    workers = min(workers or os.cpu_count() or 1, len(zip_paths) or 1)
+    if workers == 1:
+        yield from map(parse_day, zip_paths)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map() keeps input order, so each result can be merged as soon as it
+        # and everything before it are done
+        yield from pool.map(parse_day, zip_paths, chunksize=max(1, len(zip_paths) // (workers * 8)))
+
+
+def write_day(store_dir, trade_date, columns, dictionaries):
+    days_dir = Path(store_dir) / "days"
+    days_dir.mkdir(parents=True, exist_ok=True)
+    arrays = dict(columns)
+    for name, values in dictionaries.items():
+        arrays[f"{name}__values"] = np.array(values, dtype=str)
+    path = days_dir / f"{trade_date}.npz"
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def read_day(path):
+    """Load a day file back into (trade_date, columns, dictionaries)."""
+    with np.load(path) as data:
+        columns = {name: data[name] for name in DTYPES}
+        dictionaries = {name: data[f"{name}__values"].tolist() for name in DICT_COLUMNS}
+    return int(Path(path).stem), columns, dictionaries
+
+
+def _empty_meta():
+    return {"dates": [], "offsets": [0], "dicts": {name: [] for name in DICT_COLUMNS}}
+
+
+def _load_meta(history_dir):
+    meta_path = history_dir / "meta.json"
+    if not meta_path.exists():
+        return _empty_meta()
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def history_stamp(store_dir=STORE_DIR):
+    """(mtime_ns, size) of store/history/meta.json, or None; changes on every append or rebuild."""
+    try:
+        st = (Path(store_dir) / "history" / "meta.json").stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _save_meta(history_dir, meta):
+    meta_path = history_dir / "meta.json"
+    tmp = meta_path.with_name("meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+
+def _append(history_dir, meta, trade_date, columns, dictionaries):
+    n_rows = meta["offsets"][-1]
+    for name, dtype in DTYPES.items():
+        path = history_dir / f"{name}.bin"
+        with open(path, "ab") as f:
+            # Drop the tail of an append that died before meta.json was saved
+            f.truncate(n_rows * np.dtype(dtype).itemsize)
+            values = columns[name]
+            if name in dictionaries:
+                lookup = {v: i for i, v in enumerate(meta["dicts"][name])}
+                remap = np.empty(len(dictionaries[name]), dtype=np.int32)
+                for local, value in enumerate(dictionaries[name]):
+                    if value not in lookup:
+                        lookup[value] = len(meta["dicts"][name])
+                        meta["dicts"][name].append(value)
+                    remap[local] = lookup[value]
+                values = remap[values]
+            f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+    meta["dates"].append(trade_date)
+    meta["offsets"].append(n_rows + len(columns["TradDt"]))
+
+
+def _reset_history(store_dir):
+    history_dir = Path(store_dir) / "history"
+    history_dir.mkdir(parents=True, exist_ok=True)
+    for name in DTYPES:
+        (history_dir / f"{name}.bin").unlink(missing_ok=True)
+    return history_dir, _empty_meta()
+
+
+def rebuild_history(store_dir=STORE_DIR):
+    """Recreate store/history from the day files, in date order."""
+    history_dir, meta = _reset_history(store_dir)
+    for path in sorted((Path(store_dir) / "days").glob("*.npz")):
+        _append(history_dir, meta, *read_day(path))
+    _save_meta(history_dir, meta)
+    return meta
+
+
+def rebuild_from_zips(bhavcopy_dir=BHAVCOPY_DIR, store_dir=STORE_DIR, workers=None):
+    """Re-derive every day file and the history from the mirrored days in parallel."""
+    history_dir, meta = _reset_history(store_dir)
+    for parsed in parse_many(day_files(bhavcopy_dir), workers):
+        write_day(store_dir, *parsed)
+        _append(history_dir, meta, *parsed)
+    _save_meta(history_dir, meta)
+    return meta
+
+
+def append_history(store_dir, trade_date, columns, dictionaries):
+    """Add a parsed day to the history. Days already present are skipped."""
+    history_dir = Path(store_dir) / "history"
+    history_dir.mkdir(parents=True, exist_ok=True)
+    meta = _load_meta(history_dir)
+    if trade_date in meta["dates"]:
+        return False
+    if meta["dates"] and trade_date < meta["dates"][-1]:
+        # History is append-only in date order; an older day means a rebuild
+        rebuild_history(store_dir)
+        return True
+    _append(history_dir, meta, trade_date, columns, dictionaries)
+    _save_meta(history_dir, meta)
+    return True
+
+
+def ingest_zip(zip_path, store_dir=STORE_DIR):
+    """Convert one mirrored zip into a day file and append it to the history."""
+    trade_date, columns, dictionaries = parse_day(zip_path)
+    with stage("store_write"):
+        write_day(store_dir, trade_date, columns, dictionaries)
+        added = append_history(store_dir, trade_date, columns, dictionaries)
+    return trade_date, added
+
+
+def ingest_all(bhavcopy_dir=BHAVCOPY_DIR, store_dir=STORE_DIR, workers=1):
+    """Ingest every mirrored day (see day_files) that has no day file yet.
+
+    With workers other than 1 the days are parsed in a process pool
+    (workers=None uses every core); appends still happen in date order.
+    """
+    days_dir = Path(store_dir) / "days"
+    pending = [p for p in day_files(bhavcopy_dir)
+               if not (days_dir / f"{p.stem}.npz").exists()]
+    ingested = []
+    for trade_date, columns, dictionaries in parse_many(pending, workers):
+        write_day(store_dir, trade_date, columns, dictionaries)
+        append_history(store_dir, trade_date, columns, dictionaries)
+        ingested.append(trade_date)
+    return ingested
+
+
+class History:
+    """Read-only, memory-mapped view over store/history."""
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.history_dir = Path(store_dir) / "history"
+        meta = _load_meta(self.history_dir)
+        self.dates = np.array(meta["dates"], dtype=np.int32)
+        self.offsets = np.array(meta["offsets"], dtype=np.int64)
+        self.dicts = meta["dicts"]
+        self.n_rows = int(self.offsets[-1])
+        self._columns = {}
+        self._codes = {}
+
+    def __len__(self):
+        return self.n_rows
+
+    def column(self, name):
+        if name not in self._columns:
+            if self.n_rows == 0:
+                self._columns[name] = np.empty(0, dtype=DTYPES[name])
+            else:
+                self._columns[name] = np.memmap(
+                    self.history_dir / f"{name}.bin", dtype=DTYPES[name],
+                    mode="r", shape=(self.n_rows,),
+                )
+        return self._columns[name]
+
+    def code(self, name, value):
+        """Dictionary code of a TckrSymb/SctySrs/ISIN value, or -1."""
+        if name not in self._codes:
+            self._codes[name] = {v: i for i, v in enumerate(self.dicts[name])}
+        return self._codes[name].get(value, -1)
+
+    def day_slice(self, trade_date):
+        i = int(np.searchsorted(self.dates, trade_date))
+        if i == len(self.dates) or self.dates[i] != trade_date:
+            raise KeyError(trade_date)
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def rows(self, start=None, end=None, series=None):
+        """Row slice covering [start, end] plus an optional series mask."""
+        lo = 0 if start is None else int(np.searchsorted(self.dates, start))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, end, side="right"))
+        sl = slice(int(self.offsets[lo]), int(self.offsets[hi]))
+        mask = None
+        if series is not None:
+            codes = [self.code("SctySrs", s) for s in ([series] if isinstance(series, str) else series)]
+            mask = np.isin(self.column("SctySrs")[sl], codes)
+        return sl, mask
+
+    def ohlcv(self, start=None, end=None, series="EQ"):
+        """Date, symbol code, OHLC and volume columns for a date range."""
+        sl, mask = self.rows(start, end, series)
+        names = ("TradDt", "TckrSymb", "OpnPric", "HghPric", "LwPric", "ClsPric", "TtlTradgVol")
+        out = {}
+        for name in names:
+            values = self.column(name)[sl]
+            out[name] = values[mask] if mask is not None else np.asarray(values)
+        return out
+
+    def pivot(self, name, start=None, end=None, series="EQ"):
+        """Dense (dates x symbols) matrix of a numeric column.
+
+        Returns (dates, symbol_codes, matrix); cells with no row are NaN.
+        """
+        sl, mask = self.rows(start, end, series)
+        day = self.column("TradDt")[sl]
+        sym = self.column("TckrSymb")[sl]
+        values = self.column(name)[sl]
+        if mask is not None:
+            day, sym, values = day[mask], sym[mask], values[mask]
+        dates, day_idx = np.unique(day, return_inverse=True)
+        symbols, sym_idx = np.unique(sym, return_inverse=True)
+        matrix = np.full((len(dates), len(symbols)), np.nan)
+        matrix[day_idx, sym_idx] = values
+        return dates, symbols, matrix
+
+    def symbols(self, codes):
+        names = self.dicts["TckrSymb"]
+        return [names[c] for c in codes]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build the columnar store from public/bhavcopy")
+    parser.add_argument("--rebuild", action="store_true", help="re-derive everything from the zips")
+    parser.add_argument("--workers", type=int, help="parse processes (default: all cores)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.rebuild:
+        meta = rebuild_from_zips(workers=args.workers)
+        print(f"✅ Rebuilt {len(meta['dates'])} days ({meta['offsets'][-1]} rows) in "
+              f"{time.perf_counter() - start:.2f}s")
+    else:
+        added = ingest_all(workers=args.workers)
+        print(f"✅ Ingested {len(added)} new days in {time.perf_counter() - start:.2f}s")
+
+    history = History()
+    start = time.perf_counter()
+    dates, symbols, closes = history.pivot("ClsPric")
+    print(f"📈 {closes.shape[0]} days x {closes.shape[1]} symbols scanned in "
+          f"{(time.perf_counter() - start) * 1000:.1f}ms")
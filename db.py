@@ -0,0 +1,257 @@
+"""
+Shared Postgres access: a bounded connection pool, prepared hot queries and
+batched writes.
+
+Loaders, jobs and the API borrow connections from one pool per role instead
+of connecting per unit of work:
+
+    db = get_database("api")
+    db.latest_close(["RELIANCE", "TCS"])      # {symbol: (trade_date, close)}
+    db.price_window("RELIANCE", 200)          # last 200 sessions, oldest first
+    await db.run_async(db.price_window, "RELIANCE", 200)
+
+    with get_database("ingest").connection() as conn:
+        load_bhavcopy(conn, zip_path)
+
+The DSN comes from DATABASE_URL_<ROLE> (e.g. DATABASE_URL_API for a read
+replica), then DATABASE_URL, then DEFAULT_DSN; libpq fills in anything
+missing (user, password) from the usual PG* variables and ~/.pgpass.
+DATABASE_POOL_SIZE caps connections per role. Database(connect=...) takes
+any DB-API connection factory, so a local Postgres or a stand-in such as
+bulk_loader.StubConnection can be swapped in.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+
+from instrumentation import inc, stage
+
+DEFAULT_DSN = "host=localhost port=5432 dbname=markets"
+POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", "8"))
+
+# name -> (argument types, query); prepared once per pooled connection
+STATEMENTS = {
+    "latest_close": ("text[], text", '''
+        SELECT DISTINCT ON (symbol) symbol, "tradeDate", close
+        FROM "DailyPrice"
+        WHERE symbol = ANY($1) AND series = $2
+        ORDER BY symbol, "tradeDate" DESC
+    '''),
+    "price_window": ("text, text, int", '''
+        SELECT "tradeDate", open, high, low, close, volume
+        FROM "DailyPrice"
+        WHERE symbol = $1 AND series = $2
+        ORDER BY "tradeDate" DESC
+        LIMIT $3
+    '''),
+}
+
+
+def dsn_for(role=None):
+    if role:
+        dsn = os.environ.get(f"DATABASE_URL_{role.upper()}")
+        if dsn:
+            return dsn
+    return os.environ.get("DATABASE_URL") or DEFAULT_DSN
+
+
+def _pg_connect(dsn):
+    import psycopg2
+
+    return psycopg2.connect(dsn)
+
+
+def unavailable_errors():
+    """Exceptions meaning the database could not answer: no driver, no free
+    connection within the pool timeout, or a psycopg2 error."""
+    try:
+        import psycopg2
+    except ImportError:
+        return ImportError, TimeoutError
+    return ImportError, TimeoutError, psycopg2.Error
+
+
+class Pool:
+    """At most `maxconn` connections; get() blocks up to `timeout` for a free one."""
+
+    def __init__(self, connect, maxconn=POOL_SIZE, timeout=30.0):
+        self._connect = connect
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._idle = []
+        self.in_use = 0
+
+    def get(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No database connection free after {self.timeout}s")
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            self.in_use += 1
+        if conn is None:
+            try:
+                conn = self._connect()
+            except BaseException:
+                self._release()
+                raise
+            inc("db_connections_opened")
+        return conn
+
+    def put(self, conn, discard=False):
+        if discard or getattr(conn, "closed", False):
+            try:
+                conn.close()
+            except Exception:
+                pass
+            conn = None
+        with self._lock:
+            if conn is not None:
+                self._idle.append(conn)
+        self._release()
+
+    def _release(self):
+        with self._lock:
+            self.in_use -= 1
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {"max": self.maxconn, "idle": len(self._idle), "in_use": self.in_use}
+
+
+class Database:
+    def __init__(self, dsn=None, connect=None, maxconn=POOL_SIZE, timeout=30.0):
+        if connect is None:
+            connect = partial(_pg_connect, dsn or dsn_for())
+        self.pool = Pool(connect, maxconn, timeout)
+        self._prepared = {}
+        self._prepared_lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection. Commit what you write; anything left open is rolled back."""
+        conn = self.pool.get()
+        discard = False
+        try:
+            yield conn
+        finally:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            if discard:
+                with self._prepared_lock:
+                    self._prepared.pop(id(conn), None)
+            self.pool.put(conn, discard)
+
+    def _execute_prepared(self, conn, cur, name, params):
+        with self._prepared_lock:
+            prepared = self._prepared.setdefault(id(conn), set())
+        if name not in prepared:
+            types, sql = STATEMENTS[name]
+            cur.execute(f"PREPARE {name} ({types}) AS {sql}")
+            prepared.add(name)
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+
+    def fetch(self, sql, params=None):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def fetch_prepared(self, name, *params):
+        with stage("db_query", statement=name), self.connection() as conn, conn.cursor() as cur:
+            self._execute_prepared(conn, cur, name, params)
+            return cur.fetchall()
+
+    def latest_close(self, symbols, series="EQ"):
+        """{symbol: (trade_date, close)} for the most recent stored session of each symbol."""
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        rows = self.fetch_prepared("latest_close", symbols, series)
+        return {symbol: (day, close) for symbol, day, close in rows}
+
+    def price_window(self, symbol, days, series="EQ"):
+        """[(trade_date, open, high, low, close, volume), ...] for the last `days` sessions."""
+        return self.fetch_prepared("price_window", symbol, series, days)[::-1]
+
+    def executemany(self, sql, rows, page_size=1000):
+        """Run `sql` for every row in one transaction, `page_size` rows per round trip."""
+        count = 0
+        rows = iter(rows)
+        with self.connection() as conn, conn.cursor() as cur:
+            while batch := list(islice(rows, page_size)):
+                if hasattr(cur, "mogrify"):
+                    # psycopg2: many statements per round trip instead of one each
+                    from psycopg2.extras import execute_batch
+                    execute_batch(cur, sql, batch, page_size=page_size)
+                else:
+                    cur.executemany(sql, batch)
+                count += len(batch)
+            conn.commit()
+        return count
+
+    def copy(self, table, columns, rows):
+        """COPY `rows` straight into `table` and commit; returns the row count."""
+        from bulk_loader import copy_rows
+
+        with self.connection() as conn, conn.cursor() as cur:
+            count = copy_rows(cur, table, columns, rows)
+            conn.commit()
+        inc("rows_inserted", count, table=table)
+        return count
+
+    async def run_async(self, fn, *args, **kwargs):
+        """Await a blocking call on a worker thread; the pool bounds how many run at once."""
+        import asyncio
+
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def close(self):
+        self.pool.close()
+        with self._prepared_lock:
+            self._prepared.clear()
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(role=None):
+    """The process-wide Database for a role ("api", "ingest", ...)."""
+    with _databases_lock:
+        if role not in _databases:
+            _databases[role] = Database(dsn_for(role))
+        return _databases[role]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Query prices through the pooled database layer")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--days", type=int, default=0, help="also print the last N sessions")
+    parser.add_argument("--series", default="EQ")
+    args = parser.parse_args()
+
+    db = get_database()
+    for _ in range(2):
+        # The second pass reuses the pooled connection and prepared statements
+        start = time.perf_counter()
+        closes = db.latest_close(args.symbols, args.series)
+        print(f"⚡ latest_close in {(time.perf_counter() - start) * 1000:.2f}ms")
+    for symbol in args.symbols:
+        print(f"📅 {symbol}: {closes.get(symbol)}")
+        if args.days:
+            for row in db.price_window(symbol, args.days, args.series):
+                print("   ", *row)
+    db.close()
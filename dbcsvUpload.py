@@ -1,68 +1,54 @@
-import psycopg2
 import csv
 
-# PostgreSQL credentials
-DB_HOST = "localhost"
-DB_PORT = "5432"
-DB_NAME = "markets"
-DB_USER = "Kavish"
-DB_PASSWORD = "97642654875"
+from bulk_loader import load_symbols
+from db import get_database
 
 CSV_FILE_PATH = "/Users/kavishambani/Downloads/ind_nifty200list(1).csv"
 
-try:
-    conn = psycopg2.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD
-    )
-    cur = conn.cursor()
-    print("✅ Connected to database.")
-except Exception as conn_err:
-    print("❌ Database connection failed:", conn_err)
-    exit(1)
+REQUIRED_FIELDS = ["ISIN Code", "Company Name", "Industry", "Symbol", "Series"]
 
-row_count = 0
-try:
-    with open(CSV_FILE_PATH, 'r', encoding='utf-8') as f:
+
+def symbol_rows(csv_path):
+    """Yield cleaned (isin, symbol, companyName, industry, series) rows from an NSE index list CSV."""
+    with open(csv_path, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         reader.fieldnames = [h.strip() for h in reader.fieldnames]
 
-        required_fields = ["ISIN Code", "Company Name", "Industry", "Symbol", "Series"]
-        field_map = {name: name for name in reader.fieldnames}
-
-        for field in required_fields:
-            if field not in field_map:
+        for field in REQUIRED_FIELDS:
+            if field not in reader.fieldnames:
                 raise Exception(f"Missing column in CSV: '{field}'")
 
         for row in reader:
             # Skip rows missing essential data
-            if not all(row.get(field_map[key]) for key in ["ISIN Code", "Company Name", "Industry", "Symbol"]):
+            if not all(row.get(key) for key in ["ISIN Code", "Company Name", "Industry", "Symbol"]):
                 continue
 
-            cur.execute('''
-                INSERT INTO "StockSymbol" (isin, symbol, "companyName", industry, series)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (isin) DO NOTHING
-            ''', (
-                row[field_map["ISIN Code"]].strip(),
-                row[field_map["Symbol"]].strip(),
-                row[field_map["Company Name"]].strip(),
-                row[field_map["Industry"]].strip(),
-                row[field_map["Series"]].strip() if row.get(field_map["Series"]) else ''
-            ))
-            row_count += 1
+            yield (
+                row["ISIN Code"].strip(),
+                row["Symbol"].strip(),
+                row["Company Name"].strip(),
+                row["Industry"].strip(),
+                row["Series"].strip() if row.get("Series") else ''
+            )
+
+
+def main():
+    database = get_database("ingest")
+    try:
+        with database.connection() as conn:
+            print("✅ Connected to database.")
+            stats = load_symbols(conn, symbol_rows(CSV_FILE_PATH))
+            print(f"✅ Successfully uploaded {stats['rows']} rows to the database "
+                  f"({stats['inserted']} new).")
+
+    except Exception as e:
+        # Anything uncommitted was rolled back when the connection went back to the pool
+        print("❌ Error during data processing/upload:", e)
 
-    conn.commit()
-    print(f"✅ Successfully uploaded {row_count} rows to the database.")
+    finally:
+        database.close()
+        print("🔒 Database connection closed.")
 
-except Exception as e:
-    conn.rollback()
-    print("❌ Error during data processing/upload:", e)
 
-finally:
-    cur.close()
-    conn.close()
-    print("🔒 Database connection closed.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+F&O BhavCopy ingest and option-chain aggregates.
+
+The F&O UDiFF file has the same 34 columns as the CM one but several hundred
+thousand rows a day. It is read in chunks through
+bhavcopy.read_column_chunks() and reduced with NumPy at ingest time into
+indexed SQLite tables in store/fo.db:
+
+  option_chain     per (date, underlying, expiry, strike): CE/PE OI, OI
+                   change, volume and close
+  option_summary   per (date, underlying, expiry): OI totals, put-call
+                   ratio, max pain, OI change
+  futures_buildup  per (date, underlying, expiry): price and OI change
+                   classified as long/short buildup, short covering or
+                   long unwinding
+
+Every table is keyed so that a chain or summary lookup for one underlying is
+a primary-key range scan.
+
+    python fno.py ingest store/fo/20250703.zip
+    python fno.py chain NIFTY --expiry 20250731
+"""
+
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+from bhavcopy import read_column_chunks
+from bhavcopy_store import STORE_DIR
+from instrumentation import inc, stage
+
+NSE_ARCHIVES = "https://nsearchives.nseindia.com"
+
+FO_ZIP_DIR = STORE_DIR / "fo"
+FO_DB = STORE_DIR / "fo.db"
+
+OPTION_TYPES = {"IDO", "STO"}
+FUTURE_TYPES = {"IDF", "STF"}
+
+SOURCE_COLUMNS = ("TradDt", "FinInstrmTp", "TckrSymb", "XpryDt", "StrkPric", "OptnTp",
+                  "ClsPric", "PrvsClsgPric", "UndrlygPric", "OpnIntrst", "ChngInOpnIntrst",
+                  "TtlTradgVol")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS option_chain (
+    trade_date INTEGER, symbol TEXT, expiry INTEGER, strike REAL,
+    ce_oi INTEGER, pe_oi INTEGER, ce_oi_chg INTEGER, pe_oi_chg INTEGER,
+    ce_volume INTEGER, pe_volume INTEGER, ce_close REAL, pe_close REAL,
+    PRIMARY KEY (symbol, trade_date, expiry, strike)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS option_summary (
+    trade_date INTEGER, symbol TEXT, expiry INTEGER, underlying REAL,
+    ce_oi INTEGER, pe_oi INTEGER, pcr REAL, max_pain REAL,
+    ce_oi_chg INTEGER, pe_oi_chg INTEGER,
+    PRIMARY KEY (symbol, trade_date, expiry)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS futures_buildup (
+    trade_date INTEGER, symbol TEXT, expiry INTEGER, close REAL, prev_close REAL,
+    price_chg_pct REAL, oi INTEGER, oi_chg INTEGER, buildup TEXT,
+    PRIMARY KEY (symbol, trade_date, expiry)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_option_summary_date ON option_summary (trade_date, symbol);
+CREATE INDEX IF NOT EXISTS idx_futures_buildup_date ON futures_buildup (trade_date, buildup);
+"""
+
+
+def fo_bhavcopy_url(yyyymmdd, base_url=NSE_ARCHIVES):
+    return f"{base_url}/content/fo/BhavCopy_NSE_FO_0_0_0_{yyyymmdd}_F_0000.csv.zip"
+
+
+def open_db(path=FO_DB):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.executescript(SCHEMA)
+    return db
+
+
+def stored_fo_dates(db_path=FO_DB):
+    """Trade dates already aggregated into fo.db."""
+    if not Path(db_path).exists():
+        return set()
+    db = open_db(db_path)
+    try:
+        return {r[0] for r in db.execute("SELECT DISTINCT trade_date FROM option_summary")}
+    finally:
+        db.close()
+
+
+def max_pain(strikes, ce_oi, pe_oi):
+    """Strike at which option writers pay out the least at expiry."""
+    strikes = np.asarray(strikes, dtype=float)
+    settle = strikes[:, None]
+    # payout[s] = sum over strikes k of CE OI * (s - k)+ + PE OI * (k - s)+
+    payout = (np.maximum(settle - strikes, 0) @ np.asarray(ce_oi, dtype=float)
+              + np.maximum(strikes - settle, 0) @ np.asarray(pe_oi, dtype=float))
+    return float(strikes[np.argmin(payout)])
+
+
+def buildup(price_change, oi_change):
+    if oi_change > 0:
+        return "long_buildup" if price_change >= 0 else "short_buildup"
+    if oi_change < 0:
+        return "short_covering" if price_change >= 0 else "long_unwinding"
+    return "neutral"
+
+
+def _dates(values):
+    """b"2025-07-31" byte strings to YYYYMMDD ints (0 when empty)."""
+    values = np.asarray(values, dtype="S10")
+    digits = values.view(np.uint8).reshape(-1, 10)[:, [0, 1, 2, 3, 5, 6, 8, 9]].astype(np.int64) - 48
+    return np.where(values == b"", 0, digits @ 10 ** np.arange(7, -1, -1))
+
+
+def _group_starts(*keys):
+    """Start offsets of runs of equal keys in already sorted arrays, plus the end."""
+    change = np.zeros(len(keys[0]), dtype=bool)
+    change[0] = True
+    for key in keys:
+        change[1:] |= key[1:] != key[:-1]
+    return np.append(np.flatnonzero(change), len(change))
+
+
+def _last_quoted(values, group, n):
+    """Per group, the last non-NaN value in row order (NaN when none)."""
+    out = np.full((n,) + values.shape[1:], np.nan)
+    quoted = np.nonzero(~np.isnan(values))
+    out[(group[quoted[0]],) + quoted[1:]] = values[quoted]
+    return out
+
+
+def _reduce(symbol, expiry, strike, totals, close, spot):
+    """Collapse rows sharing (symbol, expiry, strike), sorted by that key.
+
+    totals (n, 3, 2) are OI, OI change and volume for CE and PE and add up;
+    close (n, 2) and the underlying price keep the last quote.
+    """
+    order = np.lexsort((strike, expiry, symbol))
+    symbol, expiry, strike = symbol[order], expiry[order], strike[order]
+    starts = _group_starts(symbol, expiry, strike)
+    n = len(starts) - 1
+    group = np.repeat(np.arange(n), np.diff(starts))
+    keys = starts[:-1]
+    return (symbol[keys], expiry[keys], strike[keys], np.add.reduceat(totals[order], keys, axis=0),
+            _last_quoted(close[order], group, n), _last_quoted(spot[order], group, n))
+
+
+def aggregate(zip_path):
+    """Reduce an F&O zip to (trade_date, chain_rows, summary_rows, futures_rows).
+
+    Each chunk is reduced to one row per (symbol, expiry, strike) as it is
+    read, so only the partial sums are held rather than the day's rows.
+    """
+    kinds = np.array(sorted(OPTION_TYPES | FUTURE_TYPES), dtype="S")
+    future_kinds = np.array(sorted(FUTURE_TYPES), dtype="S")
+    trade_date, futures, partials, codes = None, [], [], {}
+    for chunk in read_column_chunks(zip_path, SOURCE_COLUMNS):
+        rows = {name: values[np.isin(chunk["FinInstrmTp"], kinds)] for name, values in chunk.items()}
+        if not len(rows["TradDt"]):
+            continue
+        if trade_date is None:
+            trade_date = int(_dates(rows["TradDt"][:1])[0])
+        expiry = _dates(rows["XpryDt"])
+        is_future = np.isin(rows["FinInstrmTp"], future_kinds)
+
+        for i in np.flatnonzero(is_future):
+            close, prev_close = float(rows["ClsPric"][i]), float(rows["PrvsClsgPric"][i])
+            oi, oi_chg = int(rows["OpnIntrst"][i]), int(rows["ChngInOpnIntrst"][i])
+            pct = (close - prev_close) / prev_close * 100 if prev_close else 0.0
+            futures.append((trade_date, rows["TckrSymb"][i].decode(), int(expiry[i]), close, prev_close,
+                            round(pct, 4), oi, oi_chg, buildup(close - prev_close, oi_chg)))
+
+        options = np.flatnonzero(~is_future)
+        if not len(options):
+            continue
+        # Symbols as small ints shared across chunks
+        names, inverse = np.unique(rows["TckrSymb"][options], return_inverse=True)
+        symbol = np.array([codes.setdefault(name, len(codes)) for name in names.tolist()])[inverse]
+        side = (rows["OptnTp"][options] != b"CE").astype(np.int64)  # 0 = CE, 1 = PE
+        n = len(options)
+        totals = np.zeros((n, 3, 2), dtype=np.int64)
+        close = np.full((n, 2), np.nan)
+        for k, column in enumerate(("OpnIntrst", "ChngInOpnIntrst", "TtlTradgVol")):
+            totals[np.arange(n), k, side] = rows[column][options]
+        close[np.arange(n), side] = rows["ClsPric"][options]
+        partials.append(_reduce(symbol, expiry[options], rows["StrkPric"][options], totals, close,
+                                rows["UndrlygPric"][options]))
+    if trade_date is None:
+        return None, [], [], []
+    if not partials:
+        return trade_date, [], [], futures
+
+    # Renumber symbols alphabetically so rows come out in (symbol, expiry, strike) order
+    names = sorted(codes)
+    rank = np.empty(len(names), dtype=np.int64)
+    rank[[codes[name] for name in names]] = np.arange(len(names))
+    symbol, expiry, strike, totals, close, spot = _reduce(
+        rank[np.concatenate([p[0] for p in partials])],
+        *(np.concatenate([p[i] for p in partials]) for i in range(1, 6)))
+    n = len(symbol)
+
+    # One output row per (symbol, expiry, strike); CE and PE land in separate columns
+    g_symbol = [names[code].decode() for code in symbol.tolist()]
+    g_expiry, g_strike = expiry.tolist(), strike.tolist()
+    ce_close = [None if c != c else c for c in close[:, 0].tolist()]
+    pe_close = [None if c != c else c for c in close[:, 1].tolist()]
+    chain_rows = list(zip(
+        [trade_date] * n, g_symbol, g_expiry, g_strike,
+        totals[:, 0, 0].tolist(), totals[:, 0, 1].tolist(),
+        totals[:, 1, 0].tolist(), totals[:, 1, 1].tolist(),
+        totals[:, 2, 0].tolist(), totals[:, 2, 1].tolist(),
+        ce_close, pe_close))
+
+    # Underlying price: last non-empty value quoted for each (symbol, expiry)
+    summary_rows = []
+    expiry_starts = _group_starts(symbol, expiry)
+    for a, b in zip(expiry_starts[:-1], expiry_starts[1:]):
+        oi = totals[a:b, 0]
+        total_ce, total_pe = int(oi[:, 0].sum()), int(oi[:, 1].sum())
+        quoted = spot[a:b]
+        quoted = quoted[~np.isnan(quoted)]
+        summary_rows.append((
+            trade_date, g_symbol[a], g_expiry[a], float(quoted[-1]) if len(quoted) else None,
+            total_ce, total_pe, round(total_pe / total_ce, 4) if total_ce else None,
+            max_pain(g_strike[a:b], oi[:, 0], oi[:, 1]) if total_ce or total_pe else None,
+            int(totals[a:b, 1, 0].sum()), int(totals[a:b, 1, 1].sum()),
+        ))
+    return trade_date, chain_rows, summary_rows, futures
+
+
+def ingest_fo(zip_path, db_path=FO_DB):
+    """Aggregate one F&O day into fo.db, replacing anything stored for that date."""
+    with stage("fo_parse"):
+        trade_date, chain_rows, summary_rows, futures_rows = aggregate(zip_path)
+    if trade_date is None:
+        raise ValueError(f"No F&O rows in {zip_path}")
+    db = open_db(db_path)
+    try:
+        with stage("fo_write"), db:
+            for table in ("option_chain", "option_summary", "futures_buildup"):
+                db.execute(f"DELETE FROM {table} WHERE trade_date = ?", (trade_date,))
+            db.executemany(f"INSERT INTO option_chain VALUES ({', '.join('?' * 12)})", chain_rows)
+            db.executemany(f"INSERT INTO option_summary VALUES ({', '.join('?' * 10)})", summary_rows)
+            db.executemany(f"INSERT INTO futures_buildup VALUES ({', '.join('?' * 9)})", futures_rows)
+    finally:
+        db.close()
+    inc("fo_rows_stored", len(chain_rows), table="option_chain")
+    return {"trade_date": trade_date, "strikes": len(chain_rows),
+            "expiries": len(summary_rows), "futures": len(futures_rows)}
+
+
+class OptionChains:
+    """Read side of fo.db."""
+
+    def __init__(self, db_path=FO_DB):
+        self.db = open_db(db_path)
+        self.db.row_factory = sqlite3.Row
+
+    def latest_date(self, symbol):
+        row = self.db.execute("SELECT MAX(trade_date) FROM option_summary WHERE symbol = ?",
+                              (symbol,)).fetchone()
+        return row[0]
+
+    def _date(self, symbol, trade_date):
+        return trade_date or self.latest_date(symbol)
+
+    def expiries(self, symbol, trade_date=None):
+        trade_date = self._date(symbol, trade_date)
+        return [r[0] for r in self.db.execute(
+            "SELECT expiry FROM option_summary WHERE symbol = ? AND trade_date = ? ORDER BY expiry",
+            (symbol, trade_date))]
+
+    def chain(self, symbol, expiry=None, trade_date=None):
+        """OI by strike for one expiry (the nearest when not given)."""
+        trade_date = self._date(symbol, trade_date)
+        if expiry is None:
+            expiries = self.expiries(symbol, trade_date)
+            if not expiries:
+                return trade_date, None, []
+            expiry = expiries[0]
+        rows = self.db.execute(
+            "SELECT strike, ce_oi, pe_oi, ce_oi_chg, pe_oi_chg, ce_volume, pe_volume, "
+            "ce_close, pe_close FROM option_chain "
+            "WHERE symbol = ? AND trade_date = ? AND expiry = ? ORDER BY strike",
+            (symbol, trade_date, expiry))
+        return trade_date, expiry, [dict(r) for r in rows]
+
+    def summary(self, symbol, trade_date=None):
+        """PCR, max pain and OI totals for every expiry of one underlying."""
+        trade_date = self._date(symbol, trade_date)
+        rows = self.db.execute(
+            "SELECT * FROM option_summary WHERE symbol = ? AND trade_date = ? ORDER BY expiry",
+            (symbol, trade_date))
+        return [dict(r) for r in rows]
+
+    def buildup(self, trade_date=None, kind=None):
+        """Futures classified by price/OI change for a day, optionally one buildup kind."""
+        if trade_date is None:
+            trade_date = self.db.execute("SELECT MAX(trade_date) FROM futures_buildup").fetchone()[0]
+        sql = "SELECT * FROM futures_buildup WHERE trade_date = ?"
+        params = [trade_date]
+        if kind is not None:
+            sql += " AND buildup = ?"
+            params.append(kind)
+        return [dict(r) for r in self.db.execute(sql + " ORDER BY ABS(oi_chg) DESC", params)]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="F&O bhavcopy ingest and option-chain queries")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest")
+    ingest.add_argument("zips", nargs="+")
+    chain = sub.add_parser("chain")
+    chain.add_argument("symbol")
+    chain.add_argument("--expiry", type=int)
+    chain.add_argument("--date", type=int)
+    summary = sub.add_parser("summary")
+    summary.add_argument("symbol")
+    summary.add_argument("--date", type=int)
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        for path in args.zips:
+            start = time.perf_counter()
+            stats = ingest_fo(path)
+            print(f"✅ {path}: {stats} in {time.perf_counter() - start:.2f}s")
+    elif args.command == "chain":
+        trade_date, expiry, rows = OptionChains().chain(args.symbol, args.expiry, args.date)
+        print(f"📅 {args.symbol} {trade_date} expiry {expiry}")
+        for row in rows:
+            print(json.dumps(row))
+    else:
+        for row in OptionChains().summary(args.symbol, args.date):
+            print(json.dumps(row))
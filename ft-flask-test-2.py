@@ -8,8 +8,13 @@ import requests
 import json
 import time
 import sys
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 
 # Configure logging
@@ -347,6 +352,242 @@ class APITester:
         logger.info(f"\nDetailed results saved to: test_results.json")
 
 
+# Default traffic mix for load mode: name -> (weight, method, endpoint, payload)
+DEFAULT_MIX = {
+    'sma-nearby': (6, 'POST', '/v1/analytics/sma-nearby', {'sma_period': 50, 'threshold_pct': 2.0}),
+    'health-detailed': (3, 'GET', '/v1/health/detailed', None),
+    'bhavcopy': (1, 'POST', '/v1/bhavcopy', None),
+}
+
+# Upper bounds (ms) of the latency histogram buckets
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class LatencyStats:
+    """Thread-safe latency/error accumulator with a fixed-bucket histogram"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.status_codes = {}
+        self.errors = 0
+
+    def record(self, latency: float, status_code: int, error: bool):
+        with self.lock:
+            self.latencies.append(latency)
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+            if error:
+                self.errors += 1
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            count = len(latencies)
+            histogram = {f"<={b}ms": 0 for b in HISTOGRAM_BUCKETS_MS}
+            histogram[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] = 0
+            for latency in latencies:
+                ms = latency * 1000
+                for bucket in HISTOGRAM_BUCKETS_MS:
+                    if ms <= bucket:
+                        histogram[f"<={bucket}ms"] += 1
+                        break
+                else:
+                    histogram[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] += 1
+
+            def pct(p):
+                if not latencies:
+                    return None
+                return round(latencies[min(count - 1, int(p / 100 * count))] * 1000, 2)
+
+            return {
+                'requests': count,
+                'errors': self.errors,
+                'error_rate': round(self.errors / count, 4) if count else 0.0,
+                'throughput_rps': round(count / duration, 2) if duration else 0.0,
+                'latency_ms': {'p50': pct(50), 'p95': pct(95), 'p99': pct(99),
+                               'max': pct(100)},
+                'histogram': histogram,
+                'status_codes': {str(k): v for k, v in sorted(self.status_codes.items())},
+            }
+
+
+class LoadTester:
+    """Drive a weighted mix of endpoints from many concurrent workers.
+
+    Without a target rate every worker sends back-to-back requests (closed
+    loop). With `target_rps` or a `ramp` schedule of (seconds, rps) stages a
+    dispatcher issues requests on a fixed timetable (open loop), so slow
+    responses show up as latency instead of lowering the offered load.
+    Open-loop latency runs from each request's scheduled send time, so time
+    spent queued behind busy workers counts too (no coordinated omission).
+    """
+
+    def __init__(self, base_url: str, workers: int = 16, duration: float = 30.0,
+                 mix: Optional[Dict[str, Tuple]] = None, target_rps: Optional[float] = None,
+                 ramp: Optional[List[Tuple[float, float]]] = None):
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers
+        self.duration = duration
+        self.mix = mix or DEFAULT_MIX
+        self.ramp = ramp or ([(duration, target_rps)] if target_rps is not None else None)
+        if self.ramp and any(rps <= 0 for _, rps in self.ramp):
+            raise ValueError("Every ramp stage needs a positive rps")
+        self.local = threading.local()
+        self.stats = {name: LatencyStats() for name in self.mix}
+        self.overall = LatencyStats()
+        names = list(self.mix)
+        self.choices = names
+        self.weights = [self.mix[n][0] for n in names]
+
+    def session(self) -> requests.Session:
+        """One pooled keep-alive session per worker thread"""
+        if not hasattr(self.local, 'session'):
+            session = requests.Session()
+            session.headers.update({'Content-Type': 'application/json',
+                                    'Accept': 'application/json'})
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.local.session = session
+        return self.local.session
+
+    def send_one(self, scheduled: Optional[float] = None):
+        name = random.choices(self.choices, self.weights)[0]
+        _, method, endpoint, payload = self.mix[name]
+        start = time.perf_counter() if scheduled is None else scheduled
+        try:
+            response = self.session().request(method, f"{self.base_url}{endpoint}",
+                                              json=payload, timeout=30)
+            status, error = response.status_code, response.status_code >= 500
+        except requests.exceptions.RequestException:
+            status, error = 0, True
+        latency = time.perf_counter() - start
+        self.stats[name].record(latency, status, error)
+        self.overall.record(latency, status, error)
+
+    def _closed_loop(self, deadline: float):
+        while time.perf_counter() < deadline:
+            self.send_one()
+
+    def run(self) -> Dict[str, Any]:
+        logger.info(f"Load test: {self.workers} workers against {self.base_url}")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            if self.ramp:
+                for stage_seconds, rps in self.ramp:
+                    logger.info(f"Stage: {rps} rps for {stage_seconds}s")
+                    stage_start = time.perf_counter()
+                    sent = 0
+                    while True:
+                        elapsed = time.perf_counter() - stage_start
+                        if elapsed >= stage_seconds:
+                            break
+                        due = int(elapsed * rps) + 1
+                        for k in range(sent, due):
+                            pool.submit(self.send_one, stage_start + k / rps)
+                        sent = due
+                        time.sleep(min(1.0 / rps, stage_seconds - elapsed))
+            else:
+                deadline = start + self.duration
+                for _ in range(self.workers):
+                    pool.submit(self._closed_loop, deadline)
+        duration = time.perf_counter() - start
+
+        return {
+            'config': {
+                'base_url': self.base_url,
+                'workers': self.workers,
+                'duration': round(duration, 2),
+                'ramp': self.ramp,
+                'mix': {n: {'weight': w, 'method': m, 'endpoint': e}
+                        for n, (w, m, e, _) in self.mix.items()},
+            },
+            'overall': self.overall.summary(duration),
+            'endpoints': {n: s.summary(duration) for n, s in self.stats.items()},
+            'timestamp': datetime.utcnow().isoformat(),
+        }
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the analytics API, for exercising load mode locally"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    routes = {
+        ('GET', '/v1/health'): {'status': 'healthy'},
+        ('GET', '/v1/health/detailed'): {'status': 'healthy', 'checks': {}},
+        ('POST', '/v1/bhavcopy'): {'status': 'success'},
+        ('POST', '/v1/analytics/sma-nearby'): {'status': 'success', 'data': []},
+    }
+
+    def _respond(self, method: str):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        body = self.routes.get((method, self.path))
+        code = 200 if body is not None else 404
+        data = json.dumps(body if body is not None else {'error': 'Not Found'}).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server(port: int = 0) -> ThreadingHTTPServer:
+    """Start the stub API on 127.0.0.1 in a daemon thread"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubAPIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def save_load_results(results: Dict[str, Any], path: str = 'test_results.json'):
+    """Store load results under 'load_test' in test_results.json, keeping other keys"""
+    existing = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                existing = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            existing = {}
+    existing['load_test'] = results
+    with open(path, 'w') as f:
+        json.dump(existing, f, indent=2)
+    logger.info(f"Load test results saved to: {path}")
+
+
+def parse_ramp(spec: str) -> List[Tuple[float, float]]:
+    """'10:20,30:100' -> [(10.0, 20.0), (30.0, 100.0)] as (seconds, rps) stages"""
+    stages = []
+    for part in spec.split(','):
+        seconds, rps = part.split(':')
+        if float(rps) <= 0:
+            raise ValueError(f"Stage '{part}': rps must be positive")
+        stages.append((float(seconds), float(rps)))
+    return stages
+
+
+def parse_mix(spec: str) -> Dict[str, Tuple]:
+    """'sma-nearby=8,health-detailed=2' -> DEFAULT_MIX entries with new weights"""
+    mix = {}
+    for part in spec.split(','):
+        name, weight = part.split('=')
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown endpoint '{name}' (choose from {', '.join(DEFAULT_MIX)})")
+        _, method, endpoint, payload = DEFAULT_MIX[name]
+        mix[name] = (float(weight), method, endpoint, payload)
+    return mix
+
+
 def main():
     """Main function to run tests"""
     import argparse
@@ -356,12 +597,46 @@ def main():
                        help='Base URL of the API (default: http://127.0.0.1:5000)')
     parser.add_argument('--verbose', action='store_true', 
                        help='Enable verbose logging')
+    parser.add_argument('--load', action='store_true',
+                       help='Run the concurrent load test instead of the route tests')
+    parser.add_argument('--workers', type=int, default=16,
+                       help='Concurrent workers in load mode (default: 16)')
+    parser.add_argument('--duration', type=float, default=30.0,
+                       help='Load test duration in seconds when no ramp is given (default: 30)')
+    parser.add_argument('--rps', type=float,
+                       help='Target requests per second (open loop)')
+    parser.add_argument('--ramp',
+                       help='Ramp-up schedule as seconds:rps stages, e.g. 10:20,30:100')
+    parser.add_argument('--mix',
+                       help='Endpoint weights, e.g. sma-nearby=6,health-detailed=3,bhavcopy=1')
+    parser.add_argument('--stub', action='store_true',
+                       help='Start a local stub API and point the tester at it')
     
     args = parser.parse_args()
     
+    if args.rps is not None and args.rps <= 0:
+        parser.error('--rps must be positive')
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
     
+    if args.stub:
+        server = start_stub_server()
+        args.url = f"http://127.0.0.1:{server.server_address[1]}"
+        logger.info(f"Started stub API at {args.url}")
+
+    if args.load:
+        load_tester = LoadTester(
+            args.url, workers=args.workers, duration=args.duration,
+            mix=parse_mix(args.mix) if args.mix else None, target_rps=args.rps,
+            ramp=parse_ramp(args.ramp) if args.ramp else None,
+        )
+        results = load_tester.run()
+        overall = results['overall']
+        logger.info(f"Requests: {overall['requests']}, throughput: {overall['throughput_rps']} rps, "
+                    f"error rate: {overall['error_rate']:.2%}, latency: {overall['latency_ms']}")
+        save_load_results(results)
+        return
+
     # Create tester instance
     tester = APITester(args.url)
     
@@ -0,0 +1,349 @@
+"""
+Incremental SMA / EMA / RSI over the columnar bhavcopy history.
+
+State is kept per symbol in NumPy arrays indexed by the store's global
+TckrSymb code: a ring buffer of the last max(periods) closes, a running sum
+per SMA period, EMA values and Wilder RSI averages. A new day touches each
+traded symbol once, and every indicator comes out as one array across the
+whole universe. Windows count the symbol's own sessions, so a day a symbol
+did not trade is skipped rather than treated as a gap.
+
+Closes are restated for splits and bonuses through adjustments.py: when an
+instrument's factors change, reseed() replays just that symbol from its
+adjusted closes, and adjusted_version records which changes are applied.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from adjustments import Adjustments
+from bhavcopy_store import STORE_DIR, History
+from instrumentation import stage
+
+STATE_FILE = "indicators.npz"
+
+# Running sums are recomputed from the ring buffer this often to stop
+# floating point drift from accumulating.
+RESYNC_EVERY = 250
+
+
+class IndicatorEngine:
+    def __init__(self, periods=(20, 50, 200), ema_periods=(20, 50), rsi_period=14):
+        self.periods = tuple(sorted(set(periods)))
+        self.ema_periods = tuple(sorted(set(ema_periods)))
+        self.rsi_period = rsi_period
+        self.window = max(self.periods)
+        self.dates = []
+        self.adjusted_version = 0
+        self._alloc(0)
+
+    def _alloc(self, n):
+        self.buf = np.zeros((n, self.window))
+        self.count = np.zeros(n, dtype=np.int64)
+        self.last = np.full(n, np.nan)
+        self.sums = {p: np.zeros(n) for p in self.periods}
+        self.ema = {p: np.full(n, np.nan) for p in self.ema_periods}
+        self.avg_gain = np.zeros(n)
+        self.avg_loss = np.zeros(n)
+
+    def _grow(self, n):
+        old = len(self.count)
+        if n <= old:
+            return
+        n = max(n, old * 2)
+        buf, count, last = self.buf, self.count, self.last
+        sums, ema = self.sums, self.ema
+        gain, loss = self.avg_gain, self.avg_loss
+        self._alloc(n)
+        self.buf[:old] = buf
+        self.count[:old] = count
+        self.last[:old] = last
+        for p in self.periods:
+            self.sums[p][:old] = sums[p]
+        for p in self.ema_periods:
+            self.ema[p][:old] = ema[p]
+        self.avg_gain[:old] = gain
+        self.avg_loss[:old] = loss
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if self.dates else None
+
+    def update(self, trade_date, codes, closes):
+        """Apply one day of closes for the symbols in `codes` (unique per day)."""
+        codes = np.asarray(codes, dtype=np.int64)
+        closes = np.asarray(closes, dtype=np.float64)
+        valid = ~np.isnan(closes)
+        codes, closes = codes[valid], closes[valid]
+        if len(codes):
+            self._grow(int(codes.max()) + 1)
+
+        count = self.count[codes]
+        for p in self.periods:
+            outgoing = np.where(count >= p, self.buf[codes, (count - p) % self.window], 0.0)
+            self.sums[p][codes] += closes - outgoing
+        self.buf[codes, count % self.window] = closes
+
+        for p in self.ema_periods:
+            alpha = 2.0 / (p + 1)
+            prev = self.ema[p][codes]
+            self.ema[p][codes] = np.where(np.isnan(prev), closes, prev + alpha * (closes - prev))
+
+        prev_close = self.last[codes]
+        has_prev = ~np.isnan(prev_close)
+        change = np.where(has_prev, closes - prev_close, 0.0)
+        # Simple mean over the first rsi_period changes, Wilder smoothing after
+        n_changes = count
+        k = np.minimum(np.maximum(n_changes, 1), self.rsi_period)
+        for avg, move in ((self.avg_gain, np.maximum(change, 0.0)),
+                          (self.avg_loss, np.maximum(-change, 0.0))):
+            cur = avg[codes]
+            avg[codes] = np.where(has_prev, cur + (move - cur) / k, cur)
+
+        self.last[codes] = closes
+        self.count[codes] = count + 1
+        self.dates.append(int(trade_date))
+        if len(self.dates) % RESYNC_EVERY == 0:
+            self._resync()
+
+    def reseed(self, codes, closes):
+        """Replace the state of `codes` with a replay of `closes` (days x codes, NaN = no session)."""
+        codes = np.asarray(codes, dtype=np.int64)
+        n = len(codes)
+        fresh = IndicatorEngine(self.periods, self.ema_periods, self.rsi_period)
+        fresh._grow(n)
+        for day, row in enumerate(closes):
+            fresh.update(day, np.arange(n), row)
+        if n:
+            self._grow(int(codes.max()) + 1)
+        self.buf[codes] = fresh.buf[:n]
+        self.count[codes] = fresh.count[:n]
+        self.last[codes] = fresh.last[:n]
+        for p in self.periods:
+            self.sums[p][codes] = fresh.sums[p][:n]
+        for p in self.ema_periods:
+            self.ema[p][codes] = fresh.ema[p][:n]
+        self.avg_gain[codes] = fresh.avg_gain[:n]
+        self.avg_loss[codes] = fresh.avg_loss[:n]
+
+    def _resync(self):
+        for p in self.periods:
+            self.sums[p] = np.nansum(self._window(p), axis=1)
+
+    def _window(self, period):
+        """(symbols x period) matrix of the latest closes, NaN-padded."""
+        lags = np.arange(period)
+        slots = (self.count[:, None] - 1 - lags[None, :]) % self.window
+        values = np.take_along_axis(self.buf, slots, axis=1)
+        return np.where(lags[None, :] < self.count[:, None], values, np.nan)
+
+    def sma(self, period):
+        """SMA over each symbol's last `period` sessions; NaN until it has enough."""
+        if period in self.sums:
+            sums = self.sums[period]
+        elif period <= self.window:
+            sums = np.nansum(self._window(period), axis=1)
+        else:
+            raise ValueError(f"SMA period {period} exceeds the engine window of {self.window}")
+        return np.where(self.count >= period, sums / period, np.nan)
+
+    def ema_values(self, period):
+        if period not in self.ema:
+            raise ValueError(f"EMA period {period} is not tracked (have {self.ema_periods})")
+        return self.ema[period].copy()
+
+    def rsi(self):
+        gain, loss = self.avg_gain, self.avg_loss
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+        return np.where(self.count > self.rsi_period, rsi, np.nan)
+
+    def sma_nearby(self, period, threshold_pct):
+        """Codes, closes, SMA and % distance of symbols within threshold_pct of their SMA."""
+        sma = self.sma(period)
+        with np.errstate(invalid="ignore"):
+            distance = (self.last - sma) / sma * 100.0
+            mask = np.abs(distance) <= threshold_pct
+        codes = np.flatnonzero(mask)
+        order = np.argsort(np.abs(distance[codes]), kind="stable")
+        codes = codes[order]
+        return codes, self.last[codes], sma[codes], distance[codes]
+
+    def apply_history(self, history, series="EQ"):
+        """Feed every day in `history` newer than the last applied one."""
+        start = len(self.dates)
+        if self.dates and list(history.dates[:start]) != self.dates:
+            # Days were inserted behind us (e.g. an older backfill): replay all
+            self.dates = []
+            self.adjusted_version = 0
+            self._alloc(0)
+            start = 0
+        for trade_date in history.dates[start:]:
+            sl = history.day_slice(int(trade_date))
+            codes = history.column("TckrSymb")[sl]
+            closes = history.column("ClsPric")[sl]
+            if series is not None:
+                mask = history.column("SctySrs")[sl] == history.code("SctySrs", series)
+                codes, closes = codes[mask], closes[mask]
+            self.update(int(trade_date), codes, closes)
+        return len(history.dates) - start
+
+    def arrays(self):
+        """Full engine state as named arrays (the indicators.npz / snapshot layout)."""
+        arrays = {
+            "periods": np.array(self.periods), "ema_periods": np.array(self.ema_periods),
+            "rsi_period": np.array(self.rsi_period), "dates": np.array(self.dates, dtype=np.int64),
+            "buf": self.buf, "count": self.count, "last": self.last,
+            "avg_gain": self.avg_gain, "avg_loss": self.avg_loss,
+            "adjusted_version": np.array(self.adjusted_version),
+        }
+        arrays.update({f"sum_{p}": s for p, s in self.sums.items()})
+        arrays.update({f"ema_{p}": e for p, e in self.ema.items()})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, data):
+        """Rebuild an engine from arrays(); the arrays are used as is, not copied."""
+        engine = cls(tuple(data["periods"].tolist()), tuple(data["ema_periods"].tolist()),
+                     int(data["rsi_period"]))
+        engine.dates = data["dates"].tolist()
+        # State saved before adjustments existed has none applied
+        engine.adjusted_version = int(data["adjusted_version"]) if "adjusted_version" in data else 0
+        engine.buf = data["buf"]
+        engine.count = data["count"]
+        engine.last = data["last"]
+        engine.avg_gain = data["avg_gain"]
+        engine.avg_loss = data["avg_loss"]
+        engine.sums = {p: data[f"sum_{p}"] for p in engine.periods}
+        engine.ema = {p: data[f"ema_{p}"] for p in engine.ema_periods}
+        return engine
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **self.arrays())
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls.from_arrays(data)
+
+
+def rolling_sma(closes, period):
+    """SMA down the rows of a (dates x symbols) matrix via cumulative sums.
+
+    A cell is NaN unless the symbol has a close on every one of the last
+    `period` sessions.
+    """
+    present = ~np.isnan(closes)
+    zero = np.zeros((1, closes.shape[1]))
+    sums = np.concatenate([zero, np.cumsum(np.where(present, closes, 0.0), axis=0)])
+    counts = np.concatenate([zero, np.cumsum(present, axis=0)])
+    sma = np.full(closes.shape, np.nan)
+    if period <= closes.shape[0]:
+        window_sum = sums[period:] - sums[:-period]
+        full = (counts[period:] - counts[:-period]) == period
+        sma[period - 1:] = np.where(full, window_sum / period, np.nan)
+    return sma
+
+
+def sma_backfill(history, periods=(20, 50, 200), threshold_pct=2.0, days=None, series="EQ"):
+    """SMA and near-SMA flags for every (date, period) in one vectorized pass.
+
+    Loads the close matrix once (keeping enough earlier sessions to warm up
+    the longest period) and returns (dates, codes, closes, {period: sma},
+    {period: near}) trimmed to the last `days` sessions. Windows here are
+    market sessions, so unlike IndicatorEngine a missing day blanks the SMA.
+    """
+    if days is not None and days < 1:
+        raise ValueError("days must be at least 1")
+    start = None
+    if days is not None:
+        lead = days + max(periods) - 1
+        if lead < len(history.dates):
+            start = int(history.dates[-lead])
+    dates, codes, closes = history.pivot("ClsPric", start=start, series=series)
+    keep = slice(-days, None) if days is not None else slice(None)
+
+    smas, near = {}, {}
+    for period in periods:
+        sma = rolling_sma(closes, period)[keep]
+        with np.errstate(invalid="ignore"):
+            distance = np.abs(closes[keep] - sma) / sma * 100.0
+        smas[period] = sma
+        near[period] = distance <= threshold_pct
+    return dates[keep], codes, closes[keep], smas, near
+
+
+def backfill_records(history, periods=(20, 50, 200), threshold_pct=2.0, days=None, series="EQ"):
+    """Yield (trade_date, symbol, period, close, sma, distance_pct, near) for valid SMAs."""
+    dates, codes, closes, smas, near = sma_backfill(history, periods, threshold_pct, days, series)
+    symbols = history.symbols(codes)
+    for period in periods:
+        sma = smas[period]
+        rows, cols = np.nonzero(~np.isnan(sma))
+        distance = (closes[rows, cols] - sma[rows, cols]) / sma[rows, cols] * 100.0
+        for r, c, dist in zip(rows.tolist(), cols.tolist(), distance.tolist()):
+            yield (int(dates[r]), symbols[c], period, float(closes[r, c]),
+                   float(sma[r, c]), dist, bool(near[period][r, c]))
+
+
+def refresh_indicators(store_dir=STORE_DIR):
+    """Bring the saved engine state up to date with the store's history and actions."""
+    path = Path(store_dir) / STATE_FILE
+    with stage("indicators"):
+        engine = IndicatorEngine.load(path) if path.exists() else IndicatorEngine()
+        synced = engine.adjusted_version
+        history = History(store_dir)
+        applied = engine.apply_history(history)
+        adjustments = Adjustments(store_dir)
+        adjustments.update(history)
+        adjustments.apply_to(engine)
+        if applied or engine.adjusted_version != synced:
+            engine.save(path)
+    return engine, applied
+
+
+def sma_nearby(sma_period=50, threshold_pct=2.0, store_dir=STORE_DIR):
+    """Symbols trading within threshold_pct of their SMA, closest first."""
+    engine, _ = refresh_indicators(store_dir)
+    history = History(store_dir)
+    codes, closes, sma, distance = engine.sma_nearby(sma_period, threshold_pct)
+    return [
+        {"symbol": symbol, "close": float(c), "sma": round(float(s), 2),
+         "distance_pct": round(float(d), 2)}
+        for symbol, c, s, d in zip(history.symbols(codes), closes, sma, distance)
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Stocks trading near their SMA")
+    parser.add_argument("--sma-period", type=int, default=5)
+    parser.add_argument("--threshold-pct", type=float, default=1.0)
+    parser.add_argument("--backfill", type=int, metavar="DAYS",
+                        help="flag near-SMA days for the last DAYS sessions and --periods")
+    parser.add_argument("--periods", type=int, nargs="+", default=[20, 50, 200])
+    args = parser.parse_args()
+
+    if args.backfill is not None:
+        start = time.perf_counter()
+        dates, codes, closes, smas, near = sma_backfill(
+            History(), args.periods, args.threshold_pct, args.backfill)
+        print(f"✅ {len(dates)} days x {len(codes)} symbols x {len(args.periods)} periods "
+              f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+        for period in args.periods:
+            print(f"SMA{period}: {int(near[period].sum())} near-SMA flags")
+        raise SystemExit(0)
+
+    start = time.perf_counter()
+    results = sma_nearby(args.sma_period, args.threshold_pct)
+    print(f"✅ {len(results)} symbols within {args.threshold_pct}% of SMA{args.sma_period} "
+          f"({(time.perf_counter() - start) * 1000:.1f}ms)")
+    for row in results[:20]:
+        print(f"{row['symbol']:<15} {row['close']:>10.2f} {row['sma']:>10.2f} {row['distance_pct']:>6.2f}%")
@@ -0,0 +1,300 @@
+"""
+Stage timers, counters and optional profiling for the pipeline.
+
+Code under measurement uses two calls:
+
+    with stage("parse"):
+        ...
+    inc("rows_parsed", rows)
+
+Both feed one process-wide registry, rendered for Prometheus by
+render_prometheus() (served at /v1/metrics). A Run brackets one job - the
+daily update, a scheduler job - and on finish writes a JSON summary of the
+stage times and counters it saw to .cache/runs/, plus profiler output when
+asked for:
+
+    with Run("daily-update", profile="cprofile"):   # or "sampling"
+        ...
+
+INSTRUMENT_PROFILE sets the default profiler. A run's summary only counts
+stage() and inc() calls made while it is the active run (a ContextVar): on
+the thread that started it, and inside run.profiled() on threads doing its
+work. Jobs overlapping on the scheduler's workers each see only their own.
+"""
+
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+RUNS_DIR = Path(__file__).resolve().parent / ".cache" / "runs"
+DEFAULT_PROFILE = os.environ.get("INSTRUMENT_PROFILE") or None
+PREFIX = "bhavcopy_"
+
+HELP = {
+    "download_bytes": "Bytes downloaded from remote sources",
+    "rows_parsed": "BhavCopy rows parsed",
+    "rows_inserted": "Rows sent to Postgres",
+    "cache_lookups": "Response cache lookups by result",
+    "http_retries": "HTTP requests retried",
+    "db_connections_opened": "Postgres connections opened by the pool",
+    "stage_seconds": "Time spent in each pipeline stage",
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.stages = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, stage_name, seconds, **labels):
+        key = _key(stage_name, labels)
+        with self._lock:
+            count, total = self.stages.get(key, (0, 0.0))
+            self.stages[key] = (count + 1, total + seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters), dict(self.stages)
+
+
+metrics = Metrics()
+_active_run = contextvars.ContextVar("active_run", default=None)
+
+
+def current_run():
+    """The Run that stage() and inc() calls here are attributed to, or None."""
+    return _active_run.get()
+
+
+def inc(name, value=1, **labels):
+    metrics.inc(name, value, **labels)
+    run = _active_run.get()
+    if run is not None:
+        run.metrics.inc(name, value, **labels)
+
+
+@contextmanager
+def stage(name, **labels):
+    """Time a block into the stage_seconds summary."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe(name, seconds, **labels)
+        run = _active_run.get()
+        if run is not None:
+            run.metrics.observe(name, seconds, **labels)
+
+
+def _labels(pairs, **extra):
+    pairs = list(pairs) + sorted(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+
+def render_prometheus(gauges=None):
+    """Prometheus text exposition of the registry plus optional {name: value} gauges."""
+    counters, stages = metrics.snapshot()
+    lines = []
+    by_name = {}
+    for (name, labels), value in sorted(counters.items()):
+        by_name.setdefault(name, []).append((labels, value))
+    for name, samples in by_name.items():
+        metric = f"{PREFIX}{name}_total"
+        lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {metric} counter")
+        lines.extend(f"{metric}{_labels(labels)} {value}" for labels, value in samples)
+
+    if stages:
+        metric = f"{PREFIX}stage_seconds"
+        lines.append(f"# HELP {metric} {HELP['stage_seconds']}")
+        lines.append(f"# TYPE {metric} summary")
+        for (name, labels), (count, total) in sorted(stages.items()):
+            lines.append(f"{metric}_sum{_labels(labels, stage=name)} {total:.6f}")
+            lines.append(f"{metric}_count{_labels(labels, stage=name)} {count}")
+
+    for name, value in (gauges or {}).items():
+        if value is None:
+            continue
+        lines.append(f"# TYPE {PREFIX}{name} gauge")
+        lines.append(f"{PREFIX}{name} {float(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at `interval` seconds into folded-stack counts."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def top(self, n=20):
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
+
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Run:
+    """One measured job: its own stage times and counters, wall time and optional profile.
+
+    profile is None, "cprofile" (the starting thread plus anything wrapped in
+    profiled()) or "sampling" (every thread).
+    """
+
+    def __init__(self, name, profile=DEFAULT_PROFILE, out_dir=RUNS_DIR):
+        if profile not in (None, "cprofile", "sampling"):
+            raise ValueError("profile must be cprofile or sampling")
+        self.name = name
+        self.profile = profile
+        self.out_dir = Path(out_dir)
+        self.summary = None
+        self.metrics = Metrics()
+        self._token = None
+        self._stats = None
+        self._stats_lock = threading.Lock()
+
+    def start(self, this_thread=True):
+        """Begin measuring; this_thread=False leaves attribution and cProfile to profiled() blocks."""
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self._sampler = None
+        self._profile = None
+        if this_thread:
+            self._token = _active_run.set(self)
+        if self.profile == "sampling":
+            self._sampler = SamplingProfiler()
+            self._sampler.start()
+        elif self.profile == "cprofile" and this_thread:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    @contextmanager
+    def profiled(self):
+        """Attribute a block on another thread to this run, cProfiling it when asked to."""
+        token = _active_run.set(self)
+        profile = cProfile.Profile() if self.profile == "cprofile" else None
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._add_stats(profile)
+            _active_run.reset(token)
+
+    def _add_stats(self, profile):
+        with self._stats_lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def finish(self, status="ok", error=None):
+        wall = time.perf_counter() - self._start
+        if self._token is not None:
+            _active_run.reset(self._token)
+            self._token = None
+        counters, stages = self.metrics.snapshot()
+        summary = {
+            "run": self.name,
+            "status": status,
+            "error": error,
+            "started": self.started_at.isoformat(timespec="seconds"),
+            "wall_seconds": round(wall, 6),
+            "stages": {},
+            "counters": {},
+        }
+        for (name, labels), (count, total) in stages.items():
+            label = name + "".join(f"[{k}={v}]" for k, v in labels)
+            summary["stages"][label] = {"count": count, "seconds": round(total, 6)}
+        for (name, labels), value in counters.items():
+            if value:
+                summary["counters"][name + "".join(f"[{k}={v}]" for k, v in labels)] = value
+
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        stem = self.out_dir / f"{self.name}-{self.started_at:%Y%m%d-%H%M%S}"
+        if self._profile is not None:
+            self._profile.disable()
+            self._add_stats(self._profile)
+        if self._stats is not None:
+            self._stats.dump_stats(f"{stem}.prof")
+            text = io.StringIO()
+            pstats.Stats(f"{stem}.prof", stream=text).sort_stats("cumulative").print_stats(20)
+            summary["profile"] = {"file": f"{stem}.prof", "top": text.getvalue().splitlines()}
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler.write_folded(f"{stem}.folded")
+            summary["profile"] = {"file": f"{stem}.folded",
+                                  "top": [f"{count} {frame}" for frame, count in self._sampler.top()]}
+
+        with open(f"{stem}.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        self.summary = summary
+        return summary
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish("error" if exc_type else "ok", repr(exc) if exc else None)
+        return False
+
+
+def print_summary(summary):
+    print(f"⏱️  {summary['run']}: {summary['wall_seconds']:.3f}s")
+    for label, s in sorted(summary["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+        print(f"   {label:<30} {s['seconds']:>9.3f}s  x{s['count']}")
+    for label, value in sorted(summary["counters"].items()):
+        print(f"   {label:<30} {value:>12,}")
@@ -0,0 +1,153 @@
+"""
+Local, indexed cache of Angel One's OpenAPIScripMaster.json.
+
+The dump is downloaded to .cache/ only when upstream reports a change
+(ETag / Last-Modified), streamed to disk, and parsed one record at a time
+into a SQLite file with indexes on symbol, token, exch_seg and name.
+Lookups for any symbol universe are then index hits, with no download.
+"""
+
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+SCRIP_MASTER_URL = "https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json"
+
+CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "instruments"
+
+FIELDS = ("token", "symbol", "name", "expiry", "strike", "lotsize",
+          "instrumenttype", "exch_seg", "tick_size")
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    started = False
+    while True:
+        chunk = f.read(chunk_size)
+        buf = buf[pos:] + chunk
+        pos = 0
+        while True:
+            # Skip whitespace, the opening bracket and separators
+            while pos < len(buf) and buf[pos] in " \t\r\n,[":
+                if buf[pos] == "[":
+                    started = True
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]" and started:
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # element continues in the next chunk
+            yield item
+            pos = end
+        if not chunk:
+            if buf[pos:].strip():
+                raise ValueError("Truncated instrument master")
+            return
+
+
+def _meta(db):
+    return dict(db.execute("SELECT key, value FROM meta"))
+
+
+def open_db(cache_dir=CACHE_DIR):
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(cache_dir / "instruments.db", check_same_thread=False)
+    db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    return db
+
+
+def build_index(db, json_path):
+    """(Re)build the instruments table from a downloaded dump."""
+    with db:
+        db.execute("DROP TABLE IF EXISTS instruments")
+        db.execute(f"CREATE TABLE instruments ({', '.join(FIELDS)}, name_upper TEXT)")
+        with open(json_path, encoding="utf-8") as f:
+            db.executemany(
+                f"INSERT INTO instruments VALUES ({', '.join('?' * (len(FIELDS) + 1))})",
+                (tuple(item.get(k) for k in FIELDS) + ((item.get("name") or "").upper(),)
+                 for item in iter_json_array(f)),
+            )
+        for column in ("symbol", "token", "name_upper"):
+            db.execute(f"CREATE INDEX idx_{column} ON instruments ({column}, exch_seg)")
+        db.execute("CREATE INDEX idx_exch_seg ON instruments (exch_seg)")
+        db.execute("ANALYZE")
+    return db.execute("SELECT COUNT(*) FROM instruments").fetchone()[0]
+
+
+def refresh(url=SCRIP_MASTER_URL, cache_dir=CACHE_DIR, force=False):
+    """Download and re-index the dump if upstream changed. Returns True if it did."""
+    import requests
+
+    db = open_db(cache_dir)
+    meta = _meta(db)
+    headers = {}
+    if not force and "instruments" in {r[0] for r in db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")}:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+        json_path = Path(cache_dir) / "OpenAPIScripMaster.json"
+        tmp = json_path.with_name(json_path.name + ".part")
+        with open(tmp, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+        os.replace(tmp, json_path)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+    build_index(db, json_path)
+    with db:
+        db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                       [("etag", etag), ("last_modified", last_modified)])
+    return True
+
+
+class InstrumentMaster:
+    """Index lookups over the cached instrument master."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.db = open_db(cache_dir)
+        self.db.row_factory = sqlite3.Row
+
+    def _query(self, where, params):
+        return [dict(r) for r in self.db.execute(
+            f"SELECT {', '.join(FIELDS)} FROM instruments WHERE {where}", params)]
+
+    def by_symbol(self, symbol, exch_seg=None):
+        if exch_seg is None:
+            return self._query("symbol = ?", (symbol,))
+        return self._query("symbol = ? AND exch_seg = ?", (symbol, exch_seg))
+
+    def by_token(self, token, exch_seg=None):
+        if exch_seg is None:
+            return self._query("token = ?", (str(token),))
+        return self._query("token = ? AND exch_seg = ?", (str(token), exch_seg))
+
+    def by_name(self, name, exch_seg=None):
+        if exch_seg is None:
+            return self._query("name_upper = ?", (name.upper(),))
+        return self._query("name_upper = ? AND exch_seg = ?", (name.upper(), exch_seg))
+
+    def by_exch_seg(self, exch_seg):
+        return self._query("exch_seg = ?", (exch_seg,))
+
+    def nse_tokens(self, symbols):
+        """Token per symbol: NSE equities via SYMBOL-EQ, indices via their name."""
+        symbol_to_token = {}
+        for symbol in symbols:
+            rows = self.by_symbol(f"{symbol}-EQ", "NSE") or self.by_name(symbol, "NSE")
+            if rows:
+                symbol_to_token[symbol] = rows[0]["token"]
+        return symbol_to_token
@@ -0,0 +1,379 @@
+"""
+Background jobs with chunked parallelism, priorities and progress events.
+
+A job type splits its work into chunks; chunks from every queued job go
+into one priority queue served by a fixed pool of worker threads, so
+several job types run side by side and higher-priority work (lower
+number) is picked first. Callers may only set the params a job type
+declares; paths and upstream URLs come from the scheduler's server-side
+config, never from a request. Each job keeps an append-only event log that
+stream() follows, which backs the Server-Sent Events route in
+analytics_api.
+
+    scheduler = JobScheduler(workers=4)
+    job = scheduler.submit("market-cap-refresh", priority=5)
+    for event in scheduler.stream(job.id):
+        print(event)
+"""
+
+import csv
+import itertools
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from bhavcopy import BHAVCOPY_DIR, day_files
+from bhavcopy_store import STORE_DIR, append_history, parse_day, write_day
+from screener import MARKET_CAPS_CSV
+from instrumentation import Run, stage
+from netutil import RateLimiter
+from symbol_index import SymbolIndex
+
+
+PROFILES = (None, "cprofile", "sampling")
+
+
+def _flag(value):
+    if not isinstance(value, bool):
+        raise ValueError("must be true or false")
+    return value
+
+
+def _profile(value):
+    if value not in PROFILES:
+        raise ValueError(f"must be one of {PROFILES}")
+    return value
+
+
+def _int_between(low, high):
+    def check(value):
+        if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+            raise ValueError(f"must be an integer between {low} and {high}")
+        return value
+    return check
+
+
+def _tickers(value):
+    if not isinstance(value, list) or not value or len(value) > 5000 \
+            or not all(isinstance(v, str) and re.fullmatch(r"[A-Z0-9&_-]{1,20}", v) for v in value):
+        raise ValueError("must be a non-empty list of NSE tickers")
+    return value
+
+
+class JobType:
+    """split(params) -> chunks, run(chunk, params) -> result, finish(results, params) -> result.
+
+    `params` maps each param a caller may set to a validator that returns
+    the value or raises ValueError. The functions see those merged with the
+    scheduler's config.
+    """
+
+    def __init__(self, split, run, finish=None, params=None):
+        self.split = split
+        self.run = run
+        self.finish = finish or (lambda results, params: results)
+        self.params = {"profile": _profile, **(params or {})}
+
+    def validate(self, params):
+        unknown = sorted(set(params) - set(self.params))
+        if unknown:
+            raise ValueError(f"Unknown params: {unknown}; allowed: {sorted(self.params)}")
+        checked = {}
+        for name, value in params.items():
+            try:
+                checked[name] = self.params[name](value)
+            except ValueError as e:
+                raise ValueError(f"{name} {e}")
+        return checked
+
+
+class Job:
+    def __init__(self, job_type, params, priority, config=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.type = job_type
+        self.params = params
+        # What the job functions see; server config wins over anything requested
+        self.settings = {**params, **(config or {})}
+        self.priority = priority
+        self.status = "queued"
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.results = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.events = []
+        self.cond = threading.Condition()
+        # params["profile"] may ask for "cprofile" or "sampling"
+        self.run = Run(f"job-{job_type}-{self.id}", profile=params.get("profile"))
+
+    def emit(self, kind, **data):
+        with self.cond:
+            self.events.append({"id": len(self.events), "event": kind, "job": self.id,
+                                "time": time.time(), **data})
+            self.cond.notify_all()
+
+    @property
+    def finished_or_failed(self):
+        return self.status in ("done", "failed")
+
+    def to_dict(self):
+        return {
+            "id": self.id, "type": self.type, "params": self.params,
+            "priority": self.priority, "status": self.status,
+            "chunks": {"total": self.total, "done": self.done, "failed": self.failed},
+            "progress": round(self.done / self.total, 4) if self.total else None,
+            "created": self.created, "started": self.started, "finished": self.finished,
+            "result": self.result, "error": self.error,
+        }
+
+
+class JobScheduler:
+    def __init__(self, workers=4, keep=200, config=None):
+        self.keep = keep
+        self.config = dict(config or {})
+        self.types = {}
+        self.jobs = {}
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def register(self, name, job_type):
+        self.types[name] = job_type
+
+    def list(self):
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda j: j.created, reverse=True)
+
+    def submit(self, job_type, params=None, priority=10):
+        """Queue a job, or return the identical one already in flight."""
+        if job_type not in self.types:
+            raise KeyError(f"Unknown job type: {job_type}")
+        params = self.types[job_type].validate(params or {})
+        with self._lock:
+            for existing in self.jobs.values():
+                if existing.type == job_type and existing.params == params \
+                        and not existing.finished_or_failed:
+                    return existing
+            job = Job(job_type, params, priority, self.config)
+            job.run.start(this_thread=False)
+            self.jobs[job.id] = job
+            self._prune()
+
+        try:
+            with job.run.profiled():
+                chunks = list(self.types[job_type].split(job.settings))
+        except Exception as e:
+            job.run.finish("failed", str(e))
+            with job.cond:
+                job.status, job.error, job.finished = "failed", str(e), time.time()
+                job.emit("failed", result=None, error=job.error)
+            return job
+        job.total = len(chunks)
+        job.emit("queued", chunks=job.total)
+        if not chunks:
+            self._finish(job)
+        for index, chunk in enumerate(chunks):
+            self._queue.put((priority, next(self._seq), job.id, index, chunk))
+        return job
+
+    def _prune(self):
+        finished = [j for j in self.jobs.values() if j.finished_or_failed]
+        for j in sorted(finished, key=lambda j: j.created)[:max(0, len(self.jobs) - self.keep)]:
+            del self.jobs[j.id]
+
+    def _work(self):
+        while True:
+            _, _, job_id, index, chunk = self._queue.get()
+            job = self.jobs[job_id]
+            with job.cond:
+                if job.started is None:
+                    job.started = time.time()
+                    job.status = "running"
+            try:
+                with job.run.profiled(), stage("job_chunk", job=job.type):
+                    result, error = self.types[job.type].run(chunk, job.settings), None
+            except Exception as e:
+                result, error = None, e
+            with job.cond:
+                job.done += 1
+                if error is None:
+                    job.results[index] = result
+                else:
+                    job.failed += 1
+                done, last = job.done, job.done == job.total
+            if error is None:
+                job.emit("progress", chunk=index, done=done, total=job.total)
+            else:
+                job.emit("chunk_failed", chunk=index, done=done, total=job.total, error=str(error))
+            if last:
+                self._finish(job)
+            self._queue.task_done()
+
+    def _finish(self, job):
+        results = [job.results[i] for i in sorted(job.results)]
+        # Chunk results can be whole parsed days; the job record outlives them
+        job.results = {}
+        result, error = None, None
+        try:
+            with job.run.profiled():
+                result = self.types[job.type].finish(results, job.settings)
+            if job.failed:
+                error = f"{job.failed} of {job.total} chunks failed"
+        except Exception as e:
+            error = str(e)
+        del results
+        status = "failed" if error else "done"
+        summary = job.run.finish(status, error)
+        # Status and the final event change together so stream() never ends early
+        with job.cond:
+            job.result, job.error, job.status = result, error, status
+            job.finished = time.time()
+            job.emit(status, result=result, error=error,
+                     stages=summary["stages"], counters=summary["counters"])
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def stream(self, job_id, since=0, timeout=15.0):
+        """Yield the job's events from `since` until it completes.
+
+        Yields None after `timeout` seconds without news so callers can send
+        a keep-alive.
+        """
+        job = self.jobs[job_id]
+        position = since
+        while True:
+            with job.cond:
+                if position >= len(job.events) and not job.finished_or_failed:
+                    job.cond.wait(timeout)
+                pending = job.events[position:]
+                position = len(job.events)
+                finished = job.finished_or_failed
+            if not pending and not finished:
+                yield None
+            yield from pending
+            if finished and position >= len(job.events):
+                return
+
+
+def sse_format(event):
+    """Render one event (or a keep-alive for None) as a Server-Sent Events frame."""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+# -- built-in job types ----------------------------------------------------------
+
+def _ingest_split(params):
+    src = Path(params.get("bhavcopy_dir", BHAVCOPY_DIR))
+    days_dir = Path(params.get("store_dir", STORE_DIR)) / "days"
+    return [str(p) for p in day_files(src)
+            if not (days_dir / f"{p.stem}.npz").exists()]
+
+
+def _ingest_run(zip_path, params):
+    store_dir = params.get("store_dir", STORE_DIR)
+    parsed = parse_day(zip_path)
+    write_day(store_dir, *parsed)
+    if params.get("load_db"):
+        # Chunks share the ingest pool rather than connecting per zip
+        from bulk_loader import load_bhavcopy
+        from db import get_database
+        with get_database("ingest").connection() as conn:
+            load_bhavcopy(conn, zip_path)
+    return parsed
+
+
+def _ingest_finish(results, params):
+    # History appends stay serial and in date order
+    store_dir = params.get("store_dir", STORE_DIR)
+    added = []
+    for trade_date, columns, dictionaries in sorted(results, key=lambda r: r[0]):
+        if append_history(store_dir, trade_date, columns, dictionaries):
+            added.append(trade_date)
+    if added:
+        from snapshot import build as build_snapshot
+        SymbolIndex(store_dir).update()
+        build_snapshot(store_dir)
+    return {"ingested": added}
+
+
+def _sma_run(_, params):
+    from indicators import refresh_indicators
+    engine, applied = refresh_indicators(params.get("store_dir", STORE_DIR))
+    return {"applied_days": applied, "last_date": engine.last_date}
+
+
+def _market_cap_split(params):
+    from market_cap import symbols
+    universe = params.get("symbols") or symbols
+    size = int(params.get("chunk_size", 10))
+    return [universe[i:i + size] for i in range(0, len(universe), size)]
+
+
+# Shared by every market-cap chunk so parallel chunks stay within one rate
+_market_cap_limiter = RateLimiter(rate=2.0, burst=4)
+
+
+def _market_cap_run(chunk, params):
+    from market_cap import SCREENER_URL, fetch_market_caps
+    caps, errors = fetch_market_caps(chunk, base_url=params.get("base_url", SCREENER_URL),
+                                     workers=min(4, len(chunk)), limiter=_market_cap_limiter)
+    return {"caps": caps, "errors": {s: str(e) for s, e in errors.items()}}
+
+
+_market_caps_lock = threading.Lock()
+
+
+def _market_cap_finish(results, params):
+    caps, errors = {}, {}
+    for r in results:
+        caps.update(r["caps"])
+        errors.update(r["errors"])
+    path = Path(params.get("out", MARKET_CAPS_CSV))
+    # A refresh of some symbols keeps every cap it did not fetch; concurrent
+    # refreshes merge one at a time and readers only ever see a whole file
+    with _market_caps_lock:
+        merged = {}
+        if path.exists():
+            with open(path, newline="") as f:
+                merged = {row["symbol"]: row["market_cap"] for row in csv.DictReader(f) if row.get("symbol")}
+        merged.update(caps)
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["symbol", "market_cap"])
+            writer.writerows(merged.items())
+        os.replace(tmp, path)
+    return {"written": len(caps), "total": len(merged), "errors": errors}
+
+
+def default_scheduler(workers=4, store_dir=STORE_DIR, bhavcopy_dir=BHAVCOPY_DIR,
+                      market_caps_csv=MARKET_CAPS_CSV, screener_url=None):
+    """The built-in job types, with paths and URLs pinned to server configuration."""
+    from market_cap import SCREENER_URL
+
+    config = {"store_dir": str(store_dir), "bhavcopy_dir": str(bhavcopy_dir),
+              "out": str(market_caps_csv), "base_url": screener_url or SCREENER_URL}
+    scheduler = JobScheduler(workers, config=config)
+    scheduler.register("bhavcopy-ingest", JobType(_ingest_split, _ingest_run, _ingest_finish,
+                                                  params={"load_db": _flag}))
+    scheduler.register("sma-refresh", JobType(lambda params: [None], _sma_run,
+                                              lambda results, params: results[0] if results else None))
+    scheduler.register("market-cap-refresh",
+                       JobType(_market_cap_split, _market_cap_run, _market_cap_finish,
+                               params={"symbols": _tickers, "chunk_size": _int_between(1, 100)}))
+    return scheduler
@@ -1,5 +1,7 @@
 import json
-import requests
+import sys
+
+from instruments import InstrumentMaster, refresh
 
 # Your required stock/index symbols (case-sensitive for consistency)
 required_symbols = {
@@ -24,31 +26,17 @@ required_symbols = {
 }
 
 
-# Fetch Angel One instruments dump
-url = "https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json"
-response = requests.get(url)
-data = response.json()
-
-symbol_to_token = {}
-
-for item in data:
-    token = item.get("token")
-    symbol = item.get("symbol", "")
-    name = item.get("name", "").upper()
-    exch_seg = item.get("exch_seg", "")
-    
-    # For stocks: match symbol like "RELIANCE-EQ" → "RELIANCE"
-    if symbol.endswith("-EQ") and exch_seg.lower() == "nse":
-        stock = symbol.replace("-EQ", "")
-        if stock in required_symbols:
-            symbol_to_token[stock] = token
+if __name__ == "__main__":
+    # Refresh the local Angel One instruments cache (no-op when upstream is unchanged)
+    if refresh():
+        print("⬇️  Instrument master updated.")
 
-    # For indices (e.g., NIFTY, BANKNIFTY) — usually AMXIDX instrument type
-    if exch_seg == "NSE" and name in required_symbols:
-        symbol_to_token[name] = token
+    # Any symbols passed on the command line replace the default universe
+    symbols = sys.argv[1:] or sorted(required_symbols)
+    symbol_to_token = InstrumentMaster().nse_tokens(symbols)
 
-# Save the mapping
-with open("symbol_to_token.json", "w") as f:
-    json.dump(symbol_to_token, f, indent=2)
+    # Save the mapping
+    with open("symbol_to_token.json", "w") as f:
+        json.dump(symbol_to_token, f, indent=2)
 
-print(f"✅ Saved mapping for {len(symbol_to_token)} symbols.")
+    print(f"✅ Saved mapping for {len(symbol_to_token)} symbols.")
@@ -1,50 +1,178 @@
 import csv
-import requests
-from bs4 import BeautifulSoup
+import json
+import os
+import re
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+from instrumentation import current_run
+from netutil import RateLimiter, get_with_retries
 
 symbols = [
-    "ADANIENT", "ADANIPORTS", "APOLLOHOSP", "ASIANPAINT", "AXISBANK", 
-    "BAJAJ-AUTO", "BAJFINANCE", "BAJAJFINSV", "BEL", "BHARTIARTL", 
-    "CIPLA", "COALINDIA", "DRREDDY", "EICHERMOT", "ETERNAL", 
-    "GRASIM", "HCLTECH", "HDFCBANK", "HDFCLIFE", "HEROMOTOCO", 
-    "HINDALCO", "HINDUNILVR", "ICICIBANK", "ITC", "INDUSINDBK", 
-    "INFY", "JSWSTEEL", "JIOFIN", "KOTAKBANK", "LT", 
-    "M&M", "MARUTI", "NTPC", "NESTLEIND", "ONGC", 
-    "POWERGRID", "RELIANCE", "SBILIFE", "SHRIRAMFIN", "SBIN", 
-    "SUNPHARMA", "TCS", "TATACONSUM", "TATAMOTORS", "TATASTEEL", 
+    "ADANIENT", "ADANIPORTS", "APOLLOHOSP", "ASIANPAINT", "AXISBANK",
+    "BAJAJ-AUTO", "BAJFINANCE", "BAJAJFINSV", "BEL", "BHARTIARTL",
+    "CIPLA", "COALINDIA", "DRREDDY", "EICHERMOT", "ETERNAL",
+    "GRASIM", "HCLTECH", "HDFCBANK", "HDFCLIFE", "HEROMOTOCO",
+    "HINDALCO", "HINDUNILVR", "ICICIBANK", "ITC", "INDUSINDBK",
+    "INFY", "JSWSTEEL", "JIOFIN", "KOTAKBANK", "LT",
+    "M&M", "MARUTI", "NTPC", "NESTLEIND", "ONGC",
+    "POWERGRID", "RELIANCE", "SBILIFE", "SHRIRAMFIN", "SBIN",
+    "SUNPHARMA", "TCS", "TATACONSUM", "TATAMOTORS", "TATASTEEL",
     "TECHM", "TITAN", "TRENT", "ULTRACEMCO", "WIPRO"
 ]
 
-def get_market_cap(symbol):
-    url = f"https://www.screener.in/company/{symbol}/"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    
+SCREENER_URL = "https://www.screener.in"
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "market_cap"
+CACHE_TTL = 24 * 60 * 60  # seconds
+
+# <span class="name">Market Cap</span> ... <span class="number">3,05,431</span>
+MARKET_CAP_RE = re.compile(
+    r'Market Cap\s*</span>.{0,300}?<span class="number">([^<]+)</span>', re.S
+)
+
+
+def parse_market_cap(html):
+    """Market cap in ₹ crore from a screener.in company page."""
+    match = MARKET_CAP_RE.search(html)
+    if match:
+        return float(match.group(1).replace(",", "").strip())
+
+    # Markup changed: fall back to walking the ratios list
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    for item in soup.find_all("li", class_="flex flex-space-between"):
+        if "Market Cap" in item.text:
+            market_cap_text = item.find_all("span")[1].text
+            return float(re.sub(r"[^\d.]", "", market_cap_text.replace("Cr.", "")))
+    raise ValueError("Market Cap not found in page")
+
+
+def _cache_path(symbol, cache_dir):
+    return Path(cache_dir) / f"{symbol.replace('/', '_')}.json"
+
+
+def _read_cache(symbol, cache_dir):
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            items = soup.find_all("li", class_="flex flex-space-between")
-
-            for item in items:
-                if "Market Cap" in item.text:
-                    market_cap_text = item.find_all("span")[1].text.strip()
-                    market_cap_cleaned = market_cap_text.replace(",", "").replace("₹", "").replace("Cr.", "").strip()
-                    print(f"{symbol} → ₹{market_cap_text}")
-                    return float(market_cap_cleaned)
-    except Exception as e:
-        print(f"❌ Error fetching market cap for {symbol}: {e}")
-    return 0.0
-
-def write_csv():
-    with open("market_caps.csv", "w", newline='') as f:
+        with open(_cache_path(symbol, cache_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(symbol, cache_dir, entry):
+    path = _cache_path(symbol, cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp, path)
+
+
+def get_market_cap(symbol, session, limiter, base_url=SCREENER_URL,
+                   cache_dir=CACHE_DIR, ttl=CACHE_TTL):
+    """Market cap for `symbol`, served from the cache while it is fresh.
+
+    Stale entries are revalidated with If-None-Match/If-Modified-Since.
+    Raises on failure instead of returning a placeholder.
+    """
+    cached = _read_cache(symbol, cache_dir)
+    if cached and time.time() - cached["fetched_at"] < ttl:
+        return cached["market_cap"]
+
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    url = f"{base_url}/company/{symbol}/"
+    response = get_with_retries(session, url, limiter, timeout=10, headers=headers)
+    if response.status_code == 304 and cached:
+        cached["fetched_at"] = time.time()
+        _write_cache(symbol, cache_dir, cached)
+        return cached["market_cap"]
+    response.raise_for_status()
+
+    market_cap = parse_market_cap(response.content.decode("utf-8", errors="replace"))
+    _write_cache(symbol, cache_dir, {
+        "market_cap": market_cap,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+    })
+    return market_cap
+
+
+def fetch_market_caps(symbols, base_url=SCREENER_URL, workers=8, rate=2.0,
+                      cache_dir=CACHE_DIR, ttl=CACHE_TTL, limiter=None):
+    """Fetch market caps concurrently. Returns ({symbol: cap}, {symbol: error}).
+
+    Pass a shared `limiter` when several batches run at once so they respect
+    one overall rate.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    limiter = limiter or RateLimiter(rate, burst=workers)
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    # Pool threads do not inherit the caller's context; keep requests attributed to its run
+    run = current_run()
+
+    def fetch(symbol):
+        try:
+            with run.profiled() if run is not None else nullcontext():
+                return symbol, get_market_cap(symbol, session, limiter, base_url, cache_dir, ttl), None
+        except Exception as e:
+            return symbol, None, e
+
+    caps, errors = {}, {}
+    with session, ThreadPoolExecutor(max_workers=workers) as pool:
+        for symbol, cap, error in pool.map(fetch, symbols):
+            if error is None:
+                print(f"{symbol} → ₹{cap:,.0f} Cr.")
+                caps[symbol] = cap
+            else:
+                print(f"❌ Error fetching market cap for {symbol}: {error}")
+                errors[symbol] = error
+    return caps, errors
+
+
+def write_csv(path="market_caps.csv", **kwargs):
+    """Write market_caps.csv; symbols that could not be fetched are left out."""
+    caps, errors = fetch_market_caps(symbols, **kwargs)
+    with open(path, "w", newline='') as f:
         writer = csv.writer(f)
         writer.writerow(["symbol", "market_cap"])
         for symbol in symbols:
-            cap = get_market_cap(symbol)
-            writer.writerow([symbol, cap])
-            time.sleep(1)  # To prevent blocking by Screener
+            if symbol in caps:
+                writer.writerow([symbol, caps[symbol]])
+    return caps, errors
+
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fetch market caps from screener.in")
+    parser.add_argument("--base-url", default=SCREENER_URL)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=2.0, help="requests per second")
+    parser.add_argument("--ttl", type=float, default=CACHE_TTL, help="cache TTL in seconds")
+    args = parser.parse_args()
+
     print(f"ka{len(symbols)}")
-    write_csv()
+    caps, errors = write_csv(base_url=args.base_url, workers=args.workers,
+                             rate=args.rate, ttl=args.ttl)
+    print(f"✅ {len(caps)} market caps written, {len(errors)} failed")
+    if errors:
+        sys.exit(1)
@@ -0,0 +1,67 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from instrumentation import inc
+
+
+class RateLimiter:
+    """Thread-safe token bucket, one bucket per host.
+
+    `rate` tokens are added per second up to `burst`; acquire() blocks until
+    a token for the URL's host is available.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def acquire(self, url):
+        host = urlsplit(url).netloc
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return
+                self._buckets[host] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Exponential backoff with full jitter for retry number `attempt` (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def get_with_retries(session, url, limiter=None, retries=4, timeout=30, **kwargs):
+    """GET through `limiter`, retrying connection errors and 429/5xx.
+
+    Returns the last response; raises the last exception if every attempt
+    failed to connect.
+    """
+    import requests
+
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire(url)
+        try:
+            response = session.get(url, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                if not kwargs.get("stream"):
+                    inc("download_bytes", len(response.content), host=urlsplit(url).netloc)
+                return response
+        inc("http_retries", host=urlsplit(url).netloc)
+        time.sleep(backoff_delay(attempt))
@@ -0,0 +1,194 @@
+"""
+Typed row model for BhavCopy data.
+
+BhavRow is a __slots__ record for code that wants one row at a time;
+DayBatch holds a whole day as struct-of-arrays (NumPy columns, with text
+columns dictionary-encoded). Numbers and dates are parsed once on read, and
+the always-empty Rmks/Rsvd1-4 columns are dropped.
+
+    for row in iter_rows(path):
+        row.TckrSymb, row.ClsPric
+
+    batch = DayBatch.from_zip(path)
+    batch["ClsPric"][batch.mask("SctySrs", "EQ")]
+
+    python records.py            # memory/throughput vs csv.DictReader
+"""
+
+import numpy as np
+
+from bhavcopy import COLUMNS, FLOAT_COLUMNS, INT_COLUMNS, read_columns
+
+DROPPED_COLUMNS = ("Rmks", "Rsvd1", "Rsvd2", "Rsvd3", "Rsvd4")
+RECORD_COLUMNS = tuple(c for c in COLUMNS if c not in DROPPED_COLUMNS)
+
+# Parsed to YYYYMMDD ints (0 when empty)
+DATE_COLUMNS = ("TradDt", "BizDt", "XpryDt", "FininstrmActlXpryDt")
+TEXT_COLUMNS = tuple(c for c in RECORD_COLUMNS
+                     if c not in FLOAT_COLUMNS + INT_COLUMNS + DATE_COLUMNS)
+
+_DATE_INDEX = tuple(RECORD_COLUMNS.index(c) for c in DATE_COLUMNS)
+
+
+def _date(value):
+    return int(value.replace("-", "")) if value else 0
+
+
+def _parsed_rows(zip_path, where=None):
+    """read_columns() over RECORD_COLUMNS with the date columns made ints."""
+    for values in read_columns(zip_path, RECORD_COLUMNS, where):
+        values = list(values)
+        for i in _DATE_INDEX:
+            values[i] = _date(values[i])
+        yield values
+
+
+class BhavRow:
+    """One BhavCopy row; attribute names are the UDiFF column names."""
+
+    __slots__ = RECORD_COLUMNS
+
+    def __init__(self, *values):
+        for name, value in zip(RECORD_COLUMNS, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f"BhavRow({self.TradDt}, {self.TckrSymb!r}, {self.SctySrs!r}, ClsPric={self.ClsPric})"
+
+    def __eq__(self, other):
+        # NaN (an empty price) compares equal to NaN here
+        return isinstance(other, BhavRow) and all(
+            a == b or (a != a and b != b) for a, b in zip(self.astuple(), other.astuple()))
+
+    def astuple(self):
+        return tuple(getattr(self, name) for name in RECORD_COLUMNS)
+
+    def asdict(self):
+        return {name: getattr(self, name) for name in RECORD_COLUMNS}
+
+
+def iter_rows(zip_path, where=None):
+    """Stream BhavRow records out of a mirrored zip; `where` as in read_columns()."""
+    for values in _parsed_rows(zip_path, where):
+        yield BhavRow(*values)
+
+
+class DayBatch:
+    """A day's rows as columns.
+
+    Numeric and date columns are NumPy arrays (float64 prices, int64
+    volumes/OI, int32 dates). Text columns are int32 codes into
+    `dictionaries[name]`; use strings() to decode one.
+    """
+
+    def __init__(self, columns, dictionaries):
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    @classmethod
+    def from_zip(cls, zip_path, where=None):
+        rows = list(_parsed_rows(zip_path, where))
+        fields = list(zip(*rows)) if rows else [()] * len(RECORD_COLUMNS)
+        columns, dictionaries = {}, {}
+        for name, values in zip(RECORD_COLUMNS, fields):
+            if name in FLOAT_COLUMNS:
+                columns[name] = np.array(values, dtype=np.float64)
+            elif name in INT_COLUMNS:
+                columns[name] = np.array(values, dtype=np.int64)
+            elif name in DATE_COLUMNS:
+                columns[name] = np.array(values, dtype=np.int32)
+            else:
+                lookup = {}
+                codes = [lookup.setdefault(v, len(lookup)) for v in values]
+                dictionaries[name] = list(lookup)
+                columns[name] = np.array(codes, dtype=np.int32)
+        return cls(columns, dictionaries)
+
+    def __len__(self):
+        return len(self.columns["TradDt"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def strings(self, name):
+        values = self.dictionaries[name]
+        return [values[c] for c in self.columns[name]]
+
+    def mask(self, name, value):
+        """Boolean mask of rows whose text column equals `value` (or is in a collection)."""
+        values = [value] if isinstance(value, str) else value
+        lookup = {v: i for i, v in enumerate(self.dictionaries[name])}
+        return np.isin(self.columns[name], [lookup[v] for v in values if v in lookup])
+
+    def row(self, i):
+        return BhavRow(*(self.dictionaries[name][int(self.columns[name][i])] if name in self.dictionaries
+                         else self.columns[name][i].item() for name in RECORD_COLUMNS))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    @property
+    def nbytes(self):
+        """Array bytes plus the dictionary strings."""
+        strings = sum(len(v) for values in self.dictionaries.values() for v in values)
+        return sum(a.nbytes for a in self.columns.values()) + strings
+
+
+def _dict_rows(zip_path):
+    import csv
+    from bhavcopy import open_csv
+
+    with open_csv(zip_path) as f:
+        return list(csv.DictReader(f))
+
+
+def compare_models(zip_paths):
+    """Peak memory, retained memory and rows/s for dicts, BhavRow and DayBatch.
+
+    The dict rows keep every field as an unparsed string, so their rows/s
+    leaves out the number parsing the typed models have already done.
+    """
+    import gc
+    import time
+    import tracemalloc
+
+    loaders = {
+        "csv.DictReader": _dict_rows,
+        "BhavRow": lambda p: list(iter_rows(p)),
+        "DayBatch": DayBatch.from_zip,
+    }
+    results = {}
+    for label, load in loaders.items():
+        # Timed and traced separately: tracemalloc slows allocation-heavy code
+        gc.collect()
+        start = time.perf_counter()
+        loaded = [load(p) for p in zip_paths]
+        elapsed = time.perf_counter() - start
+        del loaded
+        gc.collect()
+        tracemalloc.start()
+        loaded = [load(p) for p in zip_paths]
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rows = sum(len(day) for day in loaded)
+        results[label] = {
+            "rows": rows,
+            "rows_per_sec": round(rows / elapsed),
+            "retained_mb": round(retained / 1e6, 2),
+            "peak_mb": round(peak / 1e6, 2),
+            "bytes_per_row": round(retained / rows) if rows else None,
+        }
+        del loaded
+    return results
+
+
+if __name__ == "__main__":
+    from bhavcopy import BHAVCOPY_DIR, day_files
+
+    zips = day_files(BHAVCOPY_DIR)
+    print(f"📅 {len(zips)} sample days")
+    for label, stats in compare_models(zips).items():
+        print(f"{label:<15} {stats['rows_per_sec']:>9,} rows/s  "
+              f"{stats['retained_mb']:>7.2f} MB retained  {stats['peak_mb']:>7.2f} MB peak  "
+              f"{stats['bytes_per_row']:>5} B/row")
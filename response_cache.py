@@ -0,0 +1,175 @@
+"""
+Response cache for analytics endpoints, keyed on the store version.
+
+Results such as /v1/analytics/sma-nearby only change when the store does:
+a new bhavcopy day, a republished day that rewrites the history, or an edit
+to corporate_actions.csv that changes adjusted prices. Entries are keyed on
+(endpoint, params, store version), where the version is the latest trade
+date plus the mtime/size stamps of store/history/meta.json and the actions
+file. The stamps are checked on every lookup; when the version moves, every
+entry for an older one is dropped from memory and disk. Memory is an LRU;
+the disk layer (JSON files) is optional and survives restarts.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from adjustments import ACTIONS_CSV
+from bhavcopy_store import STORE_DIR, history_stamp
+from instrumentation import inc, stage
+
+DISK_CACHE_DIR = os.environ.get("BHAVCOPY_RESPONSE_CACHE_DIR")
+
+
+class ResponseCache:
+    def __init__(self, maxsize=256, store_dir=STORE_DIR, disk_dir=DISK_CACHE_DIR,
+                 actions_csv=ACTIONS_CSV):
+        self.maxsize = maxsize
+        self.store_dir = Path(store_dir)
+        self.meta_path = self.store_dir / "history" / "meta.json"
+        self.actions_csv = Path(actions_csv)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stamp = None
+        self._trade_date = None
+        self._version = None
+        self.hits = self.misses = self.disk_hits = 0
+        self.evictions = self.invalidations = 0
+
+    def version(self):
+        """Current store version; meta.json is re-read only when its stamp changes."""
+        try:
+            actions = self.actions_csv.stat().st_mtime_ns
+        except FileNotFoundError:
+            actions = None
+        stamp = (history_stamp(self.store_dir), actions)
+        if stamp != self._stamp:
+            trade_date = self._trade_date
+            if stamp[0] != (self._stamp[0] if self._stamp else None):
+                trade_date = None
+                if stamp[0] is not None:
+                    with open(self.meta_path) as f:
+                        dates = json.load(f)["dates"]
+                    trade_date = dates[-1] if dates else None
+            version = f"{trade_date}:{hashlib.sha1(repr(stamp).encode()).hexdigest()[:12]}"
+            with self._lock:
+                self._stamp = stamp
+                self._trade_date = trade_date
+                if version != self._version:
+                    self._version = version
+                    self._drop_stale(version)
+        return self._version
+
+    def trade_date(self):
+        """Latest ingested trade date."""
+        self.version()
+        return self._trade_date
+
+    @staticmethod
+    def key(endpoint, params, version):
+        return json.dumps([endpoint, params, version], sort_keys=True, default=str)
+
+    def _disk_path(self, key):
+        return self.disk_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+
+    def get_or_compute(self, endpoint, params, compute):
+        """Cached result of compute() for these params and the current store version."""
+        version = self.version()
+        key = self.key(endpoint, params, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            inc("cache_lookups", endpoint=endpoint, result="hit")
+            return entry[1]
+
+        if self.disk_dir is not None:
+            try:
+                with open(self._disk_path(key)) as f:
+                    value = json.load(f)["value"]
+            except (OSError, ValueError, KeyError):
+                pass
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+                    self.hits += 1
+                    self._put(key, version, value)
+                inc("cache_lookups", endpoint=endpoint, result="disk_hit")
+                return value
+
+        inc("cache_lookups", endpoint=endpoint, result="miss")
+        with stage("compute", endpoint=endpoint):
+            value = compute()
+        with self._lock:
+            self.misses += 1
+            self._put(key, version, value)
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            path = self._disk_path(key)
+            tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump({"version": version, "value": value}, f)
+            os.replace(tmp, path)
+        return value
+
+    def _put(self, key, version, value):
+        self._entries[key] = (version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _drop_stale(self, version):
+        stale = [k for k, (v, _) in self._entries.items() if v != version]
+        for k in stale:
+            del self._entries[k]
+        self.invalidations += len(stale)
+        if self.disk_dir is not None and self.disk_dir.exists():
+            for path in self.disk_dir.glob("*.json"):
+                try:
+                    with open(path) as f:
+                        if json.load(f).get("version") == version:
+                            continue
+                except (OSError, ValueError):
+                    pass
+                path.unlink(missing_ok=True)
+                self.invalidations += 1
+
+    def invalidate(self):
+        """Drop entries for anything but the store's current version."""
+        self._stamp = None
+        self.version()
+        with self._lock:
+            self._drop_stale(self._version)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            if self.disk_dir is not None and self.disk_dir.exists():
+                for path in self.disk_dir.glob("*.json"):
+                    path.unlink(missing_ok=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "trade_date": self._trade_date,
+                "version": self._version,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "disk": str(self.disk_dir) if self.disk_dir else None,
+            }
@@ -0,0 +1,190 @@
+"""
+Prebuilt binary snapshot of the analytics service's warm state.
+
+A fresh API process would otherwise replay the whole history through the
+IndicatorEngine and read the symbol index before it can answer. build()
+writes that state into one file, store/snapshot.bin:
+
+  latest prices     every row of the latest trade date: symbol, series,
+                    OHLC, previous close and volume
+  indicator state   the IndicatorEngine ring buffer, running sums, EMA and
+                    RSI averages
+  symbol index      the CSR offsets/rows and ticker spans of SymbolIndex
+
+Snapshot() maps the file and hands out NumPy views straight onto it. The
+mapping is copy-on-write, so the engine can go on updating in memory
+without touching the file. A snapshot older than the store still helps:
+the engine and index catch up from the day it stops.
+
+Layout: b"BHSNAP1\n", a little-endian uint64 header length, a JSON header
+(each array's offset, dtype and shape plus the small metadata), then the
+arrays, each aligned to 64 bytes.
+
+    python snapshot.py            # rebuild after the daily update
+    python snapshot.py --check    # time loading it the way a cold start does
+"""
+
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from bhavcopy_store import STORE_DIR, History
+
+MAGIC = b"BHSNAP1\n"
+SNAPSHOT_FILE = "snapshot.bin"
+ALIGN = 64
+
+LATEST_COLUMNS = ("OpnPric", "HghPric", "LwPric", "ClsPric", "PrvsClsgPric", "TtlTradgVol")
+
+
+class LatestPrices:
+    """The latest trade date's rows, looked up by (symbol, series)."""
+
+    def __init__(self, trade_date, symbols, series, columns):
+        self.trade_date = trade_date
+        self.symbols = symbols
+        self.series = series
+        self.columns = columns
+        self._rows = None
+
+    @classmethod
+    def from_history(cls, history):
+        if not len(history.dates):
+            return cls(None, [], [], {name: np.empty(0) for name in LATEST_COLUMNS})
+        trade_date = int(history.dates[-1])
+        sl = history.day_slice(trade_date)
+        symbols = history.symbols(history.column("TckrSymb")[sl])
+        series = [history.dicts["SctySrs"][c] for c in history.column("SctySrs")[sl]]
+        columns = {name: np.asarray(history.column(name)[sl]) for name in LATEST_COLUMNS}
+        return cls(trade_date, symbols, series, columns)
+
+    def get(self, symbol, series="EQ"):
+        if self._rows is None:
+            self._rows = {key: i for i, key in enumerate(zip(self.symbols, self.series))}
+        i = self._rows.get((symbol, series))
+        if i is None:
+            return None
+        row = {"trade_date": self.trade_date, "symbol": symbol, "series": series}
+        row.update({name: self.columns[name][i].item() for name in LATEST_COLUMNS})
+        return row
+
+
+def _write(path, meta, arrays):
+    """Header plus 64-byte aligned arrays, written to a temp file and renamed."""
+    layout, offset = {}, 0
+    for name, values in arrays.items():
+        values = np.asarray(values, order="C")  # ascontiguousarray would make 0-d arrays 1-d
+        arrays[name] = values
+        layout[name] = [offset, values.dtype.str, list(values.shape)]
+        offset += -(-values.nbytes // ALIGN) * ALIGN
+    header = json.dumps({"meta": meta, "arrays": layout}).encode()
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for name, values in arrays.items():
+            f.seek(start + layout[name][0])
+            f.write(values.tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, path)
+
+
+def build(store_dir=STORE_DIR, path=None):
+    """Bring indicators and the index up to date and write the snapshot."""
+    from indicators import refresh_indicators
+    from symbol_index import load_index
+
+    history = History(store_dir)
+    engine, _ = refresh_indicators(store_dir)
+    index = load_index(store_dir)
+    latest = LatestPrices.from_history(history)
+
+    arrays = {f"engine/{name}": values for name, values in engine.arrays().items()}
+    arrays.update({"index/offsets": index.offsets, "index/rows": index.rows})
+    arrays.update({f"latest/{name}": values for name, values in latest.columns.items()})
+    meta = {
+        "trade_date": latest.trade_date,
+        "index": {"dates": index.dates, "tickers": index.tickers},
+        "latest": {"symbols": latest.symbols, "series": latest.series},
+    }
+    path = Path(path or Path(store_dir) / SNAPSHOT_FILE)
+    _write(path, meta, arrays)
+    return path
+
+
+class Snapshot:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            # Copy-on-write: views are writable, writes never reach the file
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a snapshot")
+        (length,) = struct.unpack_from("<Q", self._map, len(MAGIC))
+        header = json.loads(self._map[len(MAGIC) + 8:len(MAGIC) + 8 + length])
+        start = -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+        self.meta = header["meta"]
+        self.trade_date = self.meta["trade_date"]
+        self.arrays = {}
+        for name, (offset, dtype, shape) in header["arrays"].items():
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape, dtype=np.int64))
+            self.arrays[name] = np.frombuffer(self._map, dtype, count, start + offset).reshape(tuple(shape))
+
+    def _group(self, prefix):
+        return {name[len(prefix):]: values for name, values in self.arrays.items()
+                if name.startswith(prefix)}
+
+    def engine(self):
+        from indicators import IndicatorEngine
+
+        return IndicatorEngine.from_arrays(self._group("engine/"))
+
+    def index(self, store_dir=STORE_DIR):
+        from symbol_index import SymbolIndex
+
+        meta = self.meta["index"]
+        return SymbolIndex.from_arrays(store_dir, meta["dates"], meta["tickers"],
+                                       self.arrays["index/offsets"], self.arrays["index/rows"])
+
+    def latest(self):
+        meta = self.meta["latest"]
+        return LatestPrices(self.trade_date, meta["symbols"], meta["series"], self._group("latest/"))
+
+
+def load_snapshot(store_dir=STORE_DIR):
+    """The store's snapshot, or None when there is none (or it is unreadable)."""
+    path = Path(store_dir) / SNAPSHOT_FILE
+    try:
+        return Snapshot(path)
+    except (OSError, ValueError):
+        return None
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build the analytics warm-start snapshot")
+    parser.add_argument("--store", default=STORE_DIR, type=Path)
+    parser.add_argument("--check", action="store_true", help="time loading instead of building")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.check:
+        snapshot = load_snapshot(args.store)
+        if snapshot is None:
+            raise SystemExit(f"❌ No snapshot in {args.store}")
+        engine, index, latest = snapshot.engine(), snapshot.index(args.store), snapshot.latest()
+        print(f"⚡ Loaded {snapshot.trade_date}: {len(engine.dates)} engine days, "
+              f"{len(index.rows):,} indexed rows, {len(latest.symbols)} latest rows "
+              f"in {(time.perf_counter() - start) * 1000:.2f}ms")
+    else:
+        path = build(args.store)
+        print(f"✅ Wrote {path} ({path.stat().st_size / 1e6:.1f} MB) "
+              f"in {time.perf_counter() - start:.2f}s")
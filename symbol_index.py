@@ -0,0 +1,224 @@
+"""
+Per-instrument row index over store/history.
+
+History rows are laid out day by day, so one symbol's rows are spread
+across every day. This index groups the row numbers by ISIN in CSR form:
+
+  store/index/offsets.bin   int64, one entry per ISIN code plus one
+  store/index/rows.bin      int64 history row numbers, grouped by ISIN and
+                            in date order within each group
+  store/index/meta.json     indexed dates and each ISIN's tickers over time
+
+ISIN rather than TckrSymb is the key so renames (ZOMATO -> ETERNAL) keep one
+continuous history; a ticker resolves to the ISIN it most recently traded
+under. Updating after an append only merges the new day's rows into the
+existing groups; a history rebuild (an older day was inserted) triggers a
+full rebuild.
+
+    python symbol_index.py RELIANCE --last 200
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from bhavcopy_store import STORE_DIR, History
+
+
+def _save_array(path, values):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(np.ascontiguousarray(values, dtype=np.int64).tobytes())
+    os.replace(tmp, path)
+
+
+class SymbolIndex:
+    def __init__(self, store_dir=STORE_DIR, load=True):
+        self.store_dir = Path(store_dir)
+        self.index_dir = self.store_dir / "index"
+        self.dates = []
+        self.tickers = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.rows = np.empty(0, dtype=np.int64)
+        self._history = None
+        self._by_ticker = None
+
+        meta_path = self.index_dir / "meta.json"
+        if load and meta_path.exists():
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.dates = meta["dates"]
+            self.tickers = {int(k): v for k, v in meta["tickers"].items()}
+            self.offsets = np.fromfile(self.index_dir / "offsets.bin", dtype=np.int64)
+            self.rows = np.fromfile(self.index_dir / "rows.bin", dtype=np.int64)
+
+    @classmethod
+    def from_arrays(cls, store_dir, dates, tickers, offsets, rows):
+        """An index over given state (e.g. a snapshot) instead of store/index."""
+        index = cls(store_dir, load=False)
+        index.dates = list(dates)
+        index.tickers = {int(k): v for k, v in tickers.items()}
+        index.offsets, index.rows = offsets, rows
+        return index
+
+    @property
+    def history(self):
+        if self._history is None:
+            self._history = History(self.store_dir)
+        return self._history
+
+    def update(self):
+        """Index any history days added since the last update. Returns rows added."""
+        self._history = None
+        history = self.history
+        dates = history.dates.tolist()
+        if dates[:len(self.dates)] != self.dates:
+            # History was rebuilt and row numbers moved; start over
+            self.dates, self.tickers = [], {}
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.rows = np.empty(0, dtype=np.int64)
+        if len(dates) == len(self.dates):
+            return 0
+
+        start = int(history.offsets[len(self.dates)])
+        new_isin = np.asarray(history.column("ISIN")[start:])
+        new_rows = np.arange(start, history.n_rows, dtype=np.int64)
+
+        # Existing rows are grouped by ISIN and all new rows come after them, so
+        # a stable sort over the concatenation is a linear merge of two runs
+        n_isin = len(history.dicts["ISIN"])
+        old_isin = np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+        isin = np.concatenate([old_isin, new_isin])
+        order = np.argsort(isin, kind="stable")
+        self.rows = np.concatenate([self.rows, new_rows])[order]
+        self.offsets = np.zeros(n_isin + 1, dtype=np.int64)
+        np.cumsum(np.bincount(isin, minlength=n_isin), out=self.offsets[1:])
+
+        self._track_tickers(history, start, new_isin)
+        self.dates = dates
+        self._by_ticker = None
+        self.save()
+        return len(new_rows)
+
+    def _track_tickers(self, history, start, new_isin):
+        new_ticker = np.asarray(history.column("TckrSymb")[start:])
+        new_date = np.asarray(history.column("TradDt")[start:])
+        # Rows are in date order, so first/last occurrence give the date span
+        key = new_isin.astype(np.int64) << 32 | new_ticker.astype(np.int64)
+        pairs, first = np.unique(key, return_index=True)
+        _, last = np.unique(key[::-1], return_index=True)
+        last = len(key) - 1 - last
+        for i in np.argsort(first, kind="stable"):
+            isin, ticker = int(pairs[i] >> 32), history.dicts["TckrSymb"][pairs[i] & 0xFFFFFFFF]
+            day, until = int(new_date[first[i]]), int(new_date[last[i]])
+            spans = self.tickers.setdefault(isin, [])
+            if spans and spans[-1][0] == ticker:
+                spans[-1][2] = max(spans[-1][2], until)
+            else:
+                spans.append([ticker, day, until])
+
+    def save(self):
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        _save_array(self.index_dir / "offsets.bin", self.offsets)
+        _save_array(self.index_dir / "rows.bin", self.rows)
+        meta_path = self.index_dir / "meta.json"
+        tmp = meta_path.with_name("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"dates": self.dates, "tickers": self.tickers}, f)
+        os.replace(tmp, meta_path)
+
+    def isin(self, symbol, series="EQ"):
+        """ISIN code for a ticker or ISIN string, or -1.
+
+        A ticker shared by several ISINs (an equity and its debentures, say)
+        resolves to the most recent one with rows in `series`, else to the
+        most recent one.
+        """
+        code = self.history.code("ISIN", symbol)
+        if code >= 0:
+            return code
+        if self._by_ticker is None:
+            candidates = {}
+            for isin, spans in self.tickers.items():
+                for ticker, _, last in spans:
+                    candidates.setdefault(ticker, []).append((last, isin))
+            self._by_ticker = {ticker: [isin for _, isin in sorted(pairs, reverse=True)]
+                               for ticker, pairs in candidates.items()}
+        candidates = self._by_ticker.get(symbol)
+        if not candidates:
+            return -1
+        if series is not None and len(candidates) > 1:
+            codes = self._series_codes(series)
+            column = self.history.column("SctySrs")
+            for isin in candidates:
+                if np.isin(column[self.rows[self.offsets[isin]:self.offsets[isin + 1]]], codes).any():
+                    return isin
+        return candidates[0]
+
+    def _series_codes(self, series):
+        return [self.history.code("SctySrs", s) for s in ([series] if isinstance(series, str) else series)]
+
+    def aliases(self, symbol, series="EQ"):
+        """[(ticker, first_date, last_date), ...] the instrument has traded under."""
+        return [tuple(span) for span in self.tickers.get(self.isin(symbol, series), [])]
+
+    def symbol_rows(self, symbol, series="EQ", start=None, end=None, last=None):
+        """History row numbers for one instrument, in date order."""
+        code = self.isin(symbol, series)
+        if code < 0 or code + 1 >= len(self.offsets):
+            raise KeyError(symbol)
+        rows = self.rows[self.offsets[code]:self.offsets[code + 1]]
+        history = self.history
+        if series is not None:
+            rows = rows[np.isin(history.column("SctySrs")[rows], self._series_codes(series))]
+        if start is not None or end is not None:
+            days = history.column("TradDt")[rows]
+            keep = np.ones(len(rows), dtype=bool)
+            if start is not None:
+                keep &= days >= start
+            if end is not None:
+                keep &= days <= end
+            rows = rows[keep]
+        if last is not None:
+            rows = rows[-last:] if last else rows[:0]
+        return rows
+
+    def series(self, symbol, column="ClsPric", **kwargs):
+        """(dates, values) of one column for one instrument; see symbol_rows()."""
+        rows = self.symbol_rows(symbol, **kwargs)
+        history = self.history
+        return np.asarray(history.column("TradDt")[rows]), np.asarray(history.column(column)[rows])
+
+
+def load_index(store_dir=STORE_DIR):
+    """Open the index, bringing it up to date with the history first."""
+    index = SymbolIndex(store_dir)
+    index.update()
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Per-symbol history from the columnar store")
+    parser.add_argument("symbol", help="ticker or ISIN")
+    parser.add_argument("--column", default="ClsPric")
+    parser.add_argument("--series", default="EQ")
+    parser.add_argument("--last", type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = load_index()
+    print(f"✅ Index covers {len(index.dates)} days ({time.perf_counter() - start:.3f}s)")
+
+    start = time.perf_counter()
+    dates, values = index.series(args.symbol, args.column, series=args.series, last=args.last)
+    elapsed = (time.perf_counter() - start) * 1000
+    for ticker, first, last in index.aliases(args.symbol, args.series):
+        print(f"📛 {ticker}: {first} → {last}")
+    for day, value in zip(dates, values):
+        print(f"📅 {day}  {value}")
+    print(f"⚡ {len(values)} rows in {elapsed:.2f}ms")
@@ -0,0 +1,23 @@
+import pytest
+
+from adjustments import snap_factor
+
+
+@pytest.mark.parametrize("prev_close, last_close, factor", [
+    (500.0, 1000.0, 0.5),      # 1:1 bonus or 1:2 split
+    (200.0, 1000.0, 0.2),      # 1:5 split
+    (1500.0, 1000.0, 1.5),     # 3:2 consolidation
+    (666.65, 1000.0, 2 / 3),   # 1:2 bonus, PrvsClsgPric on the tick
+    (0.55, 1.10, 0.5),         # cheap stock: a tick of slack
+])
+def test_snaps_simple_fractions(prev_close, last_close, factor):
+    assert snap_factor(prev_close, last_close) == pytest.approx(factor)
+
+
+@pytest.mark.parametrize("prev_close, last_close", [
+    (1010.0, 1000.0),   # within MIN_MOVE of 1
+    (965.0, 1000.0),    # 3.5% move, nowhere near p/q with q <= 20
+    (0.0, 1000.0),
+])
+def test_rejects_other_moves(prev_close, last_close):
+    assert snap_factor(prev_close, last_close) is None
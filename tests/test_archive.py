@@ -0,0 +1,55 @@
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from archive import Instruments, archive_zip, convert, extract_zip, read_day
+
+FIXTURES = sorted((Path(__file__).resolve().parent.parent / "public" / "bhavcopy").glob("*.zip"))
+
+
+def _member(zip_path):
+    with zipfile.ZipFile(zip_path) as zf:
+        info = next(i for i in zf.infolist() if i.filename.lower().endswith(".csv"))
+        return info.filename, info.date_time, zf.read(info)
+
+
+@pytest.mark.parametrize("zip_path", FIXTURES[:2], ids=lambda p: p.stem)
+def test_day_round_trips(zip_path, tmp_path):
+    archived = archive_zip(zip_path, tmp_path)
+    assert archived == tmp_path / f"{zip_path.stem}.bca"
+    name, date_time, original = _member(zip_path)
+    meta, csv_bytes = read_day(zip_path.stem, tmp_path)
+    assert csv_bytes == original
+    assert meta["member"] == name
+
+    out = extract_zip(zip_path.stem, tmp_path / "out.zip", tmp_path)
+    assert _member(out) == (name, date_time, original)
+
+
+def test_quoted_csv_is_kept_verbatim(tmp_path):
+    name, _, original = _member(FIXTURES[0])
+    lines = original.split(b"\n")
+    fields = lines[1].split(b",")
+    fields[-1] = b'"quoted"'
+    odd = b"\n".join([lines[0], b",".join(fields), *lines[2:]])
+    zip_path = tmp_path / "20250618.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr(name, odd)
+    archive_zip(zip_path, tmp_path / "archive")
+    meta, csv_bytes = read_day("20250618", tmp_path / "archive")
+    assert meta["mode"] == "csv"
+    assert csv_bytes == odd
+
+
+def test_convert_shares_instruments_and_removes_zips(tmp_path):
+    mirror = tmp_path / "bhavcopy"
+    mirror.mkdir()
+    for zip_path in FIXTURES[:3]:
+        (mirror / zip_path.name).write_bytes(zip_path.read_bytes())
+    converted = convert(mirror, tmp_path / "archive", verify=True, remove_zips=True)
+    assert [p.name for p in converted] == [p.name for p in FIXTURES[:3]]
+    assert list(mirror.iterdir()) == []
+    instruments = Instruments(tmp_path / "archive")
+    for zip_path in FIXTURES[:3]:
+        assert read_day(zip_path.stem, tmp_path / "archive", instruments)[1] == _member(zip_path)[2]
@@ -0,0 +1,85 @@
+import pytest
+
+from bulk_loader import StubConnection
+from db import Database
+
+
+class CountingConnection(StubConnection):
+    opened = 0
+
+    def __init__(self):
+        super().__init__()
+        CountingConnection.opened += 1
+
+
+@pytest.fixture(autouse=True)
+def reset_counter():
+    CountingConnection.opened = 0
+
+
+def test_pool_is_bounded_and_times_out():
+    db = Database(connect=CountingConnection, maxconn=2, timeout=0.05)
+    first, second = db.pool.get(), db.pool.get()
+    assert db.pool.stats() == {"max": 2, "idle": 0, "in_use": 2}
+    with pytest.raises(TimeoutError):
+        db.pool.get()
+    db.pool.put(first)
+    assert db.pool.get() is first
+    assert CountingConnection.opened == 2
+    db.pool.put(first)
+    db.pool.put(second)
+    assert db.pool.stats() == {"max": 2, "idle": 2, "in_use": 0}
+
+
+def test_failed_connect_releases_its_slot():
+    def refuse():
+        raise ConnectionError("refused")
+
+    db = Database(connect=refuse, maxconn=1, timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            db.pool.get()
+    assert db.pool.stats()["in_use"] == 0
+
+
+def test_statements_are_prepared_once_per_connection():
+    db = Database(connect=CountingConnection, maxconn=1)
+    assert db.latest_close(["RELIANCE", "TCS"]) == {}
+    assert db.latest_close("RELIANCE") == {}
+    assert db.price_window("TCS", 5) == []
+    conn = db.pool.get()
+    prepares = [sql for sql in conn.statements if sql.startswith("PREPARE")]
+    executes = [sql for sql in conn.statements if sql.startswith("EXECUTE")]
+    assert [sql.split()[1] for sql in prepares] == ["latest_close", "price_window"]
+    assert len(executes) == 3
+    assert CountingConnection.opened == 1
+
+
+def test_connection_whose_rollback_fails_is_discarded():
+    class BrokenRollback(CountingConnection):
+        def rollback(self):
+            raise OSError("server closed the connection")
+
+    db = Database(connect=BrokenRollback, maxconn=1)
+    db.latest_close("RELIANCE")
+    assert db.pool.stats() == {"max": 1, "idle": 0, "in_use": 0}
+    assert db._prepared == {}
+    db.latest_close("RELIANCE")
+    assert BrokenRollback.opened == 2
+
+
+def test_executemany_pages_rows():
+    batches = []
+
+    class PagingConnection(StubConnection):
+        def cursor(self):
+            cursor = super().cursor()
+            cursor.executemany = lambda sql, rows: batches.append(len(rows))
+            return cursor
+
+    db = Database(connect=PagingConnection, maxconn=1)
+    rows = ((i, i * 2) for i in range(2500))
+    assert db.executemany("INSERT INTO t VALUES (%s, %s)", rows, page_size=1000) == 2500
+    assert batches == [1000, 1000, 500]
+    assert db.executemany("INSERT INTO t VALUES (%s, %s)", [], page_size=1000) == 0
+    assert batches == [1000, 1000, 500]
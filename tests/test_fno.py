@@ -0,0 +1,32 @@
+import numpy as np
+
+from fno import _dates, max_pain
+
+
+def _brute_force(strikes, ce_oi, pe_oi):
+    def payout(settle):
+        return sum(ce * max(settle - k, 0) + pe * max(k - settle, 0)
+                   for k, ce, pe in zip(strikes, ce_oi, pe_oi))
+    return min(strikes, key=payout)
+
+
+def test_max_pain_by_hand():
+    # Payouts: 100 -> 100, 110 -> 50, 120 -> 100
+    assert max_pain([100, 110, 120], [0, 10, 0], [0, 0, 5]) == 110.0
+    # All calls: writers pay nothing when it settles at the lowest strike
+    assert max_pain([100, 110, 120], [5, 5, 5], [0, 0, 0]) == 100.0
+    assert max_pain([100, 110, 120], [0, 0, 0], [5, 5, 5]) == 120.0
+
+
+def test_max_pain_matches_brute_force():
+    rng = np.random.default_rng(7)
+    for _ in range(20):
+        strikes = np.sort(rng.choice(np.arange(50, 150) * 10.0, size=15, replace=False))
+        ce_oi, pe_oi = rng.integers(0, 1000, 15), rng.integers(0, 1000, 15)
+        assert max_pain(strikes, ce_oi, pe_oi) == _brute_force(strikes.tolist(), ce_oi.tolist(), pe_oi.tolist())
+
+
+def test_dates():
+    values = np.array([b"2025-07-31", b"", b"2024-01-02"])
+    assert _dates(values).tolist() == [20250731, 0, 20240102]
+    assert _dates(values[:0]).tolist() == []
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from indicators import sma_backfill
+
+
+class _History:
+    """Ten sessions of two symbols, closes 1..10 and 10..100."""
+
+    def __init__(self):
+        self.dates = np.arange(20240101, 20240111)
+
+    def pivot(self, name, start=None, series=None):
+        dates = self.dates if start is None else self.dates[self.dates >= start]
+        closes = np.stack([dates - 20240100, (dates - 20240100) * 10], axis=1).astype(float)
+        return dates, np.array([0, 1]), closes
+
+
+def test_backfill_keeps_last_days():
+    dates, codes, closes, smas, near = sma_backfill(_History(), periods=(3,), days=2)
+    assert dates.tolist() == [20240109, 20240110]
+    assert smas[3][:, 0].tolist() == [8.0, 9.0]
+
+
+@pytest.mark.parametrize("days", [0, -1])
+def test_backfill_rejects_empty_window(days):
+    with pytest.raises(ValueError):
+        sma_backfill(_History(), periods=(3,), days=days)
@@ -1,38 +1,270 @@
-import requests
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import zipfile
 from datetime import date
 from pathlib import Path
 import subprocess
 
-def download_and_commit():
-    today = date.today()
-    yyyymmdd = today.strftime('%Y%m%d')
-    # yyyymmdd = '20250702'
-    url = f"https://nsearchives.nseindia.com/content/cm/BhavCopy_NSE_CM_0_0_0_{yyyymmdd}_F_0000.csv.zip"
+from adjustments import STATE_FILE as ADJUSTMENTS_FILE
+from archive import ARCHIVE_DIR, archive_zip, day_path, read_day
+from bhavcopy import check_payload
+from bhavcopy_store import ingest_zip, rebuild_history
+from fno import fo_bhavcopy_url, ingest_fo, stored_fo_dates
+from indicators import STATE_FILE, refresh_indicators
+from instrumentation import Run, inc, print_summary, stage
+from response_cache import ResponseCache
+from snapshot import build as build_snapshot
+from symbol_index import SymbolIndex
 
-    headers = {
-        "User-Agent": "Mozilla/5.0",
-        "Referer": "https://www.nseindia.com/"
-    }
+NSE_ARCHIVES = "https://nsearchives.nseindia.com"
 
-    dest_dir = Path("/Users/kavishambani/ka/market/nsemirror/public/bhavcopy")
-    dest_dir.mkdir(parents=True, exist_ok=True)
+DEST_DIR = Path("/Users/kavishambani/ka/market/nsemirror/public/bhavcopy")
+
+# Seconds to connect and between bytes; a stalled NSE connection fails the run instead of hanging it
+DOWNLOAD_TIMEOUT = 30
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Referer": "https://www.nseindia.com/"
+}
+
+# Archiving rewrites the shared instruments file; backfill saves from several threads
+_archive_lock = threading.Lock()
+
+
+def bhavcopy_url(yyyymmdd, base_url=NSE_ARCHIVES):
+    return f"{base_url}/content/cm/BhavCopy_NSE_CM_0_0_0_{yyyymmdd}_F_0000.csv.zip"
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_atomic(path, payload):
+    """Write via a temp file in the same directory, then rename over `path`."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _payload_csv(payload):
+    try:
+        with zipfile.ZipFile(io.BytesIO(payload)) as zf:
+            return zf.read(next(n for n in zf.namelist() if n.lower().endswith(".csv")))
+    except (zipfile.BadZipFile, StopIteration):
+        return None
+
+
+def save_bhavcopy(payload, yyyymmdd, dest_dir):
+    """Validate and store a downloaded zip.
+
+    Returns (path, status) where status is "unchanged" when the mirrored
+    day already has this exact content, "replaced" when NSE republished the
+    day, and "new" otherwise. Raises ValueError for an invalid payload.
+
+    When the mirror has an archive next to it (public/archive) the day is
+    published there and the zip is not kept; path is then the .bca.
+    """
+    dest_dir = Path(dest_dir)
     zip_path = dest_dir / f"{yyyymmdd}.zip"
+    archive_dir = dest_dir.parent / ARCHIVE_DIR.name
+    archived = day_path(yyyymmdd, archive_dir)
+    if zip_path.exists():
+        if sha256_file(zip_path) == hashlib.sha256(payload).hexdigest():
+            return zip_path, "unchanged"
+        status = "replaced"
+    elif archived.exists():
+        if read_day(yyyymmdd, archive_dir)[1] == _payload_csv(payload):
+            return archived, "unchanged"
+        status = "replaced"
+    else:
+        status = "new"
+    with stage("validate"):
+        check_payload(payload, yyyymmdd)
+    write_atomic(zip_path, payload)
+    if not archive_dir.exists():
+        return zip_path, status
+    with _archive_lock, stage("archive"):
+        archived = archive_zip(zip_path, archive_dir)
+    zip_path.unlink()
+    return archived, status
+
+
+def refresh_store(zip_path, store_dir, replaced=False):
+    """Ingest a saved zip and bring indicators, the symbol index and caches up to date."""
+    trade_date, added = ingest_zip(zip_path, store_dir)
+    if replaced and not added:
+        # Same day, new content: rebuild the history and derived state from scratch
+        rebuild_history(store_dir)
+        (Path(store_dir) / STATE_FILE).unlink(missing_ok=True)
+        (Path(store_dir) / "index" / "meta.json").unlink(missing_ok=True)
+        (Path(store_dir) / ADJUSTMENTS_FILE).unlink(missing_ok=True)
+        added = True
+    if added:
+        print(f"✅ Added {trade_date} to the columnar store")
+        # Indexed first: reseeding symbols for corporate actions reads the index
+        with stage("symbol_index"):
+            indexed = SymbolIndex(store_dir).update()
+        print(f"✅ Symbol index updated with {indexed} rows")
+        _, applied = refresh_indicators(store_dir)
+        print(f"✅ Indicators updated for {applied} new day(s)")
+        with stage("snapshot"):
+            build_snapshot(store_dir)
+        print("✅ Analytics snapshot rebuilt")
+        ResponseCache(store_dir=store_dir).invalidate()
+    return added
+
+
+def load_database(zip_path):
+    from bulk_loader import load_bhavcopy
+    from db import get_database
 
+    with get_database("ingest").connection() as conn:
+        load_bhavcopy(conn, zip_path)
+
+
+def update_fo(yyyymmdd, store_dir):
+    """Mirror the F&O bhavcopy into store/fo and load its option-chain aggregates.
+
+    The F&O zips stay out of the git-published mirror (they are ~10x the CM
+    file); a failure here is reported but never fails the CM update.
+    """
+    import requests
+
+    url = fo_bhavcopy_url(yyyymmdd)
     print(f"Downloading {url}...")
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        with open(zip_path, "wb") as f:
-            f.write(response.content)
-        print(f"✅ Saved: {zip_path}")
-
-        # Git commit and push
-        repo_dir = dest_dir.parent.parent
-        subprocess.run(["git", "add", "."], cwd=repo_dir)
-        subprocess.run(["git", "commit", "-m", f"Add BhavCopy for {yyyymmdd}"], cwd=repo_dir)
-        subprocess.run(["git", "push"], cwd=repo_dir)
-        print("✅ Git pushed to Vercel!")
-    else:
+    try:
+        with stage("download", segment="fo"):
+            response = requests.get(url, headers=HEADERS, timeout=DOWNLOAD_TIMEOUT)
+    except requests.RequestException as e:
+        print(f"❌ Failed to download F&O BhavCopy: {e}")
+        return False
+    inc("download_bytes", len(response.content), host="nsearchives.nseindia.com")
+    if response.status_code != 200:
+        print(f"❌ Failed to download F&O BhavCopy: {response.status_code}")
+        return False
+
+    fo_dir = Path(store_dir) / "fo"
+    fo_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        zip_path, status = save_bhavcopy(response.content, yyyymmdd, fo_dir)
+    except ValueError as e:
+        print(f"❌ Rejected F&O BhavCopy for {yyyymmdd}: {e}")
+        return False
+    db_path = Path(store_dir) / "fo.db"
+    if status == "unchanged" and int(yyyymmdd) in stored_fo_dates(db_path):
+        print(f"⚡ {zip_path} is unchanged, nothing to do")
+        return True
+    try:
+        stats = ingest_fo(zip_path, db_path)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"❌ Failed to load F&O BhavCopy for {yyyymmdd}: {e}")
+        return False
+    print(f"✅ Option chains updated: {stats['strikes']} strikes, "
+          f"{stats['expiries']} expiries, {stats['futures']} futures")
+    return True
+
+
+def git_commit_and_push(repo_dir, message, paths):
+    """Commit just `paths`, deleted ones included; nothing is pushed when they did not change."""
+    present = [str(p) for p in paths if Path(p).exists()]
+    gone = [str(p) for p in paths if not Path(p).exists()]
+    if present:
+        subprocess.run(["git", "add", "--", *present], cwd=repo_dir, check=True)
+    if gone:
+        subprocess.run(["git", "rm", "-q", "--cached", "--ignore-unmatch", "--", *gone], cwd=repo_dir, check=True)
+    if subprocess.run(["git", "diff", "--cached", "--quiet"], cwd=repo_dir).returncode == 0:
+        return False
+    subprocess.run(["git", "commit", "-m", message], cwd=repo_dir, check=True)
+    subprocess.run(["git", "push"], cwd=repo_dir, check=True)
+    return True
+
+
+def download_and_commit(yyyymmdd=None, dest_dir=DEST_DIR, load_db=False, push=True, fo=True):
+    import requests
+
+    yyyymmdd = yyyymmdd or date.today().strftime('%Y%m%d')
+    url = bhavcopy_url(yyyymmdd)
+
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"Downloading {url}...")
+    try:
+        with stage("download"):
+            response = requests.get(url, headers=HEADERS, timeout=DOWNLOAD_TIMEOUT)
+    except requests.RequestException as e:
+        print(f"❌ Failed to download BhavCopy: {e}")
+        return False
+    inc("download_bytes", len(response.content), host="nsearchives.nseindia.com")
+    if response.status_code != 200:
         print(f"❌ Failed to download BhavCopy: {response.status_code}")
+        return False
+
+    try:
+        path, status = save_bhavcopy(response.content, yyyymmdd, dest_dir)
+    except ValueError as e:
+        print(f"❌ Rejected BhavCopy for {yyyymmdd}: {e}")
+        return False
+    repo_dir = dest_dir.parent.parent
+    store_dir = repo_dir / "store"
+    # An archived day also rewrites instruments.json.xz and drops a mirrored zip
+    changed = [path]
+    if path.suffix == ".bca":
+        changed = [path.parent, dest_dir / f"{yyyymmdd}.zip"]
+    if status == "unchanged":
+        if (store_dir / "days" / f"{yyyymmdd}.npz").exists():
+            print(f"⚡ {path} is unchanged, nothing to do")
+            if fo:
+                update_fo(yyyymmdd, store_dir)
+            return True
+        # Saved by a run that stopped before ingesting; finish the job
+        refresh_store(path, store_dir)
+    else:
+        print(f"✅ Saved ({status}): {path}")
+        refresh_store(path, store_dir, replaced=status == "replaced")
+        if load_db:
+            load_database(path)
+    if fo:
+        update_fo(yyyymmdd, store_dir)
+
+    if push:
+        verb = "Update" if status == "replaced" else "Add"
+        with stage("git"):
+            pushed = git_commit_and_push(repo_dir, f"{verb} BhavCopy for {yyyymmdd}", changed)
+        if pushed:
+            print("✅ Git pushed to Vercel!")
+    return True
+
 
 if __name__ == "__main__":
-    download_and_commit()
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Mirror today's BhavCopy and refresh derived data")
+    parser.add_argument("--date", help="YYYYMMDD (default: today)")
+    parser.add_argument("--dest", default=DEST_DIR, type=Path)
+    parser.add_argument("--load-db", action="store_true", help="also upsert into Postgres")
+    parser.add_argument("--no-push", action="store_true")
+    parser.add_argument("--no-fo", action="store_true", help="skip the F&O bhavcopy")
+    parser.add_argument("--profile", choices=("cprofile", "sampling"),
+                        help="profile the run; output lands next to the run summary")
+    args = parser.parse_args()
+    with Run("daily-update", profile=args.profile) as run:
+        ok = download_and_commit(args.date, args.dest, load_db=args.load_db,
+                                 push=not args.no_push, fo=not args.no_fo)
+    print_summary(run.summary)
+    sys.exit(0 if ok else 1)